@@ -6,7 +6,6 @@ calc_fs(){
     cp -rf ../../$1GPa/dir-model .    
     cp ../0GPa/input.toml .
     hwave input.toml
-    python3 ../calc_fs_2d.py --p $1
     cd ..
     }
 
@@ -25,5 +24,5 @@ calc_fs 6.945
 calc_fs 7.49
 calc_fs 8.05
 
-
-
+# 全圧力のフェルミ面を1つのプロセスでまとめて処理する
+python3 calc_fs_2d.py *GPa
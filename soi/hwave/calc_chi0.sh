@@ -25,5 +25,7 @@ calc_chi0 6.13
 calc_chi0 7.51
 calc_chi0 8.19
 
-
-
+# CHI0_IR=1 sh calc_chi0.sh とすると chi0q.npz を少数の松原振動数の展開係数に圧縮する
+if [ -n "$CHI0_IR" ]; then
+    python3 ../../tools/hwave/compress_chi0q.py --remove_original
+fi
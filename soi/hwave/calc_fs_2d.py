@@ -1,11 +1,34 @@
 """2次元フェルミ面を計算・プロットする
 
 このスクリプトは、バンド計算の結果から2次元フェルミ面を計算し、可視化します。
+複数のフォルダを指定すると、モジュールの読み込みや補間に使う波数の格子、描画用のプロセスを
+一度だけ用意して各フォルダを順に処理し、フォルダごとの処理時間を表示します。
+他のスクリプトからは fermi_surface_2d 関数として呼び出せます。
 
 Parameters
 ----------
+dirs : str, optional
+    処理するフォルダ(複数指定可)。デフォルトはカレントディレクトリ
 --input : str, optional
-    入力ファイルのパス。デフォルトは "input.toml"
+    各フォルダ内の入力ファイル名。デフォルトは "input.toml"
+--dtype : str, optional
+    固有値・補間に使う浮動小数点の型 ("float64" または "float32")。デフォルトは "float64"
+    float32 の場合は、float64 で求めたフェルミエネルギーと kz=0 のエネルギーとの差を表示する
+--p : str, optional
+    圧力のラベル。指定するとまとめたPDFのファイル名 FermiSurface_{p}GPa.pdf に使う
+    省略時は {p}GPa という名前のフォルダから読み取る。フォルダが1つのときだけ指定できる
+--nproc : int, optional
+    フェルミ面を描くプロセス数。デフォルトはCPUコア数
+--rasterized : flag, optional
+    指定するとフェルミ面の塗りつぶしをラスタ画像としてPDFに埋め込む
+--multipanel : flag, optional
+    指定すると全軌道のフェルミ面を1つのPDFにまとめて出力する
+--watch : str, optional
+    キューのフォルダ。指定するとフォルダに置かれたファイル(1行に1つ処理するフォルダを記載)を
+    監視して順に処理し、処理したファイルは {watch}/done に移す。STOP というファイルで終了する
+    処理に失敗したフォルダがあればエラーを表示して残りを続け、そのファイルは {watch}/failed に移す
+--poll : float, optional
+    キューを確認する間隔(秒)。デフォルトは 1.0
 
 Returns
 -------
@@ -35,7 +58,7 @@ eigenvalues.npz : バンド計算の固有値データ
     wavevector_index : ndarray
         波数点のインデックス
 
-出力ファイル
+出力ファイル(各フォルダに出力)
 ----------
 energy.dat : kz=0でのエネルギー値
     各行に kx ky E_1 E_2 ... E_n の形式でエネルギー値を出力
@@ -46,80 +69,137 @@ FermiSurface_mod_orb{orbital}.pdf : 各軌道のフェルミ面プロット
     orbital : 軌道のインデックス
     フェルミ面を白黒で表示(フェルミ面の内側が白、外側が黒)
 
+FermiSurface_{p}GPa.pdf : 全軌道のフェルミ面を並べたプロット (--multipanel 指定時)
+    --p を指定しない場合は FermiSurface_mod_all.pdf
+
+Examples
+--------
+>>> from calc_fs_2d import fermi_surface_2d
+>>> fermi_surface_2d("0GPa")
+
 See Also
 --------
 scipy.interpolate.RegularGridInterpolator : 2次元補間に使用
 matplotlib.pyplot.contourf : フェルミ面のプロットに使用
 """
 
-import numpy as np
-import os
-import tomli
 import argparse
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--input", type=str, default="input.toml", help="input file of hwave")
-
-args = parser.parse_args()
-file_toml = args.input
-if os.path.exists(file_toml):
-    print("Reading input file: ", file_toml)
-    with open(file_toml, "rb") as f:
-        input_dict = tomli.load(f)
-else:
-    raise ValueError("Input file does not exist")
-
-print("Reading eigenvalues")
-output_info_dict = input_dict["file"]["output"]
-data = np.load(os.path.join(output_info_dict["path_to_output"], output_info_dict["eigen"] + ".npz"))
-eigenvalues = data["eigenvalue"]
-wave_index = data["wavevector_index"]
-wavevector_unit = data["wavevector_unit"]
-#k_vec = np.dot(wave_index,wavevector_unit)
-
-data = np.load(os.path.join(output_info_dict["path_to_output"], output_info_dict["green"] + ".npz"))
-green = data["green"]
-for i in range(green.shape[2]):
-    print("N({},{})".format(i,i),green[0,0,i,0,i].real*2)
-
-
-Lx, Ly, Lz = input_dict["mode"]["param"]["CellShape"]
-n_filling = input_dict["mode"]["param"]["filling"]
-norb = eigenvalues.shape[1]
-print("Lx, Ly, Lz, norb: ", Lx, Ly, Lz, norb)
-eigenvalues = eigenvalues.reshape(Lx*Ly*Lz*norb)
-print(eigenvalues.shape)
-fermi_ene = np.sort(eigenvalues)[int(Lx*Ly*Lz*norb*n_filling)]
-eigenvalues -= fermi_ene
-eigenvalues = eigenvalues.reshape((Lx, Ly, Lz, norb))
-eig = np.zeros((Lx+1, Ly+1, Lz+1, norb))
-print("Writing Energy at kz = 0 to energy.dat")
-kx_org = np.linspace(-np.pi, np.pi, Lx+1, endpoint=True)
-ky_org = np.linspace(-np.pi, np.pi, Ly+1, endpoint=True)
-
-print(eigenvalues.shape)
-with open("energy.dat", "w") as fw:
-    for i in range(Lx+1):
-        for j in range(Ly+1):
-            fw.write("{} {} ".format(kx_org[i], ky_org[j]))
-            for orb in range(norb):
-                ene = eigenvalues[int(i+Lx/2)%Lx][int(j+Ly/2)%Ly][0%Lz][orb]
-                eig[i][j][0][orb] = ene
-                fw.write("{} ".format(ene))
-            fw.write("\n")
-
+import numpy as np
+import tomli
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 from scipy.interpolate import RegularGridInterpolator
 
-def plot(fermi, norb):
-    plt.xlabel(r"$k_x/\pi$")
-    plt.xticks(np.linspace(-np.pi, np.pi, 4, endpoint=False),np.linspace(-1.0, 1.0, 4, endpoint=False))
-    plt.yticks(np.linspace(-np.pi, np.pi, 4, endpoint=False),np.linspace(-1.0, 1.0, 4, endpoint=False))
-    plt.ylabel(r"$k_y/\pi$")
-    plt.gca().set_aspect('equal', adjustable='box') # グラフの縦横の比をそろえるコマンド   
-    plt.contourf(kx, ky, fermi>1e-3, cmap=plt.cm.binary) # 条件(ret>0)を満たす部分を白、満たさない部分を黒とする。
-    plt.savefig("FermiSurface_mod_orb{}.pdf".format(norb), format="pdf", dpi=500)
-    #plt.show()
+# k-pathの定義（band.inから取得したk-points、-1~1の範囲）
+k_path_raw = [
+    (0.0, 0.0, 0.0, 'GAMMA'),
+    (0.0, 0.0, 0.5, 'Z'),
+    (0.0, 0.5, 0.0, 'Y'),
+    (0.0, -0.5, 0.0, 'Y_2'),
+    (0.5, 0.0, 0.0, 'X'),
+    (0.5, -0.5, 0.0, 'V_2'),
+    (-0.5, 0.0, 0.5, 'U_2'),
+    (0.0, -0.5, 0.5, 'T_2'),
+    (-0.5, -0.5, 0.5, 'R_2')
+]
+
+# π倍して-π~πの範囲に変換
+k_path_points = [(2*kx*np.pi, 2*ky*np.pi, 2*kz*np.pi, label) for kx, ky, kz, label in k_path_raw]
+
+
+def plot(ax, kx, ky, fermi, rasterized=False):
+    ax.set_xlabel(r"$k_x/\pi$")
+    ax.set_xticks(np.linspace(-np.pi, np.pi, 4, endpoint=False),np.linspace(-1.0, 1.0, 4, endpoint=False))
+    ax.set_yticks(np.linspace(-np.pi, np.pi, 4, endpoint=False),np.linspace(-1.0, 1.0, 4, endpoint=False))
+    ax.set_ylabel(r"$k_y/\pi$")
+    ax.set_aspect('equal', adjustable='box') # グラフの縦横の比をそろえるコマンド   
+    ax.contourf(kx, ky, fermi>1e-3, cmap=plt.cm.binary, rasterized=rasterized) # 条件(ret>0)を満たす部分を白、満たさない部分を黒とする。
+
+@lru_cache(maxsize=None)
+def interpolation_grid(Npx, Npy, dtype):
+    """補間する波数の格子。同じ大きさの格子は一度だけ作る
+
+    Returns
+    -------
+    kx, ky : ndarray
+        [-π, π) の波数
+    points : ndarray
+        (ky, kx) の組。shape=(Npx*Npy, 2)
+    """
+    kx = np.linspace(-np.pi, np.pi, Npx, endpoint=False, dtype=dtype)
+    ky = np.linspace(-np.pi, np.pi, Npy, endpoint=False, dtype=dtype)
+    # メッシュグリッドを作成
+    kx_mesh, ky_mesh = np.meshgrid(kx, ky, indexing='ij')
+    points = np.column_stack((ky_mesh.flatten(), kx_mesh.flatten()))
+    for array in (kx, ky, points):
+        array.flags.writeable = False
+    return kx, ky, points
+
+def fermi_surface(energy_data, Npx=1000, Npy=1000, eta=1e-4):
+    """kz=0 のエネルギーを補間して (kx, ky) 上のフェルミ面の重みを計算する
+
+    Parameters
+    ----------
+    energy_data : ndarray
+        E_F基準のエネルギー。shape=(Ly+1, Lx+1)、-π~π の格子上の値
+    Npx, Npy : int
+        補間する格子の大きさ
+    eta : float
+        ローレンツ関数の幅
+
+    Returns
+    -------
+    ndarray
+        eta^2 / (E^2 + eta^2)。shape=(Npx, Npy)
+    """
+    ky_grid = np.linspace(-np.pi, np.pi, energy_data.shape[0], endpoint=True, dtype=energy_data.dtype)
+    kx_grid = np.linspace(-np.pi, np.pi, energy_data.shape[1], endpoint=True, dtype=energy_data.dtype)
+    ene_interpolate = RegularGridInterpolator((ky_grid, kx_grid), energy_data, method='cubic')
+    _, _, points = interpolation_grid(Npx, Npy, energy_data.dtype.str)
+    # 補間を実行
+    fermi_values = ene_interpolate(points).astype(energy_data.dtype, copy=False)
+    fermi = eta**2 / (fermi_values**2 + eta**2)
+    return fermi.reshape(Npx, Npy)
+
+def render_band(energy_data, output_file, Npx=1000, Npy=1000, rasterized=False):
+    """1つの軌道のフェルミ面を計算して output_file に保存する
+
+    Returns
+    -------
+    ndarray
+        フェルミ面の内側かどうか (fermi > 1e-3)。shape=(Npx, Npy)
+    """
+    fermi = fermi_surface(energy_data, Npx, Npy)
+    kx, ky, _ = interpolation_grid(Npx, Npy, energy_data.dtype.str)
+    fig, ax = plt.subplots()
+    plot(ax, kx, ky, fermi, rasterized)
+    fig.savefig(output_file, format="pdf", dpi=500)
+    plt.close(fig)
+    return fermi > 1e-3
+
+def plot_multipanel(kx, ky, masks, output_file, title=None, rasterized=False):
+    """全軌道のフェルミ面を1つのPDFに並べる"""
+    ncol = min(len(masks), 4)
+    nrow = -(-len(masks) // ncol)
+    fig, axes = plt.subplots(nrow, ncol, figsize=(3 * ncol, 3 * nrow), squeeze=False)
+    for orb, (ax, mask) in enumerate(zip(axes.ravel(), masks)):
+        plot(ax, kx, ky, mask, rasterized)
+        ax.set_title("orb {}".format(orb))
+    for ax in axes.ravel()[len(masks):]:
+        ax.set_visible(False)
+    if title is not None:
+        fig.suptitle(title)
+    fig.tight_layout()
+    fig.savefig(output_file, format="pdf", dpi=500)
+    plt.close(fig)
 
 def plot_band_dispersion_along_kpath(eigenvalues, k_path_points, norb, points_per_segment=40, output_file="band_dispersion.pdf"):
     """
@@ -138,6 +218,7 @@ def plot_band_dispersion_along_kpath(eigenvalues, k_path_points, norb, points_pe
     output_file : str
         出力ファイル名
     """
+    Lx, Ly, Lz = eigenvalues.shape[:3]
     # k座標の範囲を定義（eigenvaluesは0-2πで格納されているため、0-2πの範囲で定義）
     kx_range = np.linspace(0, 2*np.pi, Lx, endpoint=False)
     ky_range = np.linspace(0, 2*np.pi, Ly, endpoint=False)
@@ -216,84 +297,237 @@ def plot_band_dispersion_along_kpath(eigenvalues, k_path_points, norb, points_pe
         all_k_labels = orb_k_labels
     
     # プロット
-    plt.figure(figsize=(12, 8))
+    fig, ax = plt.subplots(figsize=(12, 8))
     
     # 各軌道のバンドをプロット
     colors = ['blue', 'red', 'green', 'orange', 'purple', 'brown', 'pink', 'gray']
     for orb in range(norb):
         color = colors[orb % len(colors)]
-        plt.plot(all_k_distances, band_energies[orb], color=color, linewidth=1.5, 
+        ax.plot(all_k_distances, band_energies[orb], color=color, linewidth=1.5, 
                 label=f'Orbital {orb}', alpha=0.8)
         # 点も表示
-        plt.scatter(all_k_distances, band_energies[orb], color=color, s=10, alpha=0.6)
+        ax.scatter(all_k_distances, band_energies[orb], color=color, s=10, alpha=0.6)
     
     # フェルミエネルギー線
-    plt.axhline(y=0, color='black', linestyle='--', alpha=0.5, linewidth=1, label='E_F')
+    ax.axhline(y=0, color='black', linestyle='--', alpha=0.5, linewidth=1, label='E_F')
     
     # k-pointラベルを追加（空でないラベルのみ）
     for i, (dist, label) in enumerate(zip(all_k_distances, all_k_labels)):
         if label:  # 空でないラベルのみ
-            plt.axvline(x=dist, color='gray', linestyle=':', alpha=0.3)
-            plt.text(dist, plt.ylim()[1], label, ha='center', va='bottom', 
+            ax.axvline(x=dist, color='gray', linestyle=':', alpha=0.3)
+            ax.text(dist, ax.get_ylim()[1], label, ha='center', va='bottom', 
                     rotation=45, fontsize=10, fontweight='bold')
     
-    plt.xlabel('k-path distance')
-    plt.ylabel('Energy (eV)')
-    plt.title(f'Band Dispersion along k-path ({points_per_segment} points per segment)')
-    plt.grid(True, alpha=0.3)
-    plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+    ax.set_xlabel('k-path distance')
+    ax.set_ylabel('Energy (eV)')
+    ax.set_title(f'Band Dispersion along k-path ({points_per_segment} points per segment)')
+    ax.grid(True, alpha=0.3)
+    ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
     
     # 軸の範囲を調整
-    plt.xlim(0, all_k_distances[-1])
+    ax.set_xlim(0, all_k_distances[-1])
     
-    plt.tight_layout()
-    plt.savefig(output_file, dpi=300, bbox_inches='tight')
-    plt.show()
+    fig.tight_layout()
+    fig.savefig(output_file, dpi=300, bbox_inches='tight')
+    plt.close(fig)
     
     print(f"バンド分散プロットを保存しました: {output_file}")
     print(f"総k-point数: {len(all_k_distances)}")
     print(f"セグメント数: {len(k_path_points) - 1}")
     print(f"セグメントあたりの点数: {points_per_segment}")
 
-# k-pathの定義（band.inから取得したk-points、-1~1の範囲）
-k_path_raw = [
-    (0.0, 0.0, 0.0, 'GAMMA'),
-    (0.0, 0.0, 0.5, 'Z'),
-    (0.0, 0.5, 0.0, 'Y'),
-    (0.0, -0.5, 0.0, 'Y_2'),
-    (0.5, 0.0, 0.0, 'X'),
-    (0.5, -0.5, 0.0, 'V_2'),
-    (-0.5, 0.0, 0.5, 'U_2'),
-    (0.0, -0.5, 0.5, 'T_2'),
-    (-0.5, -0.5, 0.5, 'R_2')
-]
+def read_input(file_toml):
+    if os.path.exists(file_toml):
+        print("Reading input file: ", file_toml)
+        with open(file_toml, "rb") as f:
+            return tomli.load(f)
+    else:
+        raise ValueError("Input file does not exist")
 
-# π倍して-π~πの範囲に変換
-k_path_points = [(2*kx*np.pi, 2*ky*np.pi, 2*kz*np.pi, label) for kx, ky, kz, label in k_path_raw]
+def pressure_label(path):
+    """{p}GPa という名前のフォルダから圧力のラベルを取り出す(それ以外はNone)"""
+    name = os.path.basename(os.path.normpath(os.path.abspath(path)))
+    return name[:-len("GPa")] if name.endswith("GPa") else None
 
-# バンド分散プロットを実行
-print("k-pathに沿ったバンド分散をプロット中...")
-plot_band_dispersion_along_kpath(eigenvalues, k_path_points, norb, points_per_segment=50)
-
-#for i in range(norb):
-Npx = 1000
-Npy = 1000
-for i in range(norb):
-    eta = 1e-4
-    # RegularGridInterpolatorを使用して2次元補間を実行
-    energy_data = np.transpose(eig, (1, 0, 2, 3))[:,:,0, i]
-    ene_interpolate = RegularGridInterpolator((ky_org, kx_org), energy_data, method='cubic')
-    
-    kx = np.linspace(-np.pi, np.pi, Npx, endpoint=False)
-    ky = np.linspace(-np.pi, np.pi, Npy, endpoint=False)
-    
-    # メッシュグリッドを作成
-    kx_mesh, ky_mesh = np.meshgrid(kx, ky, indexing='ij')
-    points = np.column_stack((ky_mesh.flatten(), kx_mesh.flatten()))
-    
-    # 補間を実行
-    fermi_values = ene_interpolate(points)
-    fermi = eta**2 / (fermi_values**2 + eta**2)
-    fermi = fermi.reshape(Npx, Npy)
-    
-    plot(fermi, i)
+def fermi_surface_2d(path=".", input_file="input.toml", dtype="float64", label=None,
+                     rasterized=False, multipanel=False, executor=None, Npx=1000, Npy=1000):
+    """1つのフォルダの計算結果から energy.dat, バンド分散, フェルミ面のPDFを作る
+
+    Parameters
+    ----------
+    path : str
+        H-waveを実行したフォルダ
+    input_file : str
+        フォルダ内の入力ファイル名
+    dtype : str
+        固有値・補間に使う浮動小数点の型
+    label : str, optional
+        圧力のラベル。省略時はフォルダ名から読み取る
+    rasterized : bool
+        フェルミ面の塗りつぶしをラスタ画像にする
+    multipanel : bool
+        全軌道のフェルミ面を1つのPDFにまとめる
+    executor : concurrent.futures.Executor, optional
+        フェルミ面を描くプロセスプール。省略時はこの呼び出しの中で作る
+    Npx, Npy : int
+        フェルミ面を補間する格子の大きさ
+
+    Returns
+    -------
+    float
+        フェルミエネルギー
+    """
+    dtype = np.dtype(dtype)
+    input_dict = read_input(os.path.join(path, input_file))
+
+    print("Reading eigenvalues")
+    output_info_dict = input_dict["file"]["output"]
+    path_to_output = os.path.join(path, output_info_dict["path_to_output"])
+    data_eigen = np.load(os.path.join(path_to_output, output_info_dict["eigen"] + ".npz"))
+    eigenvalues = data_eigen["eigenvalue"].astype(dtype, copy=False)
+    wave_index = data_eigen["wavevector_index"]
+    wavevector_unit = data_eigen["wavevector_unit"]
+    #k_vec = np.dot(wave_index,wavevector_unit)
+
+    data = np.load(os.path.join(path_to_output, output_info_dict["green"] + ".npz"))
+    green = data["green"]
+    for i in range(green.shape[2]):
+        print("N({},{})".format(i,i),green[0,0,i,0,i].real*2)
+
+    Lx, Ly, Lz = input_dict["mode"]["param"]["CellShape"]
+    n_filling = input_dict["mode"]["param"]["filling"]
+    norb = eigenvalues.shape[1]
+    print("Lx, Ly, Lz, norb: ", Lx, Ly, Lz, norb)
+    eigenvalues = eigenvalues.reshape(Lx*Ly*Lz*norb)
+    print(eigenvalues.shape)
+    n_fermi = int(Lx*Ly*Lz*norb*n_filling)
+    fermi_ene = np.partition(eigenvalues, n_fermi)[n_fermi]
+    eigenvalues -= fermi_ene
+    eigenvalues = eigenvalues.reshape((Lx, Ly, Lz, norb))
+    # kz=0 の面だけを -π~π の順に並べ替える (i -> int(i+Lx/2)%Lx)
+    ix = (np.arange(Lx+1) + Lx//2) % Lx
+    iy = (np.arange(Ly+1) + Ly//2) % Ly
+    eig = eigenvalues[ix[:, None], iy[None, :], 0, :]
+    if dtype != np.float64:
+        # float64 で求めた値との差を確認する
+        eigenvalues_64 = data_eigen["eigenvalue"].reshape(Lx*Ly*Lz*norb)
+        fermi_ene_64 = np.partition(eigenvalues_64, n_fermi)[n_fermi]
+        eig_64 = eigenvalues_64.reshape((Lx, Ly, Lz, norb))[ix[:, None], iy[None, :], 0, :] - fermi_ene_64
+        print("Accuracy check ({} vs float64): |dE_F| = {:.3e}, max |dE(kz=0)| = {:.3e}".format(
+            dtype, abs(float(fermi_ene) - fermi_ene_64), np.abs(eig - eig_64).max()))
+        del eigenvalues_64, eig_64
+    print("Writing Energy at kz = 0 to energy.dat")
+    kx_org = np.linspace(-np.pi, np.pi, Lx+1, endpoint=True)
+    ky_org = np.linspace(-np.pi, np.pi, Ly+1, endpoint=True)
+
+    print(eigenvalues.shape)
+    with open(os.path.join(path, "energy.dat"), "w") as fw:
+        for i in range(Lx+1):
+            for j in range(Ly+1):
+                fw.write("{} {} ".format(kx_org[i], ky_org[j]))
+                for orb in range(norb):
+                    fw.write("{} ".format(eig[i][j][orb]))
+                fw.write("\n")
+
+    # バンド分散プロットを実行
+    print("k-pathに沿ったバンド分散をプロット中...")
+    plot_band_dispersion_along_kpath(eigenvalues, k_path_points, norb, points_per_segment=50,
+                                     output_file=os.path.join(path, "band_dispersion.pdf"))
+
+    # 軌道ごとのフェルミ面を別々のプロセスで計算・保存する
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(mp_context=multiprocessing.get_context("fork"))
+    try:
+        futures = [executor.submit(render_band, np.ascontiguousarray(eig[:, :, i].T),
+                                   os.path.join(path, "FermiSurface_mod_orb{}.pdf".format(i)), Npx, Npy, rasterized)
+                   for i in range(norb)]
+        masks = [future.result() for future in futures]
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    if multipanel:
+        kx, ky, _ = interpolation_grid(Npx, Npy, dtype.str)
+        label = label if label is not None else pressure_label(path)
+        if label is not None:
+            plot_multipanel(kx, ky, masks, os.path.join(path, "FermiSurface_{}GPa.pdf".format(label)),
+                            "{} GPa".format(label), rasterized)
+        else:
+            plot_multipanel(kx, ky, masks, os.path.join(path, "FermiSurface_mod_all.pdf"), rasterized=rasterized)
+    return fermi_ene
+
+def watch_queue(queue_dir, process, poll=1.0):
+    """キューのフォルダに置かれたファイルに書かれたフォルダを順に処理する
+
+    あるフォルダの処理で例外が起きても監視は続け、そのファイルは done ではなく failed に移す。
+
+    Parameters
+    ----------
+    queue_dir : str
+        キューのフォルダ。STOP というファイルが置かれると終了する
+    process : callable
+        フォルダのパスを受け取って処理する関数
+    poll : float
+        キューを確認する間隔(秒)
+    """
+    done_dir = os.path.join(queue_dir, "done")
+    failed_dir = os.path.join(queue_dir, "failed")
+    os.makedirs(done_dir, exist_ok=True)
+    os.makedirs(failed_dir, exist_ok=True)
+    while True:
+        entries = sorted(name for name in os.listdir(queue_dir)
+                         if os.path.isfile(os.path.join(queue_dir, name)))
+        jobs = [name for name in entries if name != "STOP"]
+        for name in jobs:
+            file_name = os.path.join(queue_dir, name)
+            with open(file_name, "r") as fr:
+                dirs = [line.strip() for line in fr if line.strip()]
+            failed = False
+            for path in dirs:
+                try:
+                    process(path)
+                except Exception as e:
+                    print("{}: failed ({}: {})".format(path, type(e).__name__, e))
+                    failed = True
+            shutil.move(file_name, os.path.join(failed_dir if failed else done_dir, name))
+        if not jobs:
+            if "STOP" in entries:
+                os.remove(os.path.join(queue_dir, "STOP"))
+                return
+            time.sleep(poll)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dirs", type=str, nargs="*", default=["."], help="folders to process")
+    parser.add_argument("--input", type=str, default="input.toml", help="input file of hwave")
+    parser.add_argument("--dtype", type=str, default="float64", choices=["float64", "float32"], help="floating-point type of eigenvalues")
+    parser.add_argument("--p", type=str, default=None, help="pressure label used in the name of the multi-panel PDF")
+    parser.add_argument("--nproc", type=int, default=None, help="number of processes to render Fermi surfaces")
+    parser.add_argument("--rasterized", action="store_true", help="rasterize filled contours in PDF")
+    parser.add_argument("--multipanel", action="store_true", help="write all Fermi surfaces into one PDF")
+    parser.add_argument("--watch", type=str, default=None, help="queue folder to watch")
+    parser.add_argument("--poll", type=float, default=1.0, help="polling interval of the queue in seconds")
+    args = parser.parse_args()
+    if args.p is not None and (len(args.dirs) > 1 or args.watch is not None):
+        parser.error("--p can be used only with a single folder")
+
+    latency = []
+
+    def process(path):
+        start = time.perf_counter()
+        fermi_surface_2d(path, args.input, args.dtype, args.p, args.rasterized, args.multipanel, executor)
+        elapsed = time.perf_counter() - start
+        latency.append((path, elapsed))
+        print("{}: {:.2f} s".format(path, elapsed))
+
+    with ProcessPoolExecutor(max_workers=args.nproc, mp_context=multiprocessing.get_context("fork")) as executor:
+        if args.watch is not None:
+            watch_queue(args.watch, process, args.poll)
+        else:
+            for path in args.dirs:
+                process(path)
+    if len(latency) > 1:
+        print("Processed {} folders in {:.2f} s".format(len(latency), sum(t for _, t in latency)))
+        for path, elapsed in latency:
+            print("  {:<20s} {:8.2f} s".format(path, elapsed))
@@ -1,45 +1,264 @@
+"""計算結果をデータリポジトリ用のフォルダに整理してコピーする
+
+このスクリプトは、各計算フォルダの *.in, *.out, *.band.gnu をqeフォルダに、
+respack.in, calc_wan.out, dir-intW, dir-model をrespackフォルダにコピーします。
+ファイルの内容ハッシュをmanifest.jsonに記録し、新規または変更されたファイルのみを
+スレッドプールで並列にコピーします。--hardlink を指定すると、内容が同一のファイルは
+コピーせずにハードリンクを作成します。
+
+Parameters
+----------
+dirs : str, optional
+    整理する計算フォルダ。省略時はカレントディレクトリ内の *GPa フォルダ、
+    それもなければカレントディレクトリ
+--dest : str, optional
+    コピー先のルートフォルダ。省略時は各計算フォルダ内の organized_data
+--hardlink : flag, optional
+    指定すると内容が同一のファイルをハードリンクで共有する
+--nproc : int, optional
+    並列スレッド数。デフォルトはCPU数
+
+Returns
+-------
+なし
+
+Notes
+-----
+入力ファイル
+-----------
+{dir}/*.in, {dir}/*.out, {dir}/*.band.gnu : QEの入出力ファイル
+{dir}/respack.in, {dir}/calc_wan.out : RESPACKの入出力ファイル
+{dir}/dir-intW, {dir}/dir-model : RESPACKの出力フォルダ
+
+出力ファイル
+-----------
+{dest}/qe : QEの入出力ファイル
+{dest}/respack : RESPACKの入出力ファイルと出力フォルダ
+{dest}/manifest.json : コピーしたファイルの内容ハッシュの一覧
+    次回以降の実行で変更のないファイルのコピーを省略するために使う
+    ハードリンクで共有したファイルは一方を編集すると他方も変わるので注意
+"""
+
+import argparse
+import glob
+import hashlib
+import json
 import os
 import shutil
-import glob
+from concurrent.futures import ThreadPoolExecutor
+
+# respackフォルダにのみコピーするファイル
+RESPACK_FILES = ['respack.in', 'calc_wan.out']
+RESPACK_DIRS = ['dir-intW', 'dir-model']
+MANIFEST = 'manifest.json'
+
+
+def collect_files(src_dir, dest_folder):
+    """コピー元とコピー先のファイルの組を列挙する
+
+    Parameters
+    ----------
+    src_dir : str
+        計算フォルダのパス
+    dest_folder : str
+        コピー先フォルダのパス
+
+    Returns
+    -------
+    list of tuple
+        (コピー元のパス, コピー先のパス) のリスト
+    """
+    pairs = []
+    qe_folder = os.path.join(dest_folder, 'qe')
+    respack_folder = os.path.join(dest_folder, 'respack')
+    # *.in, *.out, *.band.gnuファイルをqeディレクトリに(RESPACKのファイルは除く)
+    for pattern in ['*.in', '*.out', '*.band.gnu']:
+        for file in sorted(glob.glob(os.path.join(src_dir, pattern))):
+            file_name = os.path.basename(file)
+            if file_name in RESPACK_FILES or not os.path.isfile(file):
+                continue
+            pairs.append((file, os.path.join(qe_folder, file_name)))
+    # respack.inとcalc_wan.outファイルをrespackディレクトリに
+    for file_name in RESPACK_FILES:
+        file = os.path.join(src_dir, file_name)
+        if os.path.isfile(file):
+            pairs.append((file, os.path.join(respack_folder, file_name)))
+    # dir-intWとdir-modelディレクトリをrespackディレクトリに
+    for dir_name in RESPACK_DIRS:
+        src_dir_path = os.path.join(src_dir, dir_name)
+        for root, _, files in os.walk(src_dir_path):
+            rel_root = os.path.relpath(root, src_dir)
+            for file_name in sorted(files):
+                pairs.append((os.path.join(root, file_name),
+                              os.path.join(respack_folder, rel_root, file_name)))
+    return pairs
+
+
+def file_hash(file_name, block_size=1 << 20):
+    """ファイルの内容のハッシュ値(SHA-256)を計算する
+
+    Parameters
+    ----------
+    file_name : str
+        ファイルのパス
+    block_size : int
+        一度に読み込むバイト数
+
+    Returns
+    -------
+    str
+        ハッシュ値の16進数表記
+    """
+    h = hashlib.sha256()
+    with open(file_name, 'rb') as fr:
+        for block in iter(lambda: fr.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_manifest(dest_folder):
+    """コピー先フォルダのmanifest.jsonを読み込む
+
+    Parameters
+    ----------
+    dest_folder : str
+        コピー先フォルダのパス
+
+    Returns
+    -------
+    dict
+        コピー先からの相対パスをキーとし、hash, size, mtime を値とする辞書
+    """
+    file_name = os.path.join(dest_folder, MANIFEST)
+    if not os.path.isfile(file_name):
+        return {}
+    with open(file_name, 'r') as fr:
+        return json.load(fr)
+
+
+def source_entry(src, old_entry):
+    """コピー元のファイルの manifest エントリを作成する
+
+    サイズと更新時刻が前回と同じ場合はハッシュ値を再計算しない。
+
+    Parameters
+    ----------
+    src : str
+        コピー元のパス
+    old_entry : dict or None
+        前回の manifest エントリ
+
+    Returns
+    -------
+    dict
+        hash, size, mtime
+    """
+    stat = os.stat(src)
+    if old_entry is not None and old_entry['size'] == stat.st_size and old_entry['mtime'] == stat.st_mtime:
+        return dict(old_entry)
+    return {'hash': file_hash(src), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def copy_file(src, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.lexists(dst):
+        # ハードリンク先を書き換えないように、既存のファイルは消してからコピーする
+        os.remove(dst)
+    shutil.copy2(src, dst)
+
+
+def link_file(target, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.lexists(dst):
+        os.remove(dst)
+    os.link(target, dst)
+
+
+def sync(jobs, hardlink=False, nproc=None):
+    """複数の計算フォルダをまとめて同期する
 
-# カレントディレクトリを対象とする
-current_dir = os.getcwd()
-destination_path = './'  # コピー先のパスを設定してください
+    Parameters
+    ----------
+    jobs : list of tuple
+        (計算フォルダ, コピー先フォルダ) のリスト
+    hardlink : bool
+        Trueの場合、内容が同一のファイルをハードリンクで共有する
+    nproc : int or None
+        並列スレッド数
 
-# カレントディレクトリ内のファイルを処理
-dest_folder = os.path.join(destination_path, 'organized_data')
+    Returns
+    -------
+    dict
+        copied, linked, skipped の件数
+    """
+    tasks = []
+    manifests = {}
+    for src_dir, dest_folder in jobs:
+        manifests[dest_folder] = load_manifest(dest_folder)
+        for src, dst in collect_files(src_dir, dest_folder):
+            tasks.append((src, dst, dest_folder, os.path.relpath(dst, dest_folder)))
 
-# コピー先にフォルダを作成
-os.makedirs(dest_folder, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=nproc) as executor:
+        # コピー元のハッシュ値を並列に計算
+        entries = list(executor.map(
+            lambda t: source_entry(t[0], manifests[t[2]].get(t[3])), tasks))
 
-# qeディレクトリを新規作成
-qe_folder = os.path.join(dest_folder, 'qe')
-os.makedirs(qe_folder, exist_ok=True)
+        # 既にコピー先にあり、今回書き換えられない内容(ハッシュ値 -> パス)
+        new_hash = {(t[2], t[3]): entry['hash'] for t, entry in zip(tasks, entries)}
+        known = {}
+        for dest_folder, manifest in manifests.items():
+            for rel, entry in manifest.items():
+                path = os.path.join(dest_folder, rel)
+                if new_hash.get((dest_folder, rel), entry['hash']) == entry['hash'] and os.path.isfile(path):
+                    known.setdefault(entry['hash'], path)
 
-# *.in, *.out, *.band.gnuファイルをqeディレクトリにコピー
-for file in glob.glob(os.path.join(current_dir, '*.in')) + glob.glob(os.path.join(current_dir, '*.out')) + glob.glob(os.path.join(current_dir, '*.band.gnu')):
-    shutil.copy(file, qe_folder)
+        copies = []
+        links = []
+        count = {'copied': 0, 'linked': 0, 'skipped': 0}
+        new_manifests = {dest_folder: {} for dest_folder in manifests}
+        for (src, dst, dest_folder, rel), entry in zip(tasks, entries):
+            new_manifests[dest_folder][rel] = entry
+            old_entry = manifests[dest_folder].get(rel)
+            if old_entry is not None and old_entry['hash'] == entry['hash'] and os.path.isfile(dst):
+                count['skipped'] += 1
+                continue
+            target = known.get(entry['hash'])
+            if hardlink and target is not None and target != dst:
+                links.append((target, dst))
+                count['linked'] += 1
+            else:
+                copies.append((src, dst))
+                known.setdefault(entry['hash'], dst)
+                count['copied'] += 1
 
-for file_name in ['respack.in', 'calc_wan.out']:
-    file_path = os.path.join(qe_folder, file_name)
-    if os.path.isfile(file_path):
-        os.remove(file_path)
-        print(f"Deleted: {file_path}")
+        # コピーを先に済ませてからハードリンクを作成する
+        list(executor.map(lambda p: copy_file(*p), copies))
+        list(executor.map(lambda p: link_file(*p), links))
 
-# respackディレクトリを新規作成
-respack_folder = os.path.join(dest_folder, 'respack')
-os.makedirs(respack_folder, exist_ok=True)
+    for dest_folder, manifest in new_manifests.items():
+        os.makedirs(dest_folder, exist_ok=True)
+        with open(os.path.join(dest_folder, MANIFEST), 'w') as fw:
+            json.dump(manifest, fw, indent=1, sort_keys=True)
+    return count
 
-# respack.inとcalc_wan.outファイルをrespackディレクトリにのみコピー（存在する場合）
-for file_name in ['respack.in', 'calc_wan.out']:
-    src_file_path = os.path.join(current_dir, file_name)
-    if os.path.isfile(src_file_path):
-        shutil.copy(src_file_path, respack_folder)
 
-# dir-intWとdir-modelディレクトリをrespackディレクトリにコピー
-for dir_name in ['dir-intW', 'dir-model']:
-    src_dir_path = os.path.join(current_dir, dir_name)
-    if os.path.isdir(src_dir_path):
-        shutil.copytree(src_dir_path, os.path.join(respack_folder, dir_name), dirs_exist_ok=True)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dirs", type=str, nargs="*", help="calculation folders (default: ./*GPa or ./)")
+    parser.add_argument("--dest", type=str, default=None, help="destination root folder")
+    parser.add_argument("--hardlink", action="store_true", help="hardlink files with identical contents")
+    parser.add_argument("--nproc", type=int, default=None, help="number of threads")
+    args = parser.parse_args()
 
-                
+    dirs = args.dirs
+    if not dirs:
+        dirs = sorted(d for d in glob.glob('*GPa') if os.path.isdir(d)) or ['./']
+    jobs = []
+    for src_dir in dirs:
+        if args.dest is None:
+            dest_folder = os.path.join(src_dir, 'organized_data')
+        else:
+            dest_folder = os.path.join(args.dest, os.path.basename(os.path.abspath(src_dir)))
+        jobs.append((src_dir, dest_folder))
+    count = sync(jobs, hardlink=args.hardlink, nproc=args.nproc)
+    print("copied: {copied}, linked: {linked}, skipped: {skipped}".format(**count))
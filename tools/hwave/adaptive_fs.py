@@ -0,0 +1,239 @@
+"""フェルミ準位の近くだけ波数メッシュを細かくして2次元フェルミ面を求める
+
+calc_fs_2d.py は 1000x1000 の一様メッシュ上でエネルギーを補間しますが、
+その大部分はフェルミ準位から遠い点です。このスクリプトは、H-waveの kz=0 の固有値格子から
+始めて四分木で格子を細分化し、いずれかのバンドが頂点間で符号を変えるか、
+E_F から tol 以内に入るセルだけを分割します。新しい頂点のエネルギーは周期的な
+3次スプライン補間で求め、最終的なセルの辺上でフェルミ面との交点を線形補間で求めます。
+最も細かいセルの大きさは一様メッシュ (Lx*2^levels) x (Ly*2^levels) と同じです。
+
+Parameters
+----------
+--input : str, optional
+    入力ファイルのパス。デフォルトは "input.toml"
+--levels : int, optional
+    細分化の回数。デフォルトは 3 (128x128 格子から 1024x1024 相当)
+--tol : float, optional
+    細分化するセルを決めるエネルギーの幅(eV)。デフォルトは 0.02
+
+Returns
+-------
+なし
+
+Notes
+-----
+入力ファイル
+----------
+input.toml : H-waveの入力ファイル
+    mode.param.CellShape, mode.param.filling, file.output.eigen を使用
+
+出力ファイル
+----------
+fermi_points_adaptive.dat : フェルミ面上の点
+    各行に kx ky band の形式で出力。kx, ky は [-π, π) の範囲
+
+FermiSurface_adaptive.pdf : フェルミ面のプロット
+    バンドごとに色を変えて表示
+
+See Also
+--------
+calc_fs_2d.py : 一様メッシュで2次元フェルミ面を計算・プロットする
+"""
+
+import argparse
+
+import numpy as np
+from scipy import ndimage
+
+from hwave_io import read_input, load_eigen, fermi_energy
+
+# セルの4頂点 (0,0), (1,0), (0,1), (1,1) と、交点を調べる辺
+CELL_CORNERS = np.array([[0, 0], [1, 0], [0, 1], [1, 1]])
+CELL_EDGES = [(0, 1), (0, 2), (1, 3), (2, 3)]
+
+
+def spline_evaluator(energy):
+    """kz=0 の固有値格子から周期的な3次スプライン補間の関数を作る
+
+    Parameters
+    ----------
+    energy : ndarray
+        固有値。shape=(Lx, Ly, nband)
+
+    Returns
+    -------
+    callable
+        分数座標 x, y (shape=(n,)) を受け取り、エネルギー (shape=(n, nband)) を返す関数
+    """
+    Lx, Ly, nband = energy.shape
+    # 周期境界条件 (grid-wrap) の3次B-スプラインの係数を一度だけ求める
+    coefficients = [ndimage.spline_filter(energy[:, :, n], order=3, mode="grid-wrap") for n in range(nband)]
+
+    def evaluate(x, y):
+        coords = np.vstack(((np.asarray(x) % 1.0) * Lx, (np.asarray(y) % 1.0) * Ly))
+        return np.column_stack([ndimage.map_coordinates(c, coords, order=3, mode="grid-wrap", prefilter=False)
+                                for c in coefficients])
+    return evaluate
+
+
+class EnergyCache:
+    """最も細かい格子上の整数座標をキーとして、評価済みのエネルギーを保持する
+
+    Parameters
+    ----------
+    evaluate : callable
+        分数座標からエネルギーを求める関数
+    Nx, Ny : int
+        最も細かい格子の大きさ
+    """
+
+    def __init__(self, evaluate, Nx, Ny):
+        self.evaluate = evaluate
+        self.Nx, self.Ny = Nx, Ny
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.values = None
+        self.n_eval = 0
+
+    def key(self, ix, iy):
+        return (ix % self.Nx) * self.Ny + iy % self.Ny
+
+    def seed(self, keys, values):
+        """評価せずに既知の値(H-waveの格子点の固有値)を登録する"""
+        order = np.argsort(keys)
+        self.keys = keys[order]
+        self.values = values[order]
+
+    def __call__(self, keys):
+        """キーに対応するエネルギーを返す。未評価の点だけを評価する"""
+        unique = np.unique(keys)
+        missing = np.setdiff1d(unique, self.keys, assume_unique=True)
+        if missing.size > 0:
+            values = self.evaluate((missing // self.Ny) / self.Nx, (missing % self.Ny) / self.Ny)
+            self.n_eval += missing.size
+            keys_all = np.concatenate((self.keys, missing))
+            values_all = values if self.values is None else np.concatenate((self.values, values))
+            order = np.argsort(keys_all)
+            self.keys, self.values = keys_all[order], values_all[order]
+        return self.values[np.searchsorted(self.keys, keys)]
+
+
+def refine(energy, levels, tol, evaluate=None):
+    """四分木でフェルミ面の近くのセルだけを細分化する
+
+    Parameters
+    ----------
+    energy : ndarray
+        E_F基準の kz=0 の固有値。shape=(Lx, Ly, nband)
+    levels : int
+        細分化の回数
+    tol : float
+        セルの頂点のエネルギーの範囲を [min-tol, max+tol] に広げ、0を含むセルを細分化する
+    evaluate : callable, optional
+        分数座標からエネルギーを求める関数。省略時は spline_evaluator(energy)
+
+    Returns
+    -------
+    cells : ndarray
+        最も細かいセルの左下の整数座標。shape=(ncell, 2)
+    corner_energy : ndarray
+        各セルの4頂点のエネルギー。shape=(ncell, 4, nband)
+    cache : EnergyCache
+        評価回数 (cache.n_eval) などを保持する
+    """
+    Lx, Ly, nband = energy.shape
+    scale = 2 ** levels
+    cache = EnergyCache(evaluate if evaluate is not None else spline_evaluator(energy),
+                        Lx * scale, Ly * scale)
+    ix, iy = np.meshgrid(np.arange(Lx) * scale, np.arange(Ly) * scale, indexing="ij")
+    cells = np.column_stack((ix.ravel(), iy.ravel()))
+    # 初期格子はH-waveの固有値そのものを使う
+    cache.seed(cache.key(cells[:, 0], cells[:, 1]), energy.reshape(-1, nband))
+    size = scale
+    while True:
+        corners = cells[:, None, :] + size * CELL_CORNERS[None, :, :]
+        corner_energy = cache(cache.key(corners[..., 0], corners[..., 1]))
+        hit = (corner_energy.min(axis=1) - tol <= 0.0) & (corner_energy.max(axis=1) + tol >= 0.0)
+        keep = hit.any(axis=1)
+        cells, corner_energy = cells[keep], corner_energy[keep]
+        if size == 1:
+            return cells, corner_energy, cache
+        size //= 2
+        cells = (cells[:, None, :] + size * CELL_CORNERS[None, :, :]).reshape(-1, 2)
+
+
+def contour_points(cells, corner_energy):
+    """最も細かいセルの辺上でフェルミ面との交点を求める
+
+    Parameters
+    ----------
+    cells : ndarray
+        セルの左下の整数座標。shape=(ncell, 2)
+    corner_energy : ndarray
+        各セルの4頂点のエネルギー。shape=(ncell, 4, nband)
+
+    Returns
+    -------
+    points : ndarray
+        交点の整数座標系での位置。shape=(npoint, 2)
+    bands : ndarray
+        交点のバンドの添字。shape=(npoint,)
+    """
+    points = []
+    bands = []
+    edge_keys = []
+    for a, b in CELL_EDGES:
+        ea, eb = corner_energy[:, a, :], corner_energy[:, b, :]
+        icell, iband = np.nonzero(ea * eb < 0.0)
+        t = ea[icell, iband] / (ea[icell, iband] - eb[icell, iband])
+        pa = cells[icell] + CELL_CORNERS[a]
+        direction = CELL_CORNERS[b] - CELL_CORNERS[a]
+        points.append(pa + t[:, None] * direction)
+        bands.append(iband)
+        edge_keys.append(np.column_stack((pa, np.full(len(pa), direction[1]), iband)))
+    # 隣り合うセルが共有する辺の交点は一度だけ数える
+    _, first = np.unique(np.concatenate(edge_keys), axis=0, return_index=True)
+    return np.concatenate(points)[first], np.concatenate(bands)[first]
+
+
+def plot(kx, ky, bands, output_file="FermiSurface_adaptive.pdf"):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+    ax.scatter(kx, ky, c=bands, s=0.1, cmap="tab10", rasterized=True)
+    ax.set_xlim(-np.pi, np.pi)
+    ax.set_ylim(-np.pi, np.pi)
+    ax.set_xlabel(r"$k_x/\pi$")
+    ax.set_ylabel(r"$k_y/\pi$")
+    ticks = np.linspace(-np.pi, np.pi, 4, endpoint=False)
+    ax.set_xticks(ticks, np.linspace(-1.0, 1.0, 4, endpoint=False))
+    ax.set_yticks(ticks, np.linspace(-1.0, 1.0, 4, endpoint=False))
+    ax.set_aspect("equal", adjustable="box")
+    fig.savefig(output_file, format="pdf", dpi=500)
+    plt.close(fig)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, default="input.toml", help="input file of hwave")
+    parser.add_argument("--levels", type=int, default=3, help="number of refinement levels")
+    parser.add_argument("--tol", type=float, default=0.02, help="energy tolerance around E_F in eV")
+    args = parser.parse_args()
+
+    input_dict = read_input(args.input)
+    eigenvalues, _ = load_eigen(input_dict)
+    ene_f = fermi_energy(eigenvalues, input_dict["mode"]["param"]["filling"])
+    energy = eigenvalues[:, :, 0, :] - ene_f
+    Lx, Ly, nband = energy.shape
+
+    cells, corner_energy, cache = refine(energy, args.levels, args.tol)
+    points, bands = contour_points(cells, corner_energy)
+    Nx, Ny = cache.Nx, cache.Ny
+    kx = ((points[:, 0] / Nx + 0.5) % 1.0 - 0.5) * 2 * np.pi
+    ky = ((points[:, 1] / Ny + 0.5) % 1.0 - 0.5) * 2 * np.pi
+    print("Finest mesh: {} x {}".format(Nx, Ny))
+    print("Evaluations: {} (uniform mesh: {}, ratio: {:.2e})".format(
+        cache.n_eval, Nx * Ny, cache.n_eval / (Nx * Ny)))
+    print("Fermi-surface points: {}".format(len(points)))
+    np.savetxt("fermi_points_adaptive.dat", np.column_stack((kx, ky, bands)), header="kx ky band")
+    plot(kx, ky, bands)
@@ -0,0 +1,223 @@
+"""χ0(q, iν) を少数の松原振動数での展開係数に圧縮する
+
+input_chi.toml の Nmat = 1024 では chi0q.npz の大きさが 軌道^4 x q x 1024 になります。
+χ0(iν) は Lehmann表示 χ0(iν) = ∫dω ρ(ω) ω/(ω - iν) で書けるので、このスクリプトは
+核 K(iν, ω) = ω/(ω - iν) (|ω| <= wmax) を特異値分解して、特異値が eps 以上の
+基底 U_l(iν) (IR基底と同じ考え方) を作り、ピボット付きQR分解で選んだ L 個の
+サンプリング振動数での χ0 から展開係数 χ0_l を求めます。展開係数と基底だけを
+{chi0q}_ir.npz に保存し、元の全ての振動数の χ0 は hwave_io.iter_chi0q で必要なときに
+χ0(iν_n) = Σ_l U_l(iν_n) χ0_l として組み立てます。chi0q.npz は振動数ごとに読み込むため、
+全体をメモリに読み込む必要はありません。
+
+Parameters
+----------
+--root : str, optional
+    {pressure}GPa フォルダを含むフォルダ。デフォルトはカレントディレクトリ
+--input : str, optional
+    各圧力フォルダ内のH-wave入力ファイル名。デフォルトは "input_chi.toml"
+--wmax : float, optional
+    実周波数のカットオフ(eV)。バンド幅より大きくする。デフォルトは 5.0
+--eps : float, optional
+    基底に残す特異値の相対的な大きさ。デフォルトは 1e-8
+--check : flag, optional
+    指定すると全ての振動数で元の χ0 との差を計算する
+--remove_original : flag, optional
+    指定すると圧縮後に chi0q.npz を削除する (--check の誤差が --tol 以下の場合のみ)
+--tol : float, optional
+    --remove_original で許す相対誤差。デフォルトは 1e-6
+--self_test : flag, optional
+    指定するとH-waveと同じ振動数の並び (T = 0.01, Nmat = 1024) の模型の χ0 で
+    圧縮の誤差を確かめて終了する
+
+Returns
+-------
+なし
+
+Notes
+-----
+入力ファイル
+-----------
+{pressure}GPa/input_chi.toml : RPA計算の入力ファイル
+    mode.param.T, mode.param.Nmat, mode.param.CellShape, file.output.chi0q を使用
+{pressure}GPa/{path_to_output}/{chi0q}.npz : H-waveが出力したχ0(q)
+
+出力ファイル
+-----------
+{pressure}GPa/{path_to_output}/{chi0q}_ir.npz : 圧縮したχ0(q)
+    coefficient : 展開係数。shape=(L, ...) (... は chi0q の振動数以外の軸)
+    basis : 基底 U_l(iν_n)。shape=(nfreq, L)
+    freq_index : 元の振動数の添字 n (ν_n = (2n - Nmat)πT)。shape=(nfreq,)
+    sampling_index : サンプリング振動数の添字。shape=(L,)
+    singular_values : 基底の特異値。shape=(L,)
+    wavevector_index, wavevector_unit : chi0q.npz にあればそのままコピー
+
+See Also
+--------
+hwave_io.py : H-waveの計算結果の読み込み (iter_chi0q は圧縮形式も読める)
+"""
+
+import argparse
+import os
+
+import numpy as np
+import scipy.linalg
+
+from hwave_io import (find_pressure_dirs, read_input, output_path, chi0q_frequencies, iter_npz_array,
+                      matsubara_frequency)
+
+
+def real_frequency_grid(T, wmax, npoint=16):
+    """ω = 0 の近くで細かくなる複合Gauss-Legendre求積点
+
+    Returns
+    -------
+    omega, weight : ndarray
+        求積点と重み
+    """
+    # 区間の端を T から wmax まで等比的に取る
+    nseg = max(int(np.ceil(np.log2(wmax / T))), 1)
+    edges = np.concatenate(([0.0], wmax * 2.0 ** -np.arange(nseg, -1, -1)))
+    x, w = np.polynomial.legendre.leggauss(npoint)
+    mid, half = 0.5 * (edges[1:] + edges[:-1]), 0.5 * np.diff(edges)
+    omega = (mid[:, None] + half[:, None] * x).ravel()
+    weight = (half[:, None] * w).ravel()
+    return np.concatenate((-omega[::-1], omega)), np.concatenate((weight[::-1], weight))
+
+
+def ir_basis(nu, T, wmax, eps=1e-8):
+    """ボソン松原振動数上の基底を核 ω/(ω - iν) の特異値分解で作る
+
+    Parameters
+    ----------
+    nu : ndarray
+        ボソン松原振動数(eV)。H-waveの添字 n では ν_n = (2n - Nmat)πT
+    T : float
+        温度(eV)
+    wmax : float
+        実周波数のカットオフ(eV)
+    eps : float
+        基底に残す特異値の相対的な大きさ
+
+    Returns
+    -------
+    basis : ndarray
+        基底。shape=(nfreq, L)
+    singular_values : ndarray
+        shape=(L,)
+    """
+    nu = np.asarray(nu, dtype=float)
+    omega, weight = real_frequency_grid(T, wmax)
+    kernel = omega[None, :] / (omega[None, :] - 1j * nu[:, None]) * np.sqrt(weight)[None, :]
+    u, s, _ = np.linalg.svd(kernel, full_matrices=False)
+    L = int(np.count_nonzero(s >= eps * s[0]))
+    return u[:, :L], s[:L]
+
+
+def sampling_points(basis):
+    """基底の値の行列がよい条件数になる振動数をピボット付きQR分解で選ぶ
+
+    Returns
+    -------
+    ndarray
+        basis の行の添字(昇順)。shape=(L,)
+    """
+    _, _, pivot = scipy.linalg.qr(basis.T, pivoting=True, mode="economic")
+    return np.sort(pivot[:basis.shape[1]])
+
+
+def compress(path, input_file="input_chi.toml", wmax=5.0, eps=1e-8, check=False):
+    """1つの圧力フォルダの chi0q.npz を圧縮する
+
+    Returns
+    -------
+    dict
+        path, L, nfreq, ratio (ファイルの大きさの比), error (--check の相対誤差、なければNaN)
+    """
+    input_dict = read_input(os.path.join(path, input_file))
+    T = input_dict["mode"]["param"]["T"]
+    file_name = output_path(input_dict, "chi0q", path)
+    freq_index = chi0q_frequencies(input_dict, path)
+    basis, singular_values = ir_basis(matsubara_frequency(input_dict, freq_index), T, wmax, eps)
+    sample = sampling_points(basis)
+
+    # サンプリング振動数の χ0 だけを集める
+    sampled = {}
+    wanted = set(sample.tolist())
+    for ifreq, chunk in iter_npz_array(file_name, "chi0q", chunk=1):
+        if ifreq in wanted:
+            sampled[ifreq] = chunk[0]
+    values = np.stack([sampled[i] for i in sample])
+    coefficient = np.linalg.solve(basis[sample], values.reshape(len(sample), -1)).reshape(values.shape)
+
+    error = np.nan
+    if check:
+        diff = 0.0
+        scale = 0.0
+        flat = coefficient.reshape(len(sample), -1)
+        for ifreq, chunk in iter_npz_array(file_name, "chi0q", chunk=1):
+            diff = max(diff, np.abs(basis[ifreq] @ flat - chunk.ravel()).max())
+            scale = max(scale, np.abs(chunk).max())
+        error = diff / scale if scale > 0 else diff
+
+    extra = {}
+    with np.load(file_name) as data:
+        for key in ("wavevector_index", "wavevector_unit"):
+            if key in data.files:
+                extra[key] = data[key]
+    file_ir = file_name[:-len(".npz")] + "_ir.npz"
+    np.savez(file_ir, coefficient=coefficient, basis=basis, freq_index=freq_index,
+             sampling_index=freq_index[sample], singular_values=singular_values, **extra)
+    return {"path": path, "file": file_name, "L": len(sample), "nfreq": len(freq_index),
+            "ratio": os.path.getsize(file_name) / os.path.getsize(file_ir), "error": error}
+
+
+def self_test(T=0.01, Nmat=1024, wmax=5.0, eps=1e-8, npole=20, seed=0):
+    """H-waveと同じ振動数の並びで、極の和で作った χ0 の圧縮の相対誤差を返す
+
+    χ0(iν_n) = Σ_p a_p ω_p/(ω_p - iν_n) (|ω_p| <= wmax) を n = 0, ..., Nmat-1、
+    ν_n = (2n - Nmat)πT で作り、サンプリング振動数の値だけから全ての振動数を復元する。
+    """
+    rng = np.random.default_rng(seed)
+    freq_index = np.arange(Nmat)
+    nu = matsubara_frequency({"mode": {"param": {"T": T, "Nmat": Nmat}}}, freq_index)
+    # 静的成分は添字 Nmat/2 にある
+    assert nu[Nmat // 2] == 0.0
+    pole = rng.uniform(-wmax, wmax, npole)
+    pole[0] = T / 3
+    amplitude = rng.uniform(0.0, 1.0, (npole, 4))
+    chi0 = (pole / (pole - 1j * nu[:, None])) @ amplitude
+    basis, _ = ir_basis(nu, T, wmax, eps)
+    sample = sampling_points(basis)
+    coefficient = np.linalg.solve(basis[sample], chi0[sample])
+    return np.abs(basis @ coefficient - chi0).max() / np.abs(chi0).max(), len(sample)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=str, default=".", help="folder containing {pressure}GPa folders")
+    parser.add_argument("--input", type=str, default="input_chi.toml", help="input file of hwave in each folder")
+    parser.add_argument("--wmax", type=float, default=5.0, help="real-frequency cutoff in eV")
+    parser.add_argument("--eps", type=float, default=1e-8, help="relative cutoff of singular values")
+    parser.add_argument("--check", action="store_true", help="compare with the original chi0q at all frequencies")
+    parser.add_argument("--remove_original", action="store_true", help="remove chi0q.npz after compression")
+    parser.add_argument("--tol", type=float, default=1e-6, help="relative error allowed for --remove_original")
+    parser.add_argument("--self_test", action="store_true", help="check the compression on a model chi0 and exit")
+    args = parser.parse_args()
+
+    if args.self_test:
+        error, L = self_test(wmax=args.wmax, eps=args.eps)
+        print("self test: 1024 -> {} frequencies, relative error {:.2e}".format(L, error))
+        raise SystemExit(0 if error <= args.tol else 1)
+
+    for _, path in find_pressure_dirs(args.root):
+        file_toml = os.path.join(path, args.input)
+        if not os.path.isfile(file_toml) or not os.path.isfile(output_path(read_input(file_toml), "chi0q", path)):
+            continue
+        result = compress(path, args.input, args.wmax, args.eps, args.check or args.remove_original)
+        print("{}: {} -> {} frequencies, size ratio {:.1f}, relative error {:.2e}".format(
+            path, result["nfreq"], result["L"], result["ratio"], result["error"]))
+        if args.remove_original:
+            if result["error"] <= args.tol:
+                os.remove(result["file"])
+            else:
+                print("{}: error exceeds {}; {} is kept".format(path, args.tol, result["file"]))
@@ -0,0 +1,185 @@
+"""フェルミ準位近くの固有ベクトルだけを疎な形式で保存し、軌道・スピンで色付けしたフェルミ面を描く
+
+calc_fs_2d.py の FermiSurface_mod_orb{n}.pdf は固有値しか使わないため、実際には
+バンドの添字ごとのフェルミ面です。128x128x8 格子の固有ベクトル全体は大きいので、
+このスクリプトは eigen.npz の eigenvector をチャンクごとに読み出し、
+|E - E_F| < window の状態だけを (k点の添字, バンド, complex64 のベクトル) の組として保存します。
+保存した組から、kz=0 のフェルミ面を各軌道の重み |<orb|n,k>|^2 やスピンの偏り
+(上向き - 下向き) で色付けして描きます。
+
+Parameters
+----------
+--input : str, optional
+    入力ファイルのパス。デフォルトは "input.toml"
+--window : float, optional
+    保存するエネルギー幅(eV)。|E - E_F| < window の状態を保存する。デフォルトは 0.05
+--chunk : int, optional
+    一度に読み込む波数点の数。デフォルトは 4096
+--spin : flag, optional
+    固有ベクトルの成分を (spin, orbital) の順 (前半が上向き) とみなし、
+    スピンで足した軌道の重みとスピンの偏りを描く
+--plot_only : flag, optional
+    指定すると fermi_vectors.npz を作り直さずにプロットのみを行う
+
+Returns
+-------
+なし
+
+Notes
+-----
+入力ファイル
+----------
+input.toml : H-waveの入力ファイル
+    mode.param.CellShape, mode.param.filling, file.output.eigen を使用
+{path_to_output}/{eigen}.npz : eigenvalue と eigenvector (shape=(nvol, nd, nband))
+
+出力ファイル
+----------
+fermi_vectors.npz : フェルミ準位近くの状態
+    k_index : 平坦化した波数点の添字 (x が最も遅い)。shape=(nrec,), int32
+    band : バンドの添字。shape=(nrec,), int16
+    energy : E - E_F。shape=(nrec,), float32
+    vector : 固有ベクトル。shape=(nrec, nd), complex64
+    mesh, fermi_energy, window
+
+FermiSurface_weight_orb{n}.pdf : 軌道 n の重みで色付けした kz=0 のフェルミ面
+FermiSurface_weight_spin.pdf : スピンの偏りで色付けした kz=0 のフェルミ面 (--spin 指定時)
+
+See Also
+--------
+hwave_io.py : H-waveの計算結果の読み込み
+calc_fs_2d.py : 2次元フェルミ面を計算・プロットする
+"""
+
+import argparse
+
+import numpy as np
+
+from hwave_io import read_input, load_eigen, output_path, iter_npz_array, fermi_energy
+
+OUTPUT = "fermi_vectors.npz"
+
+
+def extract_near_fermi(file_eigen, eigenvalues, ene_f, window, chunk=4096):
+    """フェルミ準位近くの状態の固有ベクトルだけを取り出す
+
+    Parameters
+    ----------
+    file_eigen : str
+        eigen.npz のパス
+    eigenvalues : ndarray
+        固有値。shape=(nvol, nband)
+    ene_f : float
+        フェルミエネルギー
+    window : float
+        |E - E_F| < window の状態を取り出す
+    chunk : int
+        一度に読み込む波数点の数
+
+    Returns
+    -------
+    dict
+        k_index, band, energy, vector
+    """
+    records = {"k_index": [], "band": [], "energy": [], "vector": []}
+    for start, vectors in iter_npz_array(file_eigen, "eigenvector", chunk):
+        energy = eigenvalues[start:start + len(vectors)] - ene_f
+        ik, ib = np.nonzero(np.abs(energy) < window)
+        records["k_index"].append((start + ik).astype(np.int32))
+        records["band"].append(ib.astype(np.int16))
+        records["energy"].append(energy[ik, ib].astype(np.float32))
+        records["vector"].append(vectors[ik, :, ib].astype(np.complex64))
+    return {key: np.concatenate(value) for key, value in records.items()}
+
+
+def orbital_weight(vector, spin=False):
+    """各軌道の重み |<orb|n,k>|^2
+
+    Parameters
+    ----------
+    vector : ndarray
+        shape=(nrec, nd)
+    spin : bool
+        Trueの場合、成分を (spin, orbital) の順とみなしてスピンについて足す
+
+    Returns
+    -------
+    ndarray
+        shape=(nrec, nd) または spin の場合 shape=(nrec, nd/2)
+    """
+    weight = np.abs(vector) ** 2
+    if spin:
+        weight = weight.reshape(len(weight), 2, -1).sum(axis=1)
+    return weight
+
+
+def spin_polarization(vector):
+    """スピンの偏り(上向きの重み - 下向きの重み)。shape=(nrec,)"""
+    weight = (np.abs(vector) ** 2).reshape(len(vector), 2, -1).sum(axis=2)
+    return weight[:, 0] - weight[:, 1]
+
+
+def plot_weight(kx, ky, value, output_file, cmap="viridis", vmin=0.0, vmax=1.0, label=""):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots()
+    image = ax.scatter(kx, ky, c=value, s=0.5, cmap=cmap, vmin=vmin, vmax=vmax, rasterized=True)
+    fig.colorbar(image, ax=ax, label=label)
+    ax.set_xlim(-np.pi, np.pi)
+    ax.set_ylim(-np.pi, np.pi)
+    ax.set_xlabel(r"$k_x/\pi$")
+    ax.set_ylabel(r"$k_y/\pi$")
+    ticks = np.linspace(-np.pi, np.pi, 4, endpoint=False)
+    ax.set_xticks(ticks, np.linspace(-1.0, 1.0, 4, endpoint=False))
+    ax.set_yticks(ticks, np.linspace(-1.0, 1.0, 4, endpoint=False))
+    ax.set_aspect("equal", adjustable="box")
+    fig.savefig(output_file, format="pdf", dpi=500)
+    plt.close(fig)
+
+
+def plot(records, spin=False):
+    """kz=0 のフェルミ面を軌道・スピンの重みで色付けして描く"""
+    Lx, Ly, Lz = records["mesh"]
+    kz0 = records["k_index"] % Lz == 0
+    k_index = records["k_index"][kz0] // Lz
+    kx = ((k_index // Ly / Lx + 0.5) % 1.0 - 0.5) * 2 * np.pi
+    ky = ((k_index % Ly / Ly + 0.5) % 1.0 - 0.5) * 2 * np.pi
+    vector = records["vector"][kz0]
+    weight = orbital_weight(vector, spin)
+    for orb in range(weight.shape[1]):
+        plot_weight(kx, ky, weight[:, orb], "FermiSurface_weight_orb{}.pdf".format(orb),
+                    label="weight of orbital {}".format(orb))
+    if spin:
+        plot_weight(kx, ky, spin_polarization(vector), "FermiSurface_weight_spin.pdf",
+                    cmap="coolwarm", vmin=-1.0, vmax=1.0, label="up - down")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, default="input.toml", help="input file of hwave")
+    parser.add_argument("--window", type=float, default=0.05, help="energy window around E_F in eV")
+    parser.add_argument("--chunk", type=int, default=4096, help="number of k points read at once")
+    parser.add_argument("--spin", action="store_true", help="treat vector components as (spin, orbital)")
+    parser.add_argument("--plot_only", action="store_true", help="plot from existing " + OUTPUT)
+    args = parser.parse_args()
+
+    if args.plot_only:
+        with np.load(OUTPUT) as data:
+            records = {key: data[key] for key in data.files}
+    else:
+        input_dict = read_input(args.input)
+        eigenvalues, _ = load_eigen(input_dict)
+        mesh = np.array(eigenvalues.shape[:3])
+        ene_f = fermi_energy(eigenvalues, input_dict["mode"]["param"]["filling"])
+        records = extract_near_fermi(output_path(input_dict, "eigen"), eigenvalues.reshape(np.prod(mesh), -1),
+                                     ene_f, args.window, args.chunk)
+        records.update(mesh=mesh, fermi_energy=ene_f, window=args.window)
+        np.savez(OUTPUT, **records)
+        nrec, nd = records["vector"].shape
+        full = np.prod(mesh) * nd * eigenvalues.shape[-1] * 16
+        sparse = sum(records[key].nbytes for key in ("k_index", "band", "energy", "vector"))
+        print("Records: {} / {} states".format(nrec, eigenvalues.size))
+        print("Memory: {:.3e} bytes (full complex128 eigenvectors: {:.3e} bytes, ratio {:.2e})".format(
+            sparse, full, sparse / full))
+    plot(records, args.spin)
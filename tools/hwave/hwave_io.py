@@ -0,0 +1,384 @@
+"""H-waveの計算結果を圧力フォルダごとに読み込む
+
+このモジュールは、calc_rpa.sh / calc_chi0.sh で作成される {pressure}GPa フォルダから
+H-waveの入力ファイル(input.toml, input_chi.toml)と出力ファイル
+(eigen.npz, green.npz, chi0q.npz)を読み込むための共通関数をまとめたものです。
+tools/hwave 内の各スクリプトから読み込んで使用します。
+
+Notes
+-----
+入力ファイル
+-----------
+{pressure}GPa/input.toml : UHFk計算の入力ファイル
+    mode.param.CellShape, mode.param.filling, file.output.eigen, file.output.green
+
+{pressure}GPa/input_chi.toml : RPA計算の入力ファイル
+    mode.param.T, mode.param.Nmat, mode.param.enable_spin_orbital,
+    file.output.chi0q, file.input.interaction.Geometry
+
+{pressure}GPa/{path_to_output}/{name}.npz : H-waveの出力ファイル
+{pressure}GPa/{path_to_output}/{chi0q}_ir.npz : compress_chi0q.py で圧縮したχ0(q) (chi0q.npz がない場合に使う)
+
+See Also
+--------
+calc_fs_2d.py : 2次元フェルミ面を計算・プロットする
+"""
+
+import glob
+import os
+import zipfile
+
+import numpy as np
+import tomli
+
+
+def read_input(file_toml):
+    """H-waveの入力ファイルを読み込む
+
+    Parameters
+    ----------
+    file_toml : str
+        入力ファイルのパス
+
+    Returns
+    -------
+    dict
+        入力ファイルの内容
+    """
+    if not os.path.exists(file_toml):
+        raise ValueError("Input file does not exist: {}".format(file_toml))
+    with open(file_toml, "rb") as f:
+        return tomli.load(f)
+
+
+def find_pressure_dirs(root="."):
+    """{pressure}GPa フォルダを圧力の昇順に列挙する
+
+    Parameters
+    ----------
+    root : str
+        圧力フォルダを含むフォルダ
+
+    Returns
+    -------
+    list of tuple
+        (圧力(GPa), フォルダのパス) のリスト。圧力が数値でないフォルダは除く
+    """
+    dirs = []
+    for path in glob.glob(os.path.join(root, "*GPa")):
+        if not os.path.isdir(path):
+            continue
+        try:
+            pressure = float(os.path.basename(path)[:-len("GPa")])
+        except ValueError:
+            continue
+        dirs.append((pressure, path))
+    return sorted(dirs)
+
+
+def output_path(input_dict, key, base_dir="."):
+    """H-waveの出力ファイル(.npz)のパスを返す
+
+    Parameters
+    ----------
+    input_dict : dict
+        H-waveの入力ファイルの内容
+    key : str
+        file.output のキー ("eigen", "green", "chi0q" など)
+    base_dir : str
+        入力ファイルのあるフォルダ
+
+    Returns
+    -------
+    str
+        出力ファイルのパス
+    """
+    output_info_dict = input_dict["file"]["output"]
+    name = output_info_dict[key]
+    if not name.endswith(".npz"):
+        name += ".npz"
+    return os.path.join(base_dir, output_info_dict["path_to_output"], name)
+
+
+def load_eigen(input_dict, base_dir=".", with_vector=False):
+    """固有値(と固有ベクトル)を (Lx, Ly, Lz, norb) の形で読み込む
+
+    Parameters
+    ----------
+    input_dict : dict
+        UHFk計算の入力ファイルの内容
+    base_dir : str
+        入力ファイルのあるフォルダ
+    with_vector : bool
+        Trueの場合、固有ベクトルも読み込む
+
+    Returns
+    -------
+    eigenvalues : ndarray
+        固有値。shape=(Lx, Ly, Lz, norb)
+    eigenvectors : ndarray or None
+        固有ベクトル。shape=(Lx, Ly, Lz, norb, norb)、最後の添字がバンド。
+        with_vector が False か、ファイルに含まれない場合は None
+    """
+    Lx, Ly, Lz = input_dict["mode"]["param"]["CellShape"]
+    data = np.load(output_path(input_dict, "eigen", base_dir))
+    eigenvalues = data["eigenvalue"]
+    norb = eigenvalues.shape[-1]
+    eigenvalues = eigenvalues.reshape((Lx, Ly, Lz, norb))
+    eigenvectors = None
+    if with_vector and "eigenvector" in data.files:
+        eigenvectors = data["eigenvector"].reshape((Lx, Ly, Lz, -1, norb))
+    return eigenvalues, eigenvectors
+
+
+def _read_npy_header(fp):
+    """.npy のヘッダを読み、(shape, fortran_order, dtype) を返す"""
+    version = np.lib.format.read_magic(fp)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(fp)
+    return np.lib.format.read_array_header_2_0(fp)
+
+
+def npz_array_shape(file_name, key):
+    """.npz 内の配列の形を、配列を読み込まずに返す"""
+    with zipfile.ZipFile(file_name) as zf, zf.open(key + ".npy") as fp:
+        return _read_npy_header(fp)[0]
+
+
+def iter_npz_array(file_name, key, chunk=4096, columns=None):
+    """.npz 内の配列を先頭の軸に沿ってチャンクごとに読み込む
+
+    配列全体をメモリに読み込まずに、zipのストリームから順に読み出す。
+
+    Parameters
+    ----------
+    file_name : str
+        .npz ファイルのパス
+    key : str
+        配列の名前
+    chunk : int
+        1チャンクあたりの先頭の軸の要素数
+    columns : slice, optional
+        指定すると2番目の軸のこの範囲だけを読み込む (残りは読み飛ばす)
+
+    Yields
+    ------
+    start : int
+        チャンクの先頭の添字
+    ndarray
+        shape=(<=chunk, ...)
+    """
+    with zipfile.ZipFile(file_name) as zf, zf.open(key + ".npy") as fp:
+        shape, fortran_order, dtype = _read_npy_header(fp)
+        if fortran_order:
+            raise ValueError("Fortran-ordered arrays are not supported: {}".format(key))
+        row = int(np.prod(shape[1:]))
+        if columns is not None:
+            first, last, _ = columns.indices(shape[1])
+            inner = int(np.prod(shape[2:])) * dtype.itemsize
+        for start in range(0, shape[0] if shape else 0, chunk):
+            n = min(chunk, shape[0] - start)
+            if columns is None:
+                buf = fp.read(n * row * dtype.itemsize)
+                yield start, np.frombuffer(buf, dtype=dtype).reshape((n,) + tuple(shape[1:]))
+                continue
+            rows = []
+            for _ in range(n):
+                fp.seek(first * inner, 1)
+                rows.append(np.frombuffer(fp.read((last - first) * inner), dtype=dtype))
+                fp.seek((shape[1] - last) * inner, 1)
+            yield start, np.stack(rows).reshape((n, last - first) + tuple(shape[2:]))
+
+
+def load_geometry(input_dict, base_dir="."):
+    """zvo_geom.dat から格子ベクトルと軌道の中心を読み込む
+
+    Parameters
+    ----------
+    input_dict : dict
+        H-waveの入力ファイルの内容
+    base_dir : str
+        入力ファイルのあるフォルダ
+
+    Returns
+    -------
+    cell : ndarray
+        格子ベクトル。shape=(3, 3)
+    centres : ndarray
+        軌道の中心(分数座標)。shape=(norb, 3)
+    """
+    info = input_dict["file"]["input"]["interaction"]
+    file_name = os.path.join(base_dir, info["path_to_input"], info["Geometry"])
+    with open(file_name, "r") as fr:
+        lines = [line for line in fr if line.strip()]
+    cell = np.array([line.split()[:3] for line in lines[:3]], dtype=float)
+    norb = int(lines[3].split()[0])
+    centres = np.array([line.split()[:3] for line in lines[4:4 + norb]], dtype=float)
+    return cell, centres
+
+
+def chi0q_file(input_dict, base_dir="."):
+    """χ0のファイルのパスと、圧縮形式かどうかを返す
+
+    chi0q.npz がなく、compress_chi0q.py で作成した {chi0q}_ir.npz があればそちらを使う。
+
+    Returns
+    -------
+    file_name : str
+        ファイルのパス
+    compressed : bool
+        圧縮形式の場合True
+    """
+    file_name = output_path(input_dict, "chi0q", base_dir)
+    file_ir = file_name[:-len(".npz")] + "_ir.npz"
+    if not os.path.isfile(file_name) and os.path.isfile(file_ir):
+        return file_ir, True
+    return file_name, False
+
+
+def chi0q_frequencies(input_dict, base_dir="."):
+    """chi0q.npz の振動数の添字を返す
+
+    H-waveは添字 n (0 <= n < Nmat) の振動数を ν_n = (2n - Nmat)πT として保存する。
+
+    Returns
+    -------
+    ndarray
+        各振動数の添字 n。freq_index がなければ、振動数が1つなら静的な添字 Nmat/2、
+        それ以外は 0 から順に番号を付ける
+    """
+    file_name, _ = chi0q_file(input_dict, base_dir)
+    with np.load(file_name) as data:
+        if "freq_index" in data.files:
+            return np.asarray(data["freq_index"])
+    nfreq = npz_array_shape(file_name, "chi0q")[0]
+    if nfreq == 1:
+        return np.array([static_freq_index(input_dict)])
+    return np.arange(nfreq)
+
+
+def static_freq_index(input_dict):
+    """静的成分 (ν = 0) の振動数の添字 Nmat/2 を返す"""
+    return int(input_dict["mode"]["param"]["Nmat"]) // 2
+
+
+def matsubara_frequency(input_dict, freq_index):
+    """振動数の添字 n からボソン松原振動数 ν_n = (2n - Nmat)πT を返す"""
+    param = input_dict["mode"]["param"]
+    return (2 * np.asarray(freq_index) - int(param["Nmat"])) * np.pi * param["T"]
+
+
+def spin_orbital(input_dict):
+    """軌道がスピンを含むか (mode.param.enable_spin_orbital) を返す。H-waveと同じくデフォルトは False"""
+    return bool(input_dict["mode"]["param"].get("enable_spin_orbital", False))
+
+
+def iter_chi0q(input_dict, base_dir=".", freq=None):
+    """χ0(q) を振動数ごとに (nvol, nd, nd) の行列として読み込む
+
+    chi0q.npz の chi0q は先頭の軸が振動数、次が波数で、残りの軸を行と列に
+    半分ずつ分けて nd x nd の行列とする。配列全体は読み込まない。
+    圧縮形式の場合は、展開係数を一度だけ読み込み、指定した振動数の χ0 を1つずつ組み立てる。
+
+    Parameters
+    ----------
+    input_dict : dict
+        RPA計算の入力ファイルの内容
+    base_dir : str
+        入力ファイルのあるフォルダ
+    freq : array_like, optional
+        読み込む振動数の添字 (freq_index の値、ν_n = (2n - Nmat)πT の n)。省略時は全て
+
+    Yields
+    ------
+    freq : int
+        振動数の添字
+    ndarray
+        χ0。shape=(nvol, nd, nd)
+    """
+    nvol = int(np.prod(input_dict["mode"]["param"]["CellShape"]))
+    file_name, compressed = chi0q_file(input_dict, base_dir)
+    freq_index = chi0q_frequencies(input_dict, base_dir)
+    selected = set(freq_index.tolist()) if freq is None else set(np.ravel(freq).tolist())
+
+    def as_matrix(chunk):
+        nd = int(round(np.sqrt(chunk.size // nvol)))
+        if nd * nd * nvol != chunk.size:
+            raise ValueError("chi0q is not a square matrix for each q: shape={}".format(chunk.shape))
+        return chunk.reshape(nvol, nd, nd)
+
+    if compressed:
+        # 展開係数 (L, nvol*nd*nd) は1つの振動数の χ0 の L 倍の大きさなので一度だけ読み込む
+        with np.load(file_name) as data:
+            basis = data["basis"]
+            coefficient = data["coefficient"]
+        coefficient = coefficient.reshape(len(coefficient), -1)
+        for i, m in enumerate(freq_index):
+            if m in selected:
+                yield int(m), as_matrix(basis[i] @ coefficient)
+        return
+    for ifreq, chunk in iter_npz_array(file_name, "chi0q", chunk=1):
+        if freq_index[ifreq] not in selected:
+            continue
+        yield int(freq_index[ifreq]), as_matrix(chunk)
+
+
+def load_green(input_dict, base_dir="."):
+    """一体グリーン関数を読み込む
+
+    Parameters
+    ----------
+    input_dict : dict
+        UHFk計算の入力ファイルの内容
+    base_dir : str
+        入力ファイルのあるフォルダ
+
+    Returns
+    -------
+    ndarray
+        一体グリーン関数。green[r, s, orb, s', orb'] の形
+    """
+    return np.load(output_path(input_dict, "green", base_dir))["green"]
+
+
+def occupations(green):
+    """各軌道の占有数を一体グリーン関数から計算する
+
+    calc_fs_2d.py と同じく green[0, 0, i, 0, i] の実部の2倍とする。
+
+    Parameters
+    ----------
+    green : ndarray
+        一体グリーン関数
+
+    Returns
+    -------
+    ndarray
+        各軌道の占有数。shape=(norb,)
+    """
+    norb = green.shape[2]
+    idx = np.arange(norb)
+    return green[0, 0, idx, 0, idx].real * 2
+
+
+def fermi_energy(eigenvalues, filling):
+    """フィリングからフェルミエネルギーを決める
+
+    calc_fs_2d.py と同じく、全固有値を昇順に並べたときの
+    int(N * filling) 番目の値とする。全体のソートは行わずに選択のみを行う。
+
+    Parameters
+    ----------
+    eigenvalues : ndarray
+        固有値。形は任意で、最後の次元以外も含めて全て数える
+    filling : float
+        フィリング
+
+    Returns
+    -------
+    float
+        フェルミエネルギー
+    """
+    flat = np.ravel(eigenvalues)
+    idx = int(flat.size * filling)
+    return np.partition(flat, idx)[idx]
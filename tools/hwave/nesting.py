@@ -0,0 +1,190 @@
+"""フェルミ面の自己相関(ネスティング関数)をFFTで計算する
+
+このスクリプトは、各 {pressure}GPa フォルダの eigen.npz から、ガウス関数で広げた
+フェルミ面の重み w_n(k) = δ_σ(E_n(k) - E_F) を作り、ネスティング関数
+ξ_nm(q) = (1/N) Σ_k w_n(k) w_m(k+q) を全てのqについて計算します。
+各バンドの重みを一度だけFFTし、バンドの組ごとに1回の逆FFTで求めるため、
+kとqの二重ループ(O(N^2))は不要です。χ0(q) のピークの解釈に使います。
+圧力ごとの計算はプロセスプールで並列に実行します。
+
+Parameters
+----------
+--root : str, optional
+    {pressure}GPa フォルダを含むフォルダ。デフォルトはカレントディレクトリ
+--input : str, optional
+    各圧力フォルダ内のH-wave入力ファイル名。デフォルトは "input.toml"
+--sigma : float, optional
+    デルタ関数を近似するガウス関数の幅(eV)。デフォルトは 0.02
+--diagonal : flag, optional
+    指定するとバンド内 (n = m) の組のみを保存する
+--nproc : int, optional
+    並列プロセス数。デフォルトはCPUコア数
+
+Returns
+-------
+なし
+
+Notes
+-----
+入力ファイル
+-----------
+{pressure}GPa/input.toml : UHFk計算の入力ファイル
+    mode.param.CellShape, mode.param.filling, file.output.eigen を使用
+
+出力ファイル
+-----------
+{pressure}GPa/nesting.npz : ネスティング関数
+    xi : 全バンドの和。shape=(Lx, Ly, Lz)
+    xi_band : バンドの組ごと。shape=(norb, norb, Lx, Ly, Lz)
+              (--diagonal 指定時は shape=(norb, Lx, Ly, Lz))
+    q の添字は eigen.npz の波数の添字と同じ (q = 2π i/L)
+{pressure}GPa/nesting.pdf : qz=0 での ξ(q) (全バンドの和とバンド内の各成分)
+
+See Also
+--------
+hwave_io.py : H-waveの計算結果の読み込み
+calc_fs_2d.py : 2次元フェルミ面を計算・プロットする
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from hwave_io import find_pressure_dirs, read_input, load_eigen, fermi_energy
+
+
+def fermi_surface_weight(eigenvalues, ene_f, sigma):
+    """ガウス関数で広げたフェルミ面の重み
+
+    Parameters
+    ----------
+    eigenvalues : ndarray
+        固有値。shape=(Lx, Ly, Lz, norb)
+    ene_f : float
+        フェルミエネルギー
+    sigma : float
+        ガウス関数の幅
+
+    Returns
+    -------
+    ndarray
+        shape=(Lx, Ly, Lz, norb)
+    """
+    x = (eigenvalues - ene_f) / sigma
+    return np.exp(-0.5 * x ** 2) / (np.sqrt(2 * np.pi) * sigma)
+
+
+def nesting_function(weight, diagonal=False):
+    """フェルミ面の重みの自己相関をFFTで計算する
+
+    ξ_nm(q) = (1/N) Σ_k w_n(k) w_m(k+q) のフーリエ変換は conj(W_n(G)) W_m(G) / N。
+
+    Parameters
+    ----------
+    weight : ndarray
+        フェルミ面の重み。shape=(Lx, Ly, Lz, norb)
+    diagonal : bool
+        Trueの場合はバンド内の組のみを計算する
+
+    Returns
+    -------
+    xi : ndarray
+        全バンドの和。shape=(Lx, Ly, Lz)
+    xi_band : ndarray
+        shape=(norb, norb, Lx, Ly, Lz)。diagonal の場合は shape=(norb, Lx, Ly, Lz)
+    """
+    shape = weight.shape[:3]
+    nvol = np.prod(shape)
+    norb = weight.shape[3]
+    # 実数の重みなので最後の軸は半分だけ計算する
+    F = np.fft.rfftn(weight, axes=(0, 1, 2))
+    total = F.sum(axis=3)
+    xi = np.fft.irfftn(np.abs(total) ** 2, s=shape, axes=(0, 1, 2)) / nvol
+    if diagonal:
+        xi_band = np.fft.irfftn(np.abs(F) ** 2, s=shape, axes=(0, 1, 2)) / nvol
+        return xi, np.moveaxis(xi_band, 3, 0)
+    xi_band = np.empty((norb, norb) + tuple(shape))
+    for n in range(norb):
+        product = F[..., n, None].conj() * F
+        xi_band[n] = np.moveaxis(np.fft.irfftn(product, s=shape, axes=(0, 1, 2)), 3, 0) / nvol
+    return xi, xi_band
+
+
+def plot(xi, xi_diag, output_file):
+    """qz=0 での ξ(q) をプロットする
+
+    Parameters
+    ----------
+    xi : ndarray
+        全バンドの和。shape=(Lx, Ly, Lz)
+    xi_diag : ndarray
+        バンド内の成分。shape=(norb, Lx, Ly, Lz)
+    output_file : str
+        出力ファイル名
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    # 重みを持つバンドだけを表示する
+    bands = [n for n in range(len(xi_diag)) if xi_diag[n, 0, 0, 0] > 0.0]
+    maps = [("total", xi[:, :, 0])] + [("band {}".format(n), xi_diag[n, :, :, 0]) for n in bands]
+    ncol = min(len(maps), 3)
+    nrow = -(-len(maps) // ncol)
+    fig, axes = plt.subplots(nrow, ncol, figsize=(4 * ncol, 4 * nrow), squeeze=False)
+    for ax, (title, data) in zip(axes.ravel(), maps):
+        Lx, Ly = data.shape
+        qx = (np.arange(Lx) - Lx // 2) * 2 / Lx
+        qy = (np.arange(Ly) - Ly // 2) * 2 / Ly
+        image = ax.pcolormesh(qx, qy, np.fft.fftshift(data).T, shading="nearest", rasterized=True)
+        fig.colorbar(image, ax=ax)
+        ax.set_title(title)
+        ax.set_xlabel(r"$q_x/\pi$")
+        ax.set_ylabel(r"$q_y/\pi$")
+        ax.set_aspect("equal", adjustable="box")
+    for ax in axes.ravel()[len(maps):]:
+        ax.set_visible(False)
+    fig.tight_layout()
+    fig.savefig(output_file, format="pdf", dpi=300)
+    plt.close(fig)
+
+
+def process_pressure(path, input_file="input.toml", sigma=0.02, diagonal=False):
+    """1つの圧力フォルダでネスティング関数を計算し、保存・プロットする
+
+    Returns
+    -------
+    tuple
+        (フォルダのパス, qz=0 で ξ(q) が最大となる q の添字 (iqx, iqy))
+    """
+    input_dict = read_input(os.path.join(path, input_file))
+    eigenvalues, _ = load_eigen(input_dict, path)
+    ene_f = fermi_energy(eigenvalues, input_dict["mode"]["param"]["filling"])
+    weight = fermi_surface_weight(eigenvalues, ene_f, sigma)
+    xi, xi_band = nesting_function(weight, diagonal)
+    np.savez_compressed(os.path.join(path, "nesting.npz"), xi=xi, xi_band=xi_band, sigma=sigma)
+    norb = weight.shape[3]
+    xi_diag = xi_band if diagonal else xi_band[np.arange(norb), np.arange(norb)]
+    plot(xi, xi_diag, os.path.join(path, "nesting.pdf"))
+    # q=0 を除いた最大値の位置
+    plane = xi[:, :, 0].copy()
+    plane[0, 0] = -np.inf
+    return path, np.unravel_index(np.argmax(plane), plane.shape)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=str, default=".", help="folder containing {pressure}GPa folders")
+    parser.add_argument("--input", type=str, default="input.toml", help="input file of hwave in each folder")
+    parser.add_argument("--sigma", type=float, default=0.02, help="Gaussian broadening in eV")
+    parser.add_argument("--diagonal", action="store_true", help="store only intra-band pairs")
+    parser.add_argument("--nproc", type=int, default=None, help="number of processes")
+    args = parser.parse_args()
+
+    dirs = [d for _, d in find_pressure_dirs(args.root) if os.path.isfile(os.path.join(d, args.input))]
+    with ProcessPoolExecutor(max_workers=args.nproc) as executor:
+        futures = [executor.submit(process_pressure, d, args.input, args.sigma, args.diagonal) for d in dirs]
+        for future in futures:
+            path, (iqx, iqy) = future.result()
+            print("{}: max xi(q) at q = ({}, {}) (q != 0, qz = 0)".format(path, iqx, iqy))
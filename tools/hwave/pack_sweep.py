@@ -0,0 +1,322 @@
+"""圧力スイープの計算結果を1つのチャンク化・圧縮アーカイブにまとめる
+
+このスクリプトは、各 {pressure}GPa フォルダに散らばっている eigen.npz, green.npz,
+chi0q.npz, energy.dat, PDFファイルを、圧力と物理量で索引付けされた1つのフォルダ
+(zarr風の .npz チャンクの集まり)にまとめます。
+大きな配列は波数の軸 (χ0 では振動数の次の軸) に沿ってチャンクに分割して圧縮保存するため、
+SweepArchive.take を使うと、例えば1つのqでのχ0を全圧力について
+配列全体を読み込まずに取り出せます。E_F(p) などのスカラー量は scalars.npz に
+圧力の順に並べて保存します。
+
+Parameters
+----------
+--root : str, optional
+    {pressure}GPa フォルダを含むフォルダ。デフォルトはカレントディレクトリ
+--output : str, optional
+    アーカイブのフォルダ名。デフォルトは "sweep_archive"
+--chunk : int, optional
+    1チャンクあたりの波数点の数。デフォルトは 1024
+
+Returns
+-------
+なし
+
+Notes
+-----
+入力ファイル
+-----------
+{pressure}GPa/input.toml : UHFk計算の入力ファイル(eigen, green, energy.dat)
+{pressure}GPa/input_chi.toml : RPA計算の入力ファイル(chi0q)。波数点の数は mode.param.CellShape から決める
+{pressure}GPa/*.pdf : 図
+
+出力ファイル
+-----------
+{output}/index.json : 圧力のリストと各物理量の形・チャンク情報
+{output}/scalars.npz : 圧力ごとのスカラー量・小さな配列
+    pressure, fermi_energy, filling, occupation (shape=(npressure, norb))
+{output}/{quantity}/{ipressure}/{ichunk}.npz : 配列のチャンク
+    quantity は eigenvalue, eigenvector, green, chi0q, energy_kz0
+    chi0q が圧縮形式 ({chi0q}_ir.npz) の場合は chi0q_ir (展開係数) と chi0q_ir_basis (基底)
+{output}/pdf/{pressure}GPa/*.pdf : 図のコピー
+
+See Also
+--------
+hwave_io.py : H-waveの計算結果の読み込み
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+
+import numpy as np
+
+from hwave_io import (find_pressure_dirs, read_input, output_path, chi0q_file, fermi_energy, occupations,
+                      iter_npz_array, npz_array_shape)
+
+INDEX = "index.json"
+SCALARS = "scalars.npz"
+
+
+def write_chunks(folder, array, chunk_axis, chunk_size):
+    """配列をある軸に沿って分割し、圧縮して保存する
+
+    Parameters
+    ----------
+    folder : str
+        チャンクを保存するフォルダ
+    array : ndarray
+        保存する配列
+    chunk_axis : int
+        分割する軸
+    chunk_size : int
+        1チャンクあたりの要素数
+
+    Returns
+    -------
+    dict
+        shape, dtype, chunk_axis, chunk_size
+    """
+    os.makedirs(folder, exist_ok=True)
+    n = array.shape[chunk_axis]
+    for ichunk, start in enumerate(range(0, n, chunk_size)):
+        chunk = np.take(array, np.arange(start, min(start + chunk_size, n)), axis=chunk_axis)
+        np.savez_compressed(os.path.join(folder, "{}.npz".format(ichunk)), data=chunk)
+    return {"shape": list(array.shape), "dtype": array.dtype.str,
+            "chunk_axis": chunk_axis, "chunk_size": chunk_size}
+
+
+def write_npz_chunks(folder, file_name, key, nvol, chunk_size):
+    """.npz 内の配列 (先頭の軸が振動数、次が波数) を波数の軸に沿って分割し、圧縮して保存する
+
+    1チャンク分 (全振動数 x chunk_size 個の波数点) ずつ読み込み、配列全体は読み込まない。
+
+    Parameters
+    ----------
+    folder : str
+        チャンクを保存するフォルダ
+    file_name : str
+        .npz ファイルのパス
+    key : str
+        配列の名前
+    nvol : int
+        波数点の数 (CellShape の積)
+    chunk_size : int
+        1チャンクあたりの波数点の数
+
+    Returns
+    -------
+    dict
+        shape, dtype, chunk_axis, chunk_size
+    """
+    shape = npz_array_shape(file_name, key)
+    if len(shape) < 2 or shape[1] != nvol:
+        raise ValueError("{} in {} has shape {}, but the second axis should be {} wave vectors".format(
+            key, file_name, shape, nvol))
+    os.makedirs(folder, exist_ok=True)
+    dtype = None
+    for ichunk, start in enumerate(range(0, nvol, chunk_size)):
+        columns = slice(start, min(start + chunk_size, nvol))
+        chunk = np.concatenate([c for _, c in iter_npz_array(file_name, key, chunk=1, columns=columns)])
+        dtype = chunk.dtype
+        np.savez_compressed(os.path.join(folder, "{}.npz".format(ichunk)), data=chunk)
+    return {"shape": list(shape), "dtype": dtype.str, "chunk_axis": 1, "chunk_size": chunk_size}
+
+
+def pack_sweep(root=".", output="sweep_archive", chunk_size=1024):
+    """圧力スイープの結果をアーカイブにまとめる
+
+    Parameters
+    ----------
+    root : str
+        {pressure}GPa フォルダを含むフォルダ
+    output : str
+        アーカイブのフォルダ
+    chunk_size : int
+        1チャンクあたりの波数点の数
+
+    Returns
+    -------
+    dict
+        index.json の内容
+    """
+    os.makedirs(output, exist_ok=True)
+    dirs = find_pressure_dirs(root)
+    index = {"pressures": [p for p, _ in dirs], "dirs": [os.path.basename(d) for _, d in dirs],
+             "quantities": {}}
+    scalars = {"pressure": np.array(index["pressures"]),
+               "fermi_energy": np.full(len(dirs), np.nan),
+               "filling": np.full(len(dirs), np.nan)}
+    occupation = []
+
+    def store(quantity, ipressure, array, chunk_axis):
+        info = write_chunks(os.path.join(output, quantity, str(ipressure)), array, chunk_axis, chunk_size)
+        index["quantities"].setdefault(quantity, {})[str(ipressure)] = info
+
+    for ipressure, (pressure, path) in enumerate(dirs):
+        print("Packing", path)
+        file_toml = os.path.join(path, "input.toml")
+        if os.path.isfile(file_toml):
+            input_dict = read_input(file_toml)
+            filling = input_dict["mode"]["param"]["filling"]
+            scalars["filling"][ipressure] = filling
+            file_eigen = output_path(input_dict, "eigen", path)
+            if os.path.isfile(file_eigen):
+                with np.load(file_eigen) as data:
+                    eigenvalues = data["eigenvalue"]
+                    scalars["fermi_energy"][ipressure] = fermi_energy(eigenvalues, filling)
+                    store("eigenvalue", ipressure, eigenvalues, 0)
+                    if "eigenvector" in data.files:
+                        store("eigenvector", ipressure, data["eigenvector"], 0)
+            file_green = output_path(input_dict, "green", path)
+            if os.path.isfile(file_green):
+                green = np.load(file_green)["green"]
+                occupation.append((ipressure, occupations(green)))
+                store("green", ipressure, green, 0)
+        file_energy = os.path.join(path, "energy.dat")
+        if os.path.isfile(file_energy):
+            store("energy_kz0", ipressure, np.loadtxt(file_energy, ndmin=2), 0)
+        file_toml = os.path.join(path, "input_chi.toml")
+        if os.path.isfile(file_toml):
+            input_dict = read_input(file_toml)
+            file_chi0q, compressed = chi0q_file(input_dict, path)
+            if os.path.isfile(file_chi0q):
+                nvol = int(np.prod(input_dict["mode"]["param"]["CellShape"]))
+                # 展開係数は chi0q と同じく2番目の軸が波数。基底は別の物理量とする
+                quantity, key = ("chi0q_ir", "coefficient") if compressed else ("chi0q", "chi0q")
+                info = write_npz_chunks(os.path.join(output, quantity, str(ipressure)), file_chi0q, key, nvol,
+                                        chunk_size)
+                index["quantities"].setdefault(quantity, {})[str(ipressure)] = info
+                if compressed:
+                    with np.load(file_chi0q) as data:
+                        store("chi0q_ir_basis", ipressure, data["basis"], 0)
+        pdfs = glob.glob(os.path.join(path, "*.pdf"))
+        if pdfs:
+            pdf_folder = os.path.join(output, "pdf", os.path.basename(path))
+            os.makedirs(pdf_folder, exist_ok=True)
+            for pdf in pdfs:
+                shutil.copy2(pdf, pdf_folder)
+
+    if occupation:
+        norb = max(len(occ) for _, occ in occupation)
+        scalars["occupation"] = np.full((len(dirs), norb), np.nan)
+        for ipressure, occ in occupation:
+            scalars["occupation"][ipressure, :len(occ)] = occ
+    np.savez(os.path.join(output, SCALARS), **scalars)
+    with open(os.path.join(output, INDEX), "w") as fw:
+        json.dump(index, fw, indent=1)
+    return index
+
+
+class SweepArchive:
+    """pack_sweep で作成したアーカイブを読み込む
+
+    Parameters
+    ----------
+    path : str
+        アーカイブのフォルダ
+
+    Examples
+    --------
+    >>> archive = SweepArchive("sweep_archive")
+    >>> archive.scalar("fermi_energy")          # E_F(p)
+    >>> archive.take("chi0q", iq)               # 全圧力での q=iq のχ0
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX), "r") as fr:
+            self.index = json.load(fr)
+        self.pressures = np.array(self.index["pressures"])
+        self._scalars = None
+
+    @property
+    def quantities(self):
+        return list(self.index["quantities"].keys())
+
+    def scalar(self, name):
+        """圧力ごとのスカラー量・小さな配列を返す
+
+        Parameters
+        ----------
+        name : str
+            pressure, fermi_energy, filling, occupation など
+
+        Returns
+        -------
+        ndarray
+            先頭の軸が圧力の配列
+        """
+        if self._scalars is None:
+            with np.load(os.path.join(self.path, SCALARS)) as data:
+                self._scalars = {key: data[key] for key in data.files}
+        return self._scalars[name]
+
+    def _info(self, quantity, ipressure):
+        return self.index["quantities"][quantity].get(str(ipressure))
+
+    def _chunk(self, quantity, ipressure, ichunk):
+        file_name = os.path.join(self.path, quantity, str(ipressure), "{}.npz".format(ichunk))
+        with np.load(file_name) as data:
+            return data["data"]
+
+    def get(self, quantity, ipressure):
+        """1つの圧力での配列全体を返す
+
+        Parameters
+        ----------
+        quantity : str
+            物理量の名前
+        ipressure : int
+            圧力の添字
+
+        Returns
+        -------
+        ndarray or None
+            配列。その圧力のデータがない場合はNone
+        """
+        info = self._info(quantity, ipressure)
+        if info is None:
+            return None
+        nchunk = -(-info["shape"][info["chunk_axis"]] // info["chunk_size"])
+        chunks = [self._chunk(quantity, ipressure, ichunk) for ichunk in range(nchunk)]
+        return np.concatenate(chunks, axis=info["chunk_axis"])
+
+    def take(self, quantity, index):
+        """全圧力について、チャンク軸の1つの添字のデータを取り出す
+
+        各圧力で該当する1チャンクのみを読み込む。
+
+        Parameters
+        ----------
+        quantity : str
+            物理量の名前
+        index : int
+            チャンク軸(波数点)の添字
+
+        Returns
+        -------
+        list of ndarray or None
+            圧力の順に並べたデータ。データのない圧力はNone
+        """
+        result = []
+        for ipressure in range(len(self.pressures)):
+            info = self._info(quantity, ipressure)
+            if info is None:
+                result.append(None)
+                continue
+            ichunk, offset = divmod(index, info["chunk_size"])
+            chunk = self._chunk(quantity, ipressure, ichunk)
+            result.append(np.take(chunk, offset, axis=info["chunk_axis"]))
+        return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=str, default=".", help="folder containing {pressure}GPa folders")
+    parser.add_argument("--output", type=str, default="sweep_archive", help="archive folder")
+    parser.add_argument("--chunk", type=int, default=1024, help="number of k/q points per chunk")
+    args = parser.parse_args()
+    index = pack_sweep(args.root, args.output, args.chunk)
+    print("Packed {} pressures: {}".format(len(index["pressures"]), ", ".join(index["quantities"].keys())))
@@ -0,0 +1,299 @@
+"""1つのχ0(q)から相互作用 U, J の格子についてRPA感受率をまとめて計算する
+
+calc_chi0.sh で作成した chi0q.npz は相互作用によらないため、このスクリプトは
+各 {pressure}GPa フォルダの chi0q.npz を一度だけ(振動数ごとに)読み込み、
+U, J の全ての組について χ_RPA(q, iω) = χ0 (1 + W χ0)^{-1} を計算します。
+U, J の組・波数・振動数をまとめた行列の一次方程式 (np.linalg.solve) として解くので、
+相互作用を変えるたびにH-waveのRPA計算をやり直す必要はありません。
+不安定性の指標として -W χ0 の最大固有値 λ (Stoner因子) を求め、λ = 1 となる U を
+臨界値とします (W = -U の1軌道模型では 1 - U χ0 = 0 に相当)。
+圧力ごとの計算はプロセスプールで並列に実行します。
+
+相互作用は同じ中心を持つ軌道を同じサイトとして、Kanamori型の密度-密度相互作用
+(同じ軌道・逆スピン U、異なる軌道・逆スピン U - 2J、異なる軌道・同じスピン U - 3J)とします。
+スピノルのWannier関数(SOIあり)では、各サイトの軌道は (軌道0↑, 軌道0↓, 軌道1↑, ...) の順に並ぶとします。
+軌道がスピンを含まない場合 (SOIなし) は、χ0 を1スピンあたりの感受率として、縦スピン感受率の
+相互作用 W = W↑↑ - W↑↓ (同じ軌道 -U、同じサイトの異なる軌道 -J) を使います。
+
+Parameters
+----------
+--root : str, optional
+    {pressure}GPa フォルダを含むフォルダ。デフォルトはカレントディレクトリ
+--input : str, optional
+    各圧力フォルダ内のH-wave入力ファイル名。デフォルトは "input_chi.toml"
+--U : float float int, optional
+    U の最小値・最大値・点の数(eV)。デフォルトは 0 4 41
+--J : float float int, optional
+    J の最小値・最大値・点の数(eV)。デフォルトは 0 0 1
+--freq : int ..., optional
+    計算する振動数の添字 (H-waveの freq_index の値 n、ν_n = (2n - Nmat)πT)。
+    デフォルトは静的成分 n = Nmat/2
+--spinor, --spinless : flag, optional
+    軌道にスピンが含まれる(SOIあり)か含まれないとして相互作用を作る。
+    省略時は入力ファイルの mode.param.enable_spin_orbital に従う
+--chunk : int, optional
+    一度に解く波数点の数。デフォルトは 1024
+--nproc : int, optional
+    並列プロセス数。デフォルトはCPUコア数
+
+Returns
+-------
+なし
+
+Notes
+-----
+入力ファイル
+-----------
+{pressure}GPa/input_chi.toml : RPA計算の入力ファイル
+    mode.param.CellShape, mode.param.Nmat, mode.param.enable_spin_orbital,
+    file.output.chi0q, file.input.interaction.Geometry を使用
+{pressure}GPa/{path_to_output}/{chi0q}.npz : χ0(q)
+{pressure}GPa/dir-model/zvo_geom.dat : 軌道の中心
+
+出力ファイル
+-----------
+{pressure}GPa/rpa_scan.npz : U, J ごとの結果
+    U, J : 相互作用の値。shape=(nU,), (nJ,)
+    freq_index : 計算した振動数の添字 n。shape=(nfreq,)
+    frequency : 松原振動数 ν_n(eV)。shape=(nfreq,)
+    stoner : -W χ0 の最大固有値 λ。shape=(nU, nJ, nfreq, nvol)
+    chi_trace : Σ_α χ_RPA,αα。shape=(nU, nJ, nfreq, nvol)
+    leading : 最初の振動数での λ の波数についての最大値。shape=(nU, nJ)
+    leading_q : λ が最大となる波数の添字 (ix, iy, iz)。shape=(nU, nJ, 3)
+{pressure}GPa/rpa_scan.pdf : λ の最大値の U, J 依存性
+rpa_scan.dat : 圧力と J ごとの臨界値 U_c と、その U での λ が最大となる波数の添字
+
+See Also
+--------
+hwave_io.py : H-waveの計算結果の読み込み
+nesting.py : フェルミ面のネスティング関数
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from hwave_io import (find_pressure_dirs, read_input, load_geometry, iter_chi0q, static_freq_index,
+                      matsubara_frequency, spin_orbital)
+
+
+def interaction_basis(centres, spinor=True, tol=1e-4):
+    """W = U W_U + J W_J となる係数行列を作る
+
+    Parameters
+    ----------
+    centres : ndarray
+        軌道の中心(分数座標)。shape=(norb, 3)
+    spinor : bool
+        Trueの場合、各サイトの軌道は (軌道0↑, 軌道0↓, 軌道1↑, ...) の順とする。
+        Falseの場合は縦スピン感受率の相互作用 W↑↑ - W↑↓ を返す
+    tol : float
+        同じサイトとみなす中心の距離
+
+    Returns
+    -------
+    W_U, W_J : ndarray
+        shape=(norb, norb)
+    """
+    norb = len(centres)
+    site = np.empty(norb, dtype=int)
+    local = np.empty(norb, dtype=int)
+    sites = []
+    for i, pos in enumerate(centres):
+        for isite, ref in enumerate(sites):
+            if np.allclose(pos, centres[ref], atol=tol):
+                break
+        else:
+            isite = len(sites)
+            sites.append(i)
+        site[i] = isite
+        local[i] = np.count_nonzero(site[:i] == isite)
+    if spinor:
+        orbital, spin = local // 2, local % 2
+    else:
+        orbital, spin = local, np.zeros(norb, dtype=int)
+    same_site = site[:, None] == site[None, :]
+    same_orbital = same_site & (orbital[:, None] == orbital[None, :])
+    same_spin = spin[:, None] == spin[None, :]
+    if spinor:
+        # 同じスピン軌道どうし(対角)には相互作用がない
+        W_U = (same_site & ~(same_orbital & same_spin)).astype(float)
+        W_J = np.where(same_site & ~same_orbital, np.where(same_spin, -3.0, -2.0), 0.0)
+    else:
+        # 同じ軌道: 0 - U、異なる軌道: (U - 3J) - (U - 2J)
+        W_U = np.where(same_orbital, -1.0, 0.0)
+        W_J = np.where(same_site & ~same_orbital, -1.0, 0.0)
+    return W_U, W_J
+
+
+def rpa_batch(chi0, W):
+    """相互作用の組と波数についてまとめてRPA感受率とStoner因子を計算する
+
+    Parameters
+    ----------
+    chi0 : ndarray
+        χ0。shape=(nq, nd, nd)
+    W : ndarray
+        相互作用。shape=(nW, nd, nd)
+
+    Returns
+    -------
+    chi_trace : ndarray
+        Σ_α χ_RPA,αα。shape=(nW, nq)。1 + W χ0 が特異(λ = 1)なら inf
+    stoner : ndarray
+        -W χ0 の固有値の実部の最大値。shape=(nW, nq)
+    """
+    W_chi0 = np.matmul(W[:, None], chi0[None])
+    nd = chi0.shape[-1]
+    # χ = χ0 (1 + W χ0)^{-1} を転置して (1 + W χ0)^T χ^T = χ0^T として解く
+    A = np.eye(nd) + W_chi0
+    B = np.broadcast_to(chi0.swapaxes(-1, -2), A.shape)
+    try:
+        chi_trace = np.trace(np.linalg.solve(A.swapaxes(-1, -2), B), axis1=-2, axis2=-1)
+    except np.linalg.LinAlgError:
+        # 臨界点ちょうどの U では特異になるので、行列ごとに解き直す
+        chi_trace = np.full(A.shape[:-2], np.inf, dtype=complex)
+        for index in np.ndindex(*A.shape[:-2]):
+            try:
+                chi_trace[index] = np.trace(np.linalg.solve(A[index].T, B[index]))
+            except np.linalg.LinAlgError:
+                pass
+    stoner = np.linalg.eigvals(-W_chi0).real.max(axis=-1)
+    return chi_trace, stoner
+
+
+def critical_u(U, leading):
+    """λ = 1 となる U を線形補間で求める。範囲内で λ < 1 ならNaN
+
+    Returns
+    -------
+    U_c : float
+    index : int
+        λ が初めて1以上になる U の添字(なければ -1)
+    """
+    above = np.flatnonzero(leading >= 1.0)
+    if above.size == 0:
+        return np.nan, -1
+    i = above[0]
+    if i == 0:
+        return U[0], 0
+    t = (1.0 - leading[i - 1]) / (leading[i] - leading[i - 1])
+    return U[i - 1] + t * (U[i] - U[i - 1]), i
+
+
+def plot(U, J, leading, output_file):
+    """λ の最大値の U, J 依存性をプロットする"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    ncol = 2 if len(J) > 1 else 1
+    fig, axes = plt.subplots(1, ncol, figsize=(5 * ncol, 4), squeeze=False)
+    ax = axes[0, 0]
+    for iJ, value in enumerate(J):
+        ax.plot(U, leading[:, iJ], label="J = {:.3g}".format(value))
+    ax.axhline(1.0, color="gray", linestyle="--")
+    ax.set_xlabel("U (eV)")
+    ax.set_ylabel(r"$\lambda_{\max}$")
+    ax.legend()
+    if ncol == 2:
+        ax = axes[0, 1]
+        image = ax.pcolormesh(U, J, leading.T, shading="nearest", rasterized=True)
+        if leading.min() < 1.0 < leading.max():
+            ax.contour(U, J, leading.T, levels=[1.0], colors="white")
+        fig.colorbar(image, ax=ax, label=r"$\lambda_{\max}$")
+        ax.set_xlabel("U (eV)")
+        ax.set_ylabel("J (eV)")
+    fig.tight_layout()
+    fig.savefig(output_file, format="pdf", dpi=300)
+    plt.close(fig)
+
+
+def process_pressure(path, input_file, U, J, freq=None, spinor=None, chunk=1024):
+    """1つの圧力フォルダで U, J の格子についてRPA感受率を計算し、保存・プロットする
+
+    freq が None なら静的成分、spinor が None なら mode.param.enable_spin_orbital を使う。
+
+    Returns
+    -------
+    path : str
+        圧力フォルダ
+    U_c : ndarray
+        J ごとの臨界値。shape=(nJ,)
+    q_c : ndarray
+        J ごとの U_c での λ が最大となる波数の添字。shape=(nJ, 3)
+    """
+    input_dict = read_input(os.path.join(path, input_file))
+    shape = tuple(input_dict["mode"]["param"]["CellShape"])
+    nvol = int(np.prod(shape))
+    if freq is None:
+        freq = [static_freq_index(input_dict)]
+    if spinor is None:
+        spinor = spin_orbital(input_dict)
+    W_U, W_J = interaction_basis(load_geometry(input_dict, path)[1], spinor)
+    UU, JJ = np.meshgrid(U, J, indexing="ij")
+    W = UU.ravel()[:, None, None] * W_U + JJ.ravel()[:, None, None] * W_J
+
+    freq_done = []
+    stoner = []
+    chi_trace = []
+    for value, chi0 in iter_chi0q(input_dict, path, freq):
+        if chi0.shape[-1] != len(W_U):
+            raise ValueError("chi0q has {} orbitals but zvo_geom.dat has {}".format(chi0.shape[-1], len(W_U)))
+        s = np.empty((len(W), nvol))
+        c = np.empty((len(W), nvol), dtype=complex)
+        for start in range(0, nvol, chunk):
+            sl = slice(start, start + chunk)
+            c[:, sl], s[:, sl] = rpa_batch(chi0[sl], W)
+        freq_done.append(value)
+        stoner.append(s.reshape(len(U), len(J), nvol))
+        chi_trace.append(c.reshape(len(U), len(J), nvol))
+    if not freq_done:
+        raise ValueError("No matching frequency in chi0q of {}".format(path))
+    stoner = np.stack(stoner, axis=2)
+    chi_trace = np.stack(chi_trace, axis=2)
+    leading = stoner[:, :, 0].max(axis=-1)
+    leading_q = np.stack(np.unravel_index(stoner[:, :, 0].argmax(axis=-1), shape), axis=-1)
+
+    U_c = np.full(len(J), np.nan)
+    q_c = np.full((len(J), 3), -1)
+    for iJ in range(len(J)):
+        U_c[iJ], iU = critical_u(U, leading[:, iJ])
+        if iU >= 0:
+            q_c[iJ] = leading_q[iU, iJ]
+    np.savez(os.path.join(path, "rpa_scan.npz"), U=U, J=J, freq_index=np.array(freq_done),
+             frequency=matsubara_frequency(input_dict, freq_done),
+             stoner=stoner, chi_trace=chi_trace, leading=leading, leading_q=leading_q)
+    plot(U, J, leading, os.path.join(path, "rpa_scan.pdf"))
+    return path, U_c, q_c
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=str, default=".", help="folder containing {pressure}GPa folders")
+    parser.add_argument("--input", type=str, default="input_chi.toml", help="input file of hwave in each folder")
+    parser.add_argument("--U", type=float, nargs=3, default=[0.0, 4.0, 41], help="min, max and number of U")
+    parser.add_argument("--J", type=float, nargs=3, default=[0.0, 0.0, 1], help="min, max and number of J")
+    parser.add_argument("--freq", type=int, nargs="+", default=None,
+                        help="frequency indices n of hwave (default: static index Nmat/2)")
+    spin = parser.add_mutually_exclusive_group()
+    spin.add_argument("--spinor", dest="spinor", action="store_true", default=None, help="orbitals include spin")
+    spin.add_argument("--spinless", dest="spinor", action="store_false", help="orbitals do not include spin")
+    parser.add_argument("--chunk", type=int, default=1024, help="number of q points per solve")
+    parser.add_argument("--nproc", type=int, default=None, help="number of processes")
+    args = parser.parse_args()
+
+    U = np.linspace(args.U[0], args.U[1], int(args.U[2]))
+    J = np.linspace(args.J[0], args.J[1], int(args.J[2]))
+    dirs = [(p, d) for p, d in find_pressure_dirs(args.root) if os.path.isfile(os.path.join(d, args.input))]
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.nproc) as executor:
+        futures = [executor.submit(process_pressure, d, args.input, U, J, args.freq, args.spinor, args.chunk)
+                   for _, d in dirs]
+        for (pressure, _), future in zip(dirs, futures):
+            path, U_c, q_c = future.result()
+            for value, u_c, q in zip(J, U_c, q_c):
+                rows.append([pressure, value, u_c, *q])
+                print("{}: J = {:.3f}, U_c = {:.4f}, q = ({}, {}, {})".format(path, value, u_c, *q))
+    np.savetxt("rpa_scan.dat", np.array(rows).reshape(-1, 6), header="pressure J U_c iqx iqy iqz")
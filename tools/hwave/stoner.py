@@ -0,0 +1,218 @@
+"""静的χ0(q)の最大固有値から臨界相互作用と秩序ベクトルを求める
+
+1 - U χ0(q) が最初に0になる U と q を chi0q_line.dat の図から読み取る代わりに、
+このスクリプトは各 {pressure}GPa フォルダの chi0q.npz から静的成分 (ν = 0) の χ0(q) だけを読み込み、
+全ての q について -W χ0(q) の最大固有値 λ1(q) をまとめたべき乗法で求めます
+(W は rpa_scan.py と同じKanamori型の相互作用で、U = 1 eV とした行列)。
+全ての行列を対角化する必要はなく、収束していない q だけを反復します。Gershgorinの定理による
+λ1(q) の上限がその時点の最大値より小さい q は、最大値になりえないので計算を省きます。
+λ は U に比例するので、臨界値は U_c = 1 / max_q λ1(q)、秩序ベクトルは λ1 が最大となる q です。
+圧力ごとの計算はプロセスプールで並列に実行します。
+
+Parameters
+----------
+--root : str, optional
+    {pressure}GPa フォルダを含むフォルダ。デフォルトはカレントディレクトリ
+--input : str, optional
+    各圧力フォルダ内のH-wave入力ファイル名。デフォルトは "input_chi.toml"
+--J_ratio : float, optional
+    J / U。デフォルトは 0
+--spinor, --spinless : flag, optional
+    軌道にスピンが含まれる(SOIあり)か含まれないとして相互作用を作る。
+    省略時は入力ファイルの mode.param.enable_spin_orbital に従う
+--tol : float, optional
+    べき乗法の収束判定(残差)。デフォルトは 1e-8
+--max_iter : int, optional
+    べき乗法の最大反復回数。収束しなかった q は対角化する。デフォルトは 500
+--check : flag, optional
+    指定すると全ての q を対角化した結果と比較し、それぞれの計算時間を表示する
+--nproc : int, optional
+    並列プロセス数。デフォルトはCPUコア数
+
+Returns
+-------
+なし
+
+Notes
+-----
+入力ファイル
+-----------
+{pressure}GPa/input_chi.toml : RPA計算の入力ファイル
+    mode.param.CellShape, mode.param.Nmat, mode.param.enable_spin_orbital を使用
+{pressure}GPa/{path_to_output}/{chi0q}.npz : χ0(q)。静的成分 freq_index = Nmat/2 を使う
+{pressure}GPa/dir-model/zvo_geom.dat : 軌道の中心
+
+出力ファイル
+-----------
+{pressure}GPa/stoner.npz : λ1(q)
+    lambda1 : U = 1 eV での -W χ0(q) の最大固有値。shape=(Lx, Ly, Lz)
+        Gershgorinの上限が最大値より小さく、計算を省いた q は NaN
+    vector : 最大固有値の固有ベクトル(秩序の軌道成分)。shape=(Lx, Ly, Lz, nd)。省いた q は NaN
+stoner.dat : 圧力ごとの U_c と秩序ベクトル
+    各行に pressure U_c iqx iqy iqz qx qy qz の形式で出力 (q は逆格子ベクトル単位)
+
+See Also
+--------
+rpa_scan.py : U, J の格子についてのRPA感受率
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from hwave_io import find_pressure_dirs, read_input, load_geometry, iter_chi0q, static_freq_index, spin_orbital
+from rpa_scan import interaction_basis
+
+
+def leading_eigenvalue(M, tol=1e-8, max_iter=500, nseed=8):
+    """行列の組の実部が最大の固有値のうち、全体で最大のものをべき乗法で求める
+
+    固有値が実数であることを仮定する (W が対称で χ0 がエルミートなら W χ0 の固有値は実数)。
+    Gershgorinの定理による下限 s でスペクトルを非負にずらし、絶対値が最大の固有値と
+    実部が最大の固有値を一致させる (下限が正ならずらさない)。
+    必要なのは q についての最大値だけなので、上限の大きい nseed 個の q を対角化して
+    暫定の最大値を求め、Gershgorinの上限がそれより小さい q は反復の途中でも捨てる。
+
+    Parameters
+    ----------
+    M : ndarray
+        行列。shape=(nq, nd, nd)
+    tol : float
+        残差 |A v - w v| の収束判定 (|w| との比)
+    max_iter : int
+        最大反復回数。収束しなかった行列は np.linalg.eig で対角化する
+    nseed : int
+        最初に対角化する q の数
+
+    Returns
+    -------
+    w : ndarray
+        最大固有値。捨てた q は NaN。shape=(nq,)
+    v : ndarray
+        規格化した固有ベクトル。捨てた q は NaN。shape=(nq, nd)
+    niter : int
+        反復回数
+    """
+    nq, nd, _ = M.shape
+    diag = M.diagonal(axis1=1, axis2=2).real
+    radius = np.abs(M).sum(axis=2) - np.abs(diag)
+    upper = (diag + radius).max(axis=1)
+    shift = np.maximum(-(diag - radius).min(axis=1), 0.0)
+    w = np.full(nq, np.nan)
+    v = np.full((nq, nd), np.nan, dtype=complex)
+
+    def diagonalize(index):
+        ew, ev = np.linalg.eig(M[index])
+        imax = ew.real.argmax(axis=1)
+        w[index] = ew.real[np.arange(len(index)), imax]
+        vec = ev[np.arange(len(index)), :, imax]
+        v[index] = vec / np.linalg.norm(vec, axis=1, keepdims=True)
+
+    seed = np.argsort(upper)[-nseed:]
+    diagonalize(seed)
+    best = w[seed].max()
+    active = np.setdiff1d(np.flatnonzero(upper >= best), seed)
+    A = M[active] + shift[active, None, None] * np.eye(nd)
+    x = np.full((len(active), nd), 1.0 / np.sqrt(nd), dtype=complex)
+    # 固有ベクトルが初期ベクトルと直交する場合に備えて乱数を加える
+    x += 1e-3 * np.random.default_rng(0).standard_normal(x.shape)
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    niter = 0
+    for niter in range(1, max_iter + 1):
+        if active.size == 0:
+            break
+        Ax = np.einsum("qij,qj->qi", A, x)
+        rayleigh = np.einsum("qi,qi->q", x.conj(), Ax).real
+        # 残差 |A x - w x| で収束を判定する
+        residual = np.linalg.norm(Ax - rayleigh[:, None] * x, axis=1)
+        converged = residual <= tol * np.maximum(np.abs(rayleigh), 1.0)
+        x = Ax / np.linalg.norm(Ax, axis=1, keepdims=True)
+        done = active[converged]
+        w[done] = rayleigh[converged] - shift[done]
+        v[done] = x[converged]
+        if done.size > 0:
+            best = max(best, w[done].max())
+        keep = ~converged & (upper[active] >= best)
+        active, A, x = active[keep], A[keep], x[keep]
+    if active.size > 0:
+        diagonalize(active)
+    return w, v, niter
+
+
+def process_pressure(path, input_file="input_chi.toml", J_ratio=0.0, spinor=None, tol=1e-8, max_iter=500,
+                     check=False):
+    """1つの圧力フォルダで λ1(q) を計算し、U_c と秩序ベクトルを求める
+
+    spinor が None なら mode.param.enable_spin_orbital を使う。
+
+    Returns
+    -------
+    path : str
+        圧力フォルダ
+    U_c : float
+        臨界値 (λ1 が正にならなければ inf)
+    iq : tuple of int
+        秩序ベクトルの添字 (ix, iy, iz)
+    elapsed : float
+        計算時間(秒)
+    """
+    start = time.perf_counter()
+    input_dict = read_input(os.path.join(path, input_file))
+    shape = tuple(input_dict["mode"]["param"]["CellShape"])
+    if spinor is None:
+        spinor = spin_orbital(input_dict)
+    W_U, W_J = interaction_basis(load_geometry(input_dict, path)[1], spinor)
+    W = W_U + J_ratio * W_J
+    for _, chi0 in iter_chi0q(input_dict, path, freq=[static_freq_index(input_dict)]):
+        break
+    else:
+        raise ValueError("chi0q of {} has no static component".format(path))
+    M = -np.matmul(W, chi0)
+    t0 = time.perf_counter()
+    lambda1, vector, niter = leading_eigenvalue(M, tol, max_iter)
+    t1 = time.perf_counter()
+    if check:
+        exact = np.linalg.eigvals(M).real.max(axis=1)
+        t2 = time.perf_counter()
+        done = ~np.isnan(lambda1)
+        print("{}: {} iterations, {} of {} q points kept, max deviation from eig = {:.3e}, "
+              "max_q deviation = {:.3e}".format(path, niter, int(done.sum()), len(done),
+                                                np.abs(exact[done] - lambda1[done]).max(),
+                                                abs(exact.max() - np.nanmax(lambda1))))
+        print("{}: power iteration {:.3f} s, np.linalg.eigvals {:.3f} s".format(path, t1 - t0, t2 - t1))
+    iq = np.unravel_index(np.nanargmax(lambda1), shape)
+    U_c = 1.0 / np.nanmax(lambda1) if np.nanmax(lambda1) > 0 else np.inf
+    np.savez(os.path.join(path, "stoner.npz"), lambda1=lambda1.reshape(shape),
+             vector=vector.reshape(shape + (-1,)))
+    return path, U_c, tuple(int(i) for i in iq), time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=str, default=".", help="folder containing {pressure}GPa folders")
+    parser.add_argument("--input", type=str, default="input_chi.toml", help="input file of hwave in each folder")
+    parser.add_argument("--J_ratio", type=float, default=0.0, help="J / U")
+    spin = parser.add_mutually_exclusive_group()
+    spin.add_argument("--spinor", dest="spinor", action="store_true", default=None, help="orbitals include spin")
+    spin.add_argument("--spinless", dest="spinor", action="store_false", help="orbitals do not include spin")
+    parser.add_argument("--tol", type=float, default=1e-8, help="convergence threshold of power iteration")
+    parser.add_argument("--max_iter", type=int, default=500, help="maximum number of iterations")
+    parser.add_argument("--check", action="store_true", help="compare with full diagonalization")
+    parser.add_argument("--nproc", type=int, default=None, help="number of processes")
+    args = parser.parse_args()
+
+    dirs = [(p, d) for p, d in find_pressure_dirs(args.root) if os.path.isfile(os.path.join(d, args.input))]
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.nproc) as executor:
+        futures = [executor.submit(process_pressure, d, args.input, args.J_ratio, args.spinor,
+                                   args.tol, args.max_iter, args.check) for _, d in dirs]
+        for (pressure, _), future in zip(dirs, futures):
+            path, U_c, iq, elapsed = future.result()
+            shape = read_input(os.path.join(path, args.input))["mode"]["param"]["CellShape"]
+            q = [i / n for i, n in zip(iq, shape)]
+            rows.append([pressure, U_c, *iq, *q])
+            print("{}: U_c = {:.4f} eV, q = ({:.3f}, {:.3f}, {:.3f}) ({:.2f} s)".format(path, U_c, *q, elapsed))
+    np.savetxt("stoner.dat", np.array(rows).reshape(-1, 8), header="pressure U_c iqx iqy iqz qx qy qz")
@@ -0,0 +1,176 @@
+"""全圧力の固有値・グリーン関数をまとめて解析する
+
+このスクリプトは、各 {pressure}GPa フォルダの eigen.npz と green.npz を
+先頭の軸が圧力の配列として(初めて使われたときに)読み込み、
+フェルミエネルギーとそのシフト、バンドの底・頂上のエネルギー、軌道ごとの占有数、
+kz=0 でのフェルミ面の占有面積を全圧力について一度にベクトル計算し、
+1つの表として出力します。calc_fs_2d.py を圧力ごとに実行して標準出力を
+読み取る必要はありません。
+
+Parameters
+----------
+--root : str, optional
+    {pressure}GPa フォルダを含むフォルダ。デフォルトはカレントディレクトリ
+--input : str, optional
+    各圧力フォルダ内のH-wave入力ファイル名。デフォルトは "input.toml"
+--output : str, optional
+    出力ファイル名。デフォルトは "sweep_observables.dat"
+
+Returns
+-------
+なし
+
+Notes
+-----
+入力ファイル
+-----------
+{pressure}GPa/input.toml : UHFk計算の入力ファイル
+    全圧力で CellShape が同じである必要があります
+{pressure}GPa/{path_to_output}/{eigen}.npz : 固有値
+{pressure}GPa/{path_to_output}/{green}.npz : 一体グリーン関数(任意)
+
+出力ファイル
+-----------
+sweep_observables.dat : 圧力ごとの物理量の表
+    pressure E_F dE_F bottom_{n} top_{n} area_{n} N_{i} の列
+    bottom, top は E_F 基準、area は kz=0 面で E < E_F となる割合
+
+Examples
+--------
+>>> sweep = PressureSweep(".")
+>>> sweep.fermi_energy()          # shape=(npressure,)
+>>> sweep.band_bottom()           # shape=(npressure, norb)
+
+See Also
+--------
+hwave_io.py : H-waveの計算結果の読み込み
+calc_fs_2d.py : 2次元フェルミ面を計算・プロットする
+"""
+
+import argparse
+import os
+from functools import cached_property
+
+import numpy as np
+
+from hwave_io import find_pressure_dirs, read_input, load_eigen, load_green, output_path
+
+
+class PressureSweep:
+    """全圧力のH-wave計算結果を圧力軸付きの配列として扱う
+
+    Parameters
+    ----------
+    root : str
+        {pressure}GPa フォルダを含むフォルダ
+    input_file : str
+        各圧力フォルダ内のH-wave入力ファイル名
+    """
+
+    def __init__(self, root=".", input_file="input.toml"):
+        self.dirs = [(p, d) for p, d in find_pressure_dirs(root)
+                     if os.path.isfile(os.path.join(d, input_file))]
+        self.pressures = np.array([p for p, _ in self.dirs])
+        self.inputs = [read_input(os.path.join(d, input_file)) for _, d in self.dirs]
+        self.filling = np.array([info["mode"]["param"]["filling"] for info in self.inputs])
+        shapes = {tuple(info["mode"]["param"]["CellShape"]) for info in self.inputs}
+        if len(shapes) > 1:
+            raise ValueError("CellShape differs between pressures: {}".format(shapes))
+
+    @cached_property
+    def eigenvalues(self):
+        """固有値。shape=(npressure, Lx, Ly, Lz, norb)"""
+        return np.stack([load_eigen(info, d)[0] for info, (_, d) in zip(self.inputs, self.dirs)])
+
+    @cached_property
+    def green(self):
+        """一体グリーン関数。green.npz がない圧力は NaN で埋める"""
+        greens = []
+        for info, (_, d) in zip(self.inputs, self.dirs):
+            greens.append(load_green(info, d) if os.path.isfile(output_path(info, "green", d)) else None)
+        shape = next(g.shape for g in greens if g is not None)
+        return np.stack([g if g is not None else np.full(shape, np.nan) for g in greens])
+
+    @cached_property
+    def _fermi_energy(self):
+        flat = self.eigenvalues.reshape(len(self.pressures), -1)
+        idx = (flat.shape[1] * self.filling).astype(int)
+        if np.all(idx == idx[0]):
+            return np.partition(flat, idx[0], axis=1)[:, idx[0]]
+        return np.array([np.partition(row, i)[i] for row, i in zip(flat, idx)])
+
+    def fermi_energy(self):
+        """フェルミエネルギー。shape=(npressure,)"""
+        return self._fermi_energy
+
+    def fermi_energy_shift(self):
+        """最低圧力を基準としたフェルミエネルギーのシフト。shape=(npressure,)"""
+        ene_f = self.fermi_energy()
+        return ene_f - ene_f[0]
+
+    def band_bottom(self):
+        """E_F基準の各バンドの底のエネルギー。shape=(npressure, norb)"""
+        return self.eigenvalues.min(axis=(1, 2, 3)) - self.fermi_energy()[:, None]
+
+    def band_top(self):
+        """E_F基準の各バンドの頂上のエネルギー。shape=(npressure, norb)"""
+        return self.eigenvalues.max(axis=(1, 2, 3)) - self.fermi_energy()[:, None]
+
+    def occupation(self):
+        """各軌道の占有数。shape=(npressure, norb)"""
+        green = self.green
+        norb = green.shape[3]
+        idx = np.arange(norb)
+        return green[:, 0, 0, idx, 0, idx].real * 2
+
+    def fermi_area(self):
+        """kz=0 面でE < E_F となる波数点の割合(フェルミ面の内側の面積/BZ面積)
+
+        Returns
+        -------
+        ndarray
+            shape=(npressure, norb)
+        """
+        ene_f = self.fermi_energy()
+        return (self.eigenvalues[:, :, :, 0, :] < ene_f[:, None, None, None]).mean(axis=(1, 2))
+
+    def table(self):
+        """全物理量を列とする表を作成する
+
+        Returns
+        -------
+        names : list of str
+            列の名前
+        values : ndarray
+            shape=(npressure, ncolumn)
+        """
+        columns = [("pressure", self.pressures[:, None]),
+                   ("E_F", self.fermi_energy()[:, None]),
+                   ("dE_F", self.fermi_energy_shift()[:, None]),
+                   ("bottom", self.band_bottom()),
+                   ("top", self.band_top()),
+                   ("area", self.fermi_area())]
+        if any(os.path.isfile(output_path(info, "green", d)) for info, (_, d) in zip(self.inputs, self.dirs)):
+            columns.append(("N", self.occupation()))
+        names = []
+        for name, value in columns:
+            if value.shape[1] == 1:
+                names.append(name)
+            else:
+                names += ["{}_{}".format(name, i) for i in range(value.shape[1])]
+        return names, np.hstack([value for _, value in columns])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=str, default=".", help="folder containing {pressure}GPa folders")
+    parser.add_argument("--input", type=str, default="input.toml", help="input file of hwave in each folder")
+    parser.add_argument("--output", type=str, default="sweep_observables.dat", help="output file")
+    args = parser.parse_args()
+
+    sweep = PressureSweep(args.root, args.input)
+    names, values = sweep.table()
+    np.savetxt(args.output, values, header=" ".join(names))
+    print(" ".join("{:>12}".format(name) for name in names))
+    for row in values:
+        print(" ".join("{:12.6f}".format(v) for v in row))
@@ -0,0 +1,221 @@
+"""四面体法で状態密度とフェルミ準位での状態密度を計算する
+
+このスクリプトは、H-waveの固有値 eigen.npz を周期的な (Lx, Ly, Lz, norb) の格子とみなし、
+線形四面体法で状態密度(DOS)とフェルミ準位での状態密度 N(E_F) を計算します。
+各立方体を6個の四面体に分割したときの頂点の添字表は格子の形ごとに一度だけ作成し、
+四面体はチャンクごとに処理してメモリ使用量を抑えます。
+固有ベクトルが eigen.npz に含まれていれば、軌道ごとの射影状態密度も計算します。
+
+Parameters
+----------
+--input : str, optional
+    入力ファイルのパス。デフォルトは "input.toml"
+--emin, --emax : float, optional
+    E_F基準のエネルギー範囲(eV)。デフォルトは -2.0, 2.0
+--ne : int, optional
+    エネルギーの点数。デフォルトは 801
+--chunk : int, optional
+    一度に処理する四面体の数。デフォルトは 65536
+--project : flag, optional
+    指定すると軌道ごとの射影状態密度も計算する
+
+Returns
+-------
+なし
+
+Notes
+-----
+入力ファイル
+----------
+input.toml : H-waveの入力ファイル
+    mode.param.CellShape, mode.param.filling, file.output.eigen を使用
+
+出力ファイル
+----------
+dos.dat : 状態密度
+    各行に E-E_F DOS_total DOS_orb0 DOS_orb1 ... の形式で出力
+    DOSは単位胞・1eVあたりの状態数(各バンドの積分値が1)
+
+See Also
+--------
+hwave_io.py : H-waveの計算結果の読み込み
+"""
+
+import argparse
+import itertools
+from functools import lru_cache
+
+import numpy as np
+
+from hwave_io import read_input, load_eigen, fermi_energy
+
+# 立方体の頂点番号 c = 4*dx + 2*dy + dz に対し、対角線 0-7 を共有する6個の四面体
+TETRA_IN_CUBE = [(0, 1, 3, 7), (0, 1, 5, 7), (0, 2, 3, 7),
+                 (0, 2, 6, 7), (0, 4, 5, 7), (0, 4, 6, 7)]
+
+
+@lru_cache(maxsize=None)
+def tetrahedron_corners(shape):
+    """周期的な格子上の四面体の頂点の添字表を作成する
+
+    Parameters
+    ----------
+    shape : tuple of int
+        格子の形 (Lx, Ly, Lz)
+
+    Returns
+    -------
+    ndarray
+        各四面体の4頂点の、平坦化した波数点の添字。shape=(6*Lx*Ly*Lz, 4)
+    """
+    Lx, Ly, Lz = shape
+    ix, iy, iz = np.meshgrid(np.arange(Lx), np.arange(Ly), np.arange(Lz), indexing="ij")
+    corners = np.empty((Lx * Ly * Lz, 8), dtype=np.int64)
+    for c, (dx, dy, dz) in enumerate(itertools.product((0, 1), repeat=3)):
+        corners[:, c] = ((((ix + dx) % Lx) * Ly + (iy + dy) % Ly) * Lz + (iz + dz) % Lz).ravel()
+    tetra = corners[:, TETRA_IN_CUBE].reshape(-1, 4)
+    tetra.flags.writeable = False
+    return tetra
+
+
+def _dos_weight(E, e1, e2, e3, e4):
+    """1つの四面体の状態密度(積分値が1になるように規格化)
+
+    3つの場合の多項式を全て評価してから選ぶ。選ばれない場合の分母が0になることがあるので
+    その警告は無視する。
+    """
+    e21, e31, e41 = e2 - e1, e3 - e1, e4 - e1
+    e32, e42, e43 = e3 - e2, e4 - e2, e4 - e3
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = E - e2
+        g1 = 3.0 * (E - e1) ** 2 / (e21 * e31 * e41)
+        g2 = (3.0 * e21 + 6.0 * x - 3.0 * (e31 + e42) * x ** 2 / (e32 * e42)) / (e31 * e41)
+        g3 = 3.0 * (e4 - E) ** 2 / (e41 * e42 * e43)
+    return np.where(E < e2, g1, np.where(E < e3, g2, g3))
+
+
+def _section_average(E, e, f):
+    """等エネルギー断面上での線形補間した重みの平均値
+
+    断面の頂点(四面体の辺との交点)での値の平均で近似する。
+
+    Parameters
+    ----------
+    E : ndarray
+        エネルギー。shape=(n,)
+    e : ndarray
+        昇順に並べた頂点のエネルギー。shape=(n, 4)
+    f : ndarray
+        e と同じ順に並べた頂点の重み。shape=(n, 4, nproj)
+
+    Returns
+    -------
+    ndarray
+        shape=(n, nproj)
+    """
+    e1, e2, e3, e4 = e.T
+    f1, f2, f3, f4 = f[:, 0], f[:, 1], f[:, 2], f[:, 3]
+    avg = np.empty(f1.shape)
+    m = E < e2
+    t = (E[m, None] - e1[m, None]) / (e[m, 1:] - e1[m, None])
+    avg[m] = f1[m] + np.einsum("nj,njp->np", t, f[m, 1:] - f1[m, None]) / 3.0
+    m = E >= e3
+    t = (e4[m, None] - E[m, None]) / (e4[m, None] - e[m, :3])
+    avg[m] = f4[m] + np.einsum("nj,njp->np", t, f[m, :3] - f4[m, None]) / 3.0
+    m = (E >= e2) & (E < e3)
+    x1, x2 = (E[m] - e1[m])[:, None], (E[m] - e2[m])[:, None]
+    avg[m] = (f1[m] + x1 / (e3 - e1)[m, None] * (f3[m] - f1[m])
+              + f1[m] + x1 / (e4 - e1)[m, None] * (f4[m] - f1[m])
+              + f2[m] + x2 / (e3 - e2)[m, None] * (f3[m] - f2[m])
+              + f2[m] + x2 / (e4 - e2)[m, None] * (f4[m] - f2[m])) / 4.0
+    return avg
+
+
+def tetra_dos(eigenvalues, energies, weights=None, chunk=65536):
+    """線形四面体法で状態密度を計算する
+
+    Parameters
+    ----------
+    eigenvalues : ndarray
+        固有値。shape=(Lx, Ly, Lz, nband)
+    energies : ndarray
+        状態密度を求めるエネルギー(昇順)。shape=(ne,)
+    weights : ndarray, optional
+        各波数点・バンドの射影の重み。shape=(Lx, Ly, Lz, nproj, nband)
+    chunk : int
+        一度に処理する四面体の数
+
+    Returns
+    -------
+    dos : ndarray
+        全状態密度。shape=(ne,)
+    pdos : ndarray or None
+        射影状態密度。shape=(nproj, ne)。weights が None の場合は None
+    """
+    energies = np.asarray(energies, dtype=float)
+    Lx, Ly, Lz, nband = eigenvalues.shape
+    eig = eigenvalues.reshape(-1, nband)
+    tetra = tetrahedron_corners((Lx, Ly, Lz))
+    ntetra = len(tetra)
+    ne = len(energies)
+    dos = np.zeros(ne)
+    pdos = None
+    if weights is not None:
+        nproj = weights.shape[-2]
+        weights = weights.reshape(-1, nproj, nband)
+        pdos = np.zeros((nproj, ne))
+
+    for start in range(0, ntetra, chunk):
+        idx = tetra[start:start + chunk]
+        # (四面体, バンド) の組ごとに頂点のエネルギーを昇順に並べる
+        e = np.moveaxis(eig[idx], 2, 1).reshape(-1, 4)
+        order = np.argsort(e, axis=1)
+        e = np.take_along_axis(e, order, axis=1)
+        # e1 < E < e4 となるエネルギー点だけを展開する
+        lo = np.searchsorted(energies, e[:, 0], side="right")
+        hi = np.searchsorted(energies, e[:, 3], side="left")
+        count = np.maximum(hi - lo, 0)
+        if count.sum() == 0:
+            continue
+        item = np.repeat(np.arange(len(e)), count)
+        ie = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count) + lo[item]
+        E = energies[ie]
+        ei = e[item]
+        g = _dos_weight(E, *ei.T) / ntetra
+        dos += np.bincount(ie, weights=g, minlength=ne)
+        if weights is not None:
+            f = np.moveaxis(weights[idx], 3, 1).reshape(-1, 4, nproj)
+            f = np.take_along_axis(f, order[:, :, None], axis=1)
+            avg = _section_average(E, ei, f[item])
+            for p in range(nproj):
+                pdos[p] += np.bincount(ie, weights=g * avg[:, p], minlength=ne)
+    return dos, pdos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, default="input.toml", help="input file of hwave")
+    parser.add_argument("--emin", type=float, default=-2.0, help="lower energy relative to E_F")
+    parser.add_argument("--emax", type=float, default=2.0, help="upper energy relative to E_F")
+    parser.add_argument("--ne", type=int, default=801, help="number of energy points")
+    parser.add_argument("--chunk", type=int, default=65536, help="number of tetrahedra per chunk")
+    parser.add_argument("--project", action="store_true", help="compute orbital-projected DOS")
+    args = parser.parse_args()
+
+    input_dict = read_input(args.input)
+    eigenvalues, eigenvectors = load_eigen(input_dict, with_vector=args.project)
+    ene_f = fermi_energy(eigenvalues, input_dict["mode"]["param"]["filling"])
+    eigenvalues = eigenvalues - ene_f
+    weights = None
+    if args.project:
+        if eigenvectors is None:
+            raise ValueError("eigenvector is not found in the eigen file")
+        weights = np.abs(eigenvectors) ** 2
+    energies = np.linspace(args.emin, args.emax, args.ne)
+    dos, pdos = tetra_dos(eigenvalues, energies, weights, args.chunk)
+    dos_f, _ = tetra_dos(eigenvalues, np.array([0.0]), None, args.chunk)
+    print("E_F = {}".format(ene_f))
+    print("N(E_F) = {}".format(dos_f[0]))
+    columns = [energies, dos] + ([] if pdos is None else list(pdos))
+    np.savetxt("dos.dat", np.column_stack(columns), header="E-E_F DOS_total" +
+               ("" if pdos is None else "".join(" DOS_orb{}".format(i) for i in range(len(pdos)))))
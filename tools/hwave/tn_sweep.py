@@ -0,0 +1,244 @@
+"""1組の固有値から温度とフィリングの格子について E_F, 占有数, N(E_F) をまとめて計算する
+
+input.toml の T と filling は1回の計算で固定なので、ドープ量や温度を変えるたびに
+H-waveと calc_fs_2d.py を実行し直す必要があります。このスクリプトは、各 {pressure}GPa
+フォルダの eigen.npz を一度だけ読み込み、T と filling の全ての組について
+化学ポテンシャル E_F(T, n)、軌道ごとの占有数、状態密度 N(E_F) を計算します。
+
+T = 0 の E_F は calc_fs_2d.py と同じく、ソートした全固有値の int(N*n) 番目の値です。
+T > 0 では、固有値(と軌道の重み)を細かいビンのヒストグラムにまとめ、
+全ての (T, n) の組についてフェルミ関数をブロードキャストして二分法で E_F を求めます。
+ヒストグラムのビン幅は最小の温度の1/10以下にします。一度に計算する (T, n) の組の数は
+--memory で指定した大きさに収まるように決め、固有ベクトルはチャンクごとに読み込みます。
+
+Parameters
+----------
+--root : str, optional
+    {pressure}GPa フォルダを含むフォルダ。デフォルトはカレントディレクトリ
+--input : str, optional
+    各圧力フォルダ内のH-wave入力ファイル名。デフォルトは "input.toml"
+--T : float ..., optional
+    温度のリスト(eV)。デフォルトは 0 0.005 0.01 0.02 0.05
+--filling : float float int, optional
+    フィリングの最小値・最大値・点の数。デフォルトは 0.7 0.8 11
+--sigma : float, optional
+    T = 0 での N(E_F) に使う広がり(eV)。デフォルトは 0.005
+--memory : float, optional
+    作業用の配列に使うメモリの上限(MB)。デフォルトは 1024
+
+Returns
+-------
+なし
+
+Notes
+-----
+入力ファイル
+-----------
+{pressure}GPa/input.toml : UHFk計算の入力ファイル
+    mode.param.CellShape, file.output.eigen を使用
+{pressure}GPa/{path_to_output}/{eigen}.npz : 固有値と固有ベクトル(固有ベクトルがなければ占有数は計算しない)
+
+出力ファイル
+-----------
+{pressure}GPa/tn_sweep.npz : 計算結果
+    T, filling : 温度とフィリング。shape=(nT,), (nfilling,)
+    fermi_energy : E_F(T, n)。shape=(nT, nfilling)
+    dos : N(E_F) (単位胞・1eVあたり、全バンドの和)。shape=(nT, nfilling)
+    occupation : 各成分の占有数 (1/N) Σ_k Σ_b |v_ib(k)|^2 f(E_b(k))。shape=(nT, nfilling, nd)
+tn_sweep.dat : 全圧力の結果
+    各行に pressure T filling E_F N(E_F) の形式で出力
+
+See Also
+--------
+hwave_io.py : H-waveの計算結果の読み込み
+sweep_analysis.py : 全圧力の固有値・グリーン関数の解析
+"""
+
+import argparse
+import os
+
+import numpy as np
+from scipy.special import expit
+
+from hwave_io import find_pressure_dirs, read_input, output_path, iter_npz_array, npz_array_shape
+
+
+class EnergyHistogram:
+    """固有値と軌道の重みのヒストグラム
+
+    Parameters
+    ----------
+    emin, emax : float
+        エネルギーの範囲
+    nbins : int
+        ビンの数
+    nd : int
+        軌道の重みの成分の数 (0なら重みを持たない)
+    """
+
+    def __init__(self, emin, emax, nbins, nd=0):
+        self.edges = np.linspace(emin, emax, nbins + 1)
+        self.centers = 0.5 * (self.edges[1:] + self.edges[:-1])
+        self.counts = np.zeros(nbins)
+        self.weights = np.zeros((nd, nbins))
+
+    def add(self, energy, weight=None):
+        """固有値と、その重み |v_ib|^2 (shape=(..., nd)) を加える"""
+        ibin = np.clip(np.searchsorted(self.edges, energy.ravel(), side="right") - 1, 0, len(self.counts) - 1)
+        self.counts += np.bincount(ibin, minlength=len(self.counts))
+        if weight is not None:
+            weight = weight.reshape(-1, weight.shape[-1])
+            for i in range(weight.shape[1]):
+                self.weights[i] += np.bincount(ibin, weights=weight[:, i], minlength=len(self.counts))
+
+
+def memory_rows(budget, ncolumn, nbyte=8, narray=4):
+    """作業用の配列 (nrow, ncolumn) を narray 個作っても budget (バイト) に収まる nrow"""
+    return max(int(budget // (ncolumn * nbyte * narray)), 1)
+
+
+def fermi_energy_zero_t(sorted_energy, filling):
+    """T = 0 の E_F。ソートした全固有値の int(N*n) 番目の値。shape=(nfilling,)"""
+    index = np.minimum((len(sorted_energy) * np.asarray(filling)).astype(int), len(sorted_energy) - 1)
+    return sorted_energy[index]
+
+
+def fermi_energy_finite_t(histogram, T, filling, budget, niter=60):
+    """T > 0 の E_F を全ての (T, n) の組について二分法で求める
+
+    Parameters
+    ----------
+    histogram : EnergyHistogram
+        固有値のヒストグラム
+    T : ndarray
+        温度。shape=(npair,)
+    filling : ndarray
+        フィリング。shape=(npair,)
+    budget : float
+        作業用の配列のメモリの上限(バイト)
+    niter : int
+        二分法の反復回数
+
+    Returns
+    -------
+    ndarray
+        shape=(npair,)
+    """
+    total = histogram.counts.sum()
+    e = histogram.centers
+    result = np.empty(len(T))
+    nrow = memory_rows(budget, len(e))
+    for start in range(0, len(T), nrow):
+        sl = slice(start, start + nrow)
+        t, n = T[sl, None], filling[sl]
+        lo = np.full(len(n), e[0] - 40.0 * t.max())
+        hi = np.full(len(n), e[-1] + 40.0 * t.max())
+        for _ in range(niter):
+            mu = 0.5 * (lo + hi)
+            occ = expit((mu[:, None] - e[None, :]) / t) @ histogram.counts / total
+            below = occ < n
+            lo = np.where(below, mu, lo)
+            hi = np.where(below, hi, mu)
+        result[sl] = 0.5 * (lo + hi)
+    return result
+
+
+def thermal_sums(histogram, T, mu, budget):
+    """占有数と N(E_F) をヒストグラムから計算する
+
+    Returns
+    -------
+    occupation : ndarray
+        shape=(npair, nd)。1 k点あたり
+    dos : ndarray
+        -∂f/∂E で重みを付けた状態数。shape=(npair,)。1 k点・1eVあたり
+    """
+    e = histogram.centers
+    occupation = np.empty((len(T), histogram.weights.shape[0]))
+    dos = np.empty(len(T))
+    nrow = memory_rows(budget, len(e))
+    for start in range(0, len(T), nrow):
+        sl = slice(start, start + nrow)
+        x = (e[None, :] - mu[sl, None]) / T[sl, None]
+        f = expit(-x)
+        occupation[sl] = f @ histogram.weights.T
+        dos[sl] = (f * (1.0 - f) / T[sl, None]) @ histogram.counts
+    return occupation, dos
+
+
+def sweep(path, input_file="input.toml", T=(0.0,), filling=(0.75,), sigma=0.005, memory=1024, chunk=4096):
+    """1つの圧力フォルダで (T, n) の格子について E_F, 占有数, N(E_F) を計算する
+
+    Returns
+    -------
+    dict
+        T, filling, fermi_energy, dos, occupation (固有ベクトルがなければNone)
+    """
+    budget = memory * 1024 ** 2
+    input_dict = read_input(os.path.join(path, input_file))
+    nvol = int(np.prod(input_dict["mode"]["param"]["CellShape"]))
+    file_eigen = output_path(input_dict, "eigen", path)
+    # ソートのために固有値2つ分のメモリが必要
+    nbyte = 2 * 8 * int(np.prod(npz_array_shape(file_eigen, "eigenvalue")))
+    if nbyte > budget:
+        raise MemoryError("Eigenvalues need {:.1f} MB, which exceeds --memory {} MB".format(nbyte / 1024 ** 2, memory))
+    with np.load(file_eigen) as data:
+        has_vector = "eigenvector" in data.files
+        energy = np.sort(data["eigenvalue"], axis=None)
+    T = np.asarray(T, dtype=float)
+    filling = np.asarray(filling, dtype=float)
+
+    # ビン幅は正の最小の温度(と sigma)の1/10以下
+    width = min(T[T > 0].min() if np.any(T > 0) else sigma, sigma) / 10
+    nbins = int(np.clip(np.ceil((energy[-1] - energy[0]) / width), 1000, 200000))
+    margin = 40.0 * max(T.max(), sigma)
+    nd = 0
+    if has_vector:
+        nd = next(iter_npz_array(file_eigen, "eigenvector", chunk=1))[1].shape[1]
+    histogram = EnergyHistogram(energy[0] - margin, energy[-1] + margin, nbins, nd)
+    if has_vector:
+        # 固有値と固有ベクトルを同じk点のチャンクごとに読み込む
+        vectors = iter_npz_array(file_eigen, "eigenvector", chunk=chunk)
+        for (_, w), (_, v) in zip(iter_npz_array(file_eigen, "eigenvalue", chunk=chunk), vectors):
+            histogram.add(w, np.abs(v.swapaxes(1, 2)) ** 2)
+    else:
+        histogram.add(energy)
+
+    TT, NN = np.meshgrid(T, filling, indexing="ij")
+    TT, NN = TT.ravel(), NN.ravel()
+    mu = np.empty(len(TT))
+    zero = TT == 0
+    mu[zero] = fermi_energy_zero_t(energy, NN[zero])
+    if np.any(~zero):
+        mu[~zero] = fermi_energy_finite_t(histogram, TT[~zero], NN[~zero], budget)
+    # T = 0 の占有数と N(E_F) は sigma の広がりで近似する
+    occupation, dos = thermal_sums(histogram, np.where(zero, sigma, TT), mu, budget)
+    shape = (len(T), len(filling))
+    return {"T": T, "filling": filling, "fermi_energy": mu.reshape(shape), "dos": dos.reshape(shape) / nvol,
+            "occupation": occupation.reshape(shape + (-1,)) / nvol if has_vector else None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=str, default=".", help="folder containing {pressure}GPa folders")
+    parser.add_argument("--input", type=str, default="input.toml", help="input file of hwave in each folder")
+    parser.add_argument("--T", type=float, nargs="+", default=[0.0, 0.005, 0.01, 0.02, 0.05], help="temperatures in eV")
+    parser.add_argument("--filling", type=float, nargs=3, default=[0.7, 0.8, 11], help="min, max and number of filling")
+    parser.add_argument("--sigma", type=float, default=0.005, help="broadening for N(E_F) at T = 0 in eV")
+    parser.add_argument("--memory", type=float, default=1024, help="memory budget in MB")
+    args = parser.parse_args()
+
+    filling = np.linspace(args.filling[0], args.filling[1], int(args.filling[2]))
+    rows = []
+    for pressure, path in find_pressure_dirs(args.root):
+        if not os.path.isfile(os.path.join(path, args.input)):
+            continue
+        result = sweep(path, args.input, args.T, filling, args.sigma, args.memory)
+        np.savez(os.path.join(path, "tn_sweep.npz"),
+                 **{key: value for key, value in result.items() if value is not None})
+        for iT, t in enumerate(result["T"]):
+            for jn, n in enumerate(result["filling"]):
+                rows.append([pressure, t, n, result["fermi_energy"][iT, jn], result["dos"][iT, jn]])
+        print("{}: E_F(T={}, n={}) = {:.6f}".format(path, result["T"][0], result["filling"][0],
+                                                    result["fermi_energy"][0, 0]))
+    np.savetxt("tn_sweep.dat", np.array(rows).reshape(-1, 5), header="pressure T filling E_F N(E_F)")
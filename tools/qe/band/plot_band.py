@@ -0,0 +1,277 @@
+"""圧力依存のバンド構造をnumpyとmatplotlibで直接プロットする
+
+このスクリプトは、各圧力フォルダのQEバンド({prefix}.band.gnu)と
+Wannierバンド(dir-wan/dat.iband)をnumpyで一度だけ読み込み、
+k軸の規格化とフェルミエネルギーの差し引きをまとめて行ったうえでPDFに描画します。
+save_band.py / save_band_with_wan.py のようにファイルをコピーしてgnuplotスクリプトを
+生成する必要はなく、gnuplotも不要です。各圧力の描画はプロセスプールで並列に行います。
+
+Parameters
+----------
+--prefix : str, optional
+    QEのprefix。デフォルトは "aucl2"
+--pressures : str, optional
+    圧力値のリスト。省略時は pressure_cif.dat、なければ *GPa フォルダから取得
+--yrange : float float, optional
+    エネルギー軸の範囲(eV)。デフォルトは -1.2 0.5
+--output : str, optional
+    出力フォルダ。デフォルトは "band"
+--nproc : int, optional
+    並列プロセス数。デフォルトはCPU数
+
+Returns
+-------
+なし
+
+Notes
+-----
+入力ファイル
+-----------
+pressure_cif.dat : 圧力値のリストを含むファイル(任意)
+    各行の2列目が圧力値(GPa)
+
+{pressure}GPa/{prefix}.band.gnu : QEのバンド計算結果
+    bands.xの出力。空行で区切られたバンドごとの k E のブロック
+
+{pressure}GPa/dir-wan/dat.iband : Wannierバンドの計算結果(任意)
+    存在する場合のみQEバンドと重ねて描画する
+
+{pressure}GPa/{prefix}.save/data-file-schema.xml : QEの出力XMLファイル
+    フェルミエネルギーの取得に使用
+
+出力ファイル
+-----------
+band/{pressure}GPa_band.pdf : 各圧力のバンド構造
+    QEのバンド(線)とWannierバンド(点)を重ねて表示
+
+band/band_compare.pdf : 全圧力のQEバンドの比較
+    k軸を[0, 1]に規格化し、フェルミエネルギーを0として重ねて表示
+
+See Also
+--------
+save_band.py : gnuplotスクリプトを生成する従来のスクリプト
+save_band_with_wan.py : Wannierバンドとの比較用gnuplotスクリプトを生成する従来のスクリプト
+"""
+
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def get_fermi_energy(file_name):
+    """Quantum ESPRESSOの出力XMLファイルからフェルミエネルギーを取得する
+
+    Parameters
+    ----------
+    file_name : str
+        data-file-schema.xmlファイルのパス
+
+    Returns
+    -------
+    float
+        フェルミエネルギー(eV)
+    """
+    import xml.etree.ElementTree as ET
+    tree = ET.parse(file_name)
+    root = tree.getroot()
+    from scipy import constants
+    for name in root.iter('fermi_energy'):
+        fermi_energy = float(name.text) * constants.physical_constants["Hartree energy in eV"][0]
+    return fermi_energy
+
+
+def load_band_blocks(file_name):
+    """k E の2列が空行区切りでバンドごとに並んだファイルを読み込む
+
+    Parameters
+    ----------
+    file_name : str
+        {prefix}.band.gnu や dat.iband のパス
+
+    Returns
+    -------
+    k : ndarray
+        k軸の値。shape=(nk,)
+    ene : ndarray
+        エネルギー(eV)。shape=(nband, nk)
+    """
+    data = np.loadtxt(file_name, ndmin=2)
+    if data.shape[1] > 2:
+        # k E_1 E_2 ... の横並び形式
+        return data[:, 0], data[:, 1:].T.copy()
+    k_all = data[:, 0]
+    # k が減少する位置(次のバンドの開始)でブロックに分割する
+    restart = np.flatnonzero(np.diff(k_all) < 0)
+    nk = restart[0] + 1 if restart.size > 0 else k_all.size
+    nband = k_all.size // nk
+    return k_all[:nk], data[:nband * nk, 1].reshape(nband, nk)
+
+
+def align_bands(k_src, ene_src, k_dst):
+    """全バンドを別のk軸上に線形補間する
+
+    Parameters
+    ----------
+    k_src : ndarray
+        元のk軸。shape=(nk_src,)、単調増加
+    ene_src : ndarray
+        元のエネルギー。shape=(nband, nk_src)
+    k_dst : ndarray
+        補間先のk軸。shape=(nk_dst,)
+
+    Returns
+    -------
+    ndarray
+        補間後のエネルギー。shape=(nband, nk_dst)
+    """
+    # 補間の添字と重みは全バンド共通なので一度だけ計算する
+    idx = np.clip(np.searchsorted(k_src, k_dst), 1, k_src.size - 1)
+    dk = k_src[idx] - k_src[idx - 1]
+    weight = np.divide(k_dst - k_src[idx - 1], dk, out=np.zeros_like(k_dst, dtype=float), where=dk > 0)
+    weight = np.clip(weight, 0.0, 1.0)
+    return ene_src[:, idx - 1] * (1.0 - weight) + ene_src[:, idx] * weight
+
+
+def load_pressure(pressure, prefix):
+    """1つの圧力フォルダのバンドデータを読み込む
+
+    Parameters
+    ----------
+    pressure : str
+        圧力値(GPa)
+    prefix : str
+        QEのprefix
+
+    Returns
+    -------
+    dict
+        pressure, fermi_energy, k(規格化済み), ene_qe, k_wan, ene_wan (E_F基準)
+    """
+    folder = "{}GPa".format(pressure)
+    ene_f = get_fermi_energy(os.path.join(folder, "{}.save".format(prefix), "data-file-schema.xml"))
+    k_qe, ene_qe = load_band_blocks(os.path.join(folder, "{}.band.gnu".format(prefix)))
+    band = {
+        "pressure": pressure,
+        "fermi_energy": ene_f,
+        "k": k_qe / k_qe[-1],
+        "ene_qe": ene_qe - ene_f,
+        "k_wan": None,
+        "ene_wan": None,
+    }
+    file_wan = os.path.join(folder, "dir-wan", "dat.iband")
+    if os.path.isfile(file_wan):
+        k_wan, ene_wan = load_band_blocks(file_wan)
+        band["k_wan"] = k_wan / k_wan[-1]
+        band["ene_wan"] = ene_wan - ene_f
+    return band
+
+
+def render_pressure(band, yrange, output_folder):
+    """1つの圧力のQEバンドとWannierバンドを重ねてPDFに描画する
+
+    Parameters
+    ----------
+    band : dict
+        load_pressure の戻り値
+    yrange : tuple of float
+        エネルギー軸の範囲(eV)
+    output_folder : str
+        出力フォルダ
+
+    Returns
+    -------
+    str
+        出力したPDFのパス
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(6, 4))
+    ax.plot(band["k"], band["ene_qe"].T, color="black", linewidth=0.8)
+    if band["ene_wan"] is not None:
+        nband_wan = band["ene_wan"].shape[0]
+        ax.scatter(np.tile(band["k_wan"], nband_wan), band["ene_wan"].ravel(), color="red", s=2)
+    ax.axhline(0.0, color="gray", linestyle="--", linewidth=0.5)
+    ax.set_xlim(0.0, 1.0)
+    ax.set_ylim(*yrange)
+    ax.set_ylabel("Energy (eV)")
+    ax.set_title("{} GPa".format(band["pressure"]))
+    file_name = os.path.join(output_folder, "{}GPa_band.pdf".format(band["pressure"]))
+    fig.savefig(file_name, format="pdf")
+    plt.close(fig)
+    return file_name
+
+
+def render_comparison(bands, yrange, output_folder):
+    """全圧力のQEバンドを共通のk軸に揃えて1枚のPDFに描画する
+
+    Parameters
+    ----------
+    bands : list of dict
+        load_pressure の戻り値のリスト
+    yrange : tuple of float
+        エネルギー軸の範囲(eV)
+    output_folder : str
+        出力フォルダ
+
+    Returns
+    -------
+    str
+        出力したPDFのパス
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    k_common = bands[0]["k"]
+    fig, ax = plt.subplots(figsize=(6, 4))
+    colors = plt.cm.viridis(np.linspace(0.0, 1.0, len(bands)))
+    for band, color in zip(bands, colors):
+        ene = align_bands(band["k"], band["ene_qe"], k_common)
+        lines = ax.plot(k_common, ene.T, color=color, linewidth=0.6)
+        lines[0].set_label("{} GPa".format(band["pressure"]))
+    ax.axhline(0.0, color="gray", linestyle="--", linewidth=0.5)
+    ax.set_xlim(0.0, 1.0)
+    ax.set_ylim(*yrange)
+    ax.set_ylabel("Energy (eV)")
+    ax.legend(fontsize=6)
+    file_name = os.path.join(output_folder, "band_compare.pdf")
+    fig.savefig(file_name, format="pdf")
+    plt.close(fig)
+    return file_name
+
+
+def get_pressures():
+    """pressure_cif.dat または *GPa フォルダから圧力値のリストを取得する
+
+    Returns
+    -------
+    list of str
+        圧力値(GPa)
+    """
+    if os.path.isfile("pressure_cif.dat"):
+        with open("pressure_cif.dat", "r") as fr:
+            return [line.split()[1] for line in fr if line.strip()]
+    folders = sorted(d for d in glob.glob("*GPa") if os.path.isdir(d))
+    return [d[:-len("GPa")] for d in folders]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prefix", type=str, default="aucl2", help="prefix of QE")
+    parser.add_argument("--pressures", type=str, nargs="+", default=None, help="pressure values in GPa")
+    parser.add_argument("--yrange", type=float, nargs=2, default=[-1.2, 0.5], help="energy range in eV")
+    parser.add_argument("--output", type=str, default="band", help="output folder")
+    parser.add_argument("--nproc", type=int, default=None, help="number of processes")
+    args = parser.parse_args()
+
+    pressures = args.pressures if args.pressures else get_pressures()
+    os.makedirs(args.output, exist_ok=True)
+    bands = [load_pressure(p, args.prefix) for p in pressures]
+    with ProcessPoolExecutor(max_workers=args.nproc) as executor:
+        futures = [executor.submit(render_pressure, band, args.yrange, args.output) for band in bands]
+        futures.append(executor.submit(render_comparison, bands, args.yrange, args.output))
+        for future in futures:
+            print("Saved", future.result())
@@ -1,11 +1,16 @@
 """現在のディレクトリ内のgnuplotスクリプトを実行する
 
 このスクリプトは、カレントディレクトリ内の全ての.gnuplotファイルを検索し、
-gnuplotコマンドを使用して順次実行します。
+gnuplotコマンドを使用して並列に実行します。
+出力ファイルがスクリプトおよび参照しているデータファイルより新しい場合は実行を省略し、
+各スクリプトの実行時間を表示します。
 
 Parameters
 ----------
-なし
+--nproc : int, optional
+    同時に実行するgnuplotの数。デフォルトはCPU数
+--force : flag, optional
+    指定すると出力ファイルが新しくても全て実行する
 
 Returns
 -------
@@ -18,6 +23,8 @@ Notes
 *.gnuplot : gnuplotスクリプトファイル
     実行するgnuplotスクリプトファイル
     プロットコマンドやスタイル設定などを含む
+    set output の行から出力ファイルを、plot/splot の行からデータファイルを判定する
+    (行末の \\ で次の行に続くコマンドは1行につなげてから判定する)
 
 出力ファイル
 -----------
@@ -30,22 +37,137 @@ See Also
 gnuplot : データ可視化ツール
 """
 
+import argparse
 import os
+import re
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+RE_QUOTED = re.compile(r"""['"]([^'"]+)['"]""")
+
+
+def logical_lines(fr):
+    """行末が \\ の行を次の行とつなげて、gnuplotが解釈する1行ずつ返す"""
+    buffer = ""
+    for line in fr:
+        stripped = line.rstrip("\r\n")
+        if stripped.endswith("\\"):
+            buffer += stripped[:-1] + " "
+            continue
+        yield buffer + stripped
+        buffer = ""
+    if buffer:
+        yield buffer
+
+
+def get_script_files(gnuplot_file):
+    """gnuplotスクリプトから出力ファイルと参照データファイルを取得する
+
+    Parameters
+    ----------
+    gnuplot_file : str
+        gnuplotスクリプトのパス
+
+    Returns
+    -------
+    outputs : list of str
+        set output で指定された出力ファイル
+    data_files : list of str
+        plot/splot で参照されているデータファイル
+    """
+    outputs = []
+    data_files = []
+    with open(gnuplot_file, "r") as fr:
+        for line in logical_lines(fr):
+            words = line.split()
+            if len(words) == 0 or words[0].startswith("#"):
+                continue
+            if words[0] == "set" and len(words) > 1 and "output".startswith(words[1]):
+                # set output 'file' / set out "file" (gnuplotの省略形は set o[utput]。
+                # set object, set origin, set offsets は含めない)
+                m = RE_QUOTED.search(line)
+                if m:
+                    outputs.append(m.group(1))
+            elif words[0] in ("plot", "splot", "p"):
+                # 各プロット要素の先頭の文字列がデータファイル('' は直前のファイル)
+                for element in line.strip()[len(words[0]):].split(","):
+                    m = RE_QUOTED.match(element.strip())
+                    if m:
+                        data_files.append(m.group(1))
+    return outputs, data_files
+
+
+def is_up_to_date(gnuplot_file):
+    """出力ファイルがスクリプトとデータファイルより新しいか判定する
 
-def run_gnuplot_scripts():
+    Parameters
+    ----------
+    gnuplot_file : str
+        gnuplotスクリプトのパス
+
+    Returns
+    -------
+    bool
+        出力ファイルが全て存在し、スクリプトとデータファイルより新しければTrue
+    """
+    outputs, data_files = get_script_files(gnuplot_file)
+    if len(outputs) == 0:
+        return False
+    if not all(os.path.isfile(f) for f in outputs):
+        return False
+    output_time = min(os.path.getmtime(f) for f in outputs)
+    input_time = os.path.getmtime(gnuplot_file)
+    for data_file in data_files:
+        if os.path.isfile(data_file):
+            input_time = max(input_time, os.path.getmtime(data_file))
+    return output_time > input_time
+
+
+def run_gnuplot(gnuplot_file, force=False):
+    """1つのgnuplotスクリプトを実行する
+
+    Parameters
+    ----------
+    gnuplot_file : str
+        gnuplotスクリプトのパス
+    force : bool
+        Trueの場合、出力ファイルが新しくても実行する
+
+    Returns
+    -------
+    str
+        実行結果 ("done", "skipped", "error")
+    float
+        実行時間(秒)
+    """
+    if not force and is_up_to_date(gnuplot_file):
+        return "skipped", 0.0
+    start = time.perf_counter()
+    try:
+        # gnuplot を使ってスクリプトを実行
+        subprocess.run(['gnuplot', gnuplot_file], check=True)
+        status = "done"
+    except subprocess.CalledProcessError as e:
+        print(f"Error executing {gnuplot_file}: {e}")
+        status = "error"
+    return status, time.perf_counter() - start
+
+
+def run_gnuplot_scripts(nproc=None, force=False):
     # 現在のディレクトリから .gnuplot ファイルを取得
-    gnuplot_files = [f for f in os.listdir() if f.endswith('.gnuplot')]
-    
-    # 各 .gnuplot ファイルを実行
-    for gnuplot_file in gnuplot_files:
-        print(f"Running {gnuplot_file}...")
-        try:
-            # gnuplot を使ってスクリプトを実行
-            subprocess.run(['gnuplot', gnuplot_file], check=True)
-            print(f"Successfully executed {gnuplot_file}")
-        except subprocess.CalledProcessError as e:
-            print(f"Error executing {gnuplot_file}: {e}")
+    gnuplot_files = sorted(f for f in os.listdir() if f.endswith('.gnuplot'))
+
+    # 各 .gnuplot ファイルを並列に実行
+    with ThreadPoolExecutor(max_workers=nproc or os.cpu_count()) as executor:
+        results = executor.map(lambda f: run_gnuplot(f, force), gnuplot_files)
+        for gnuplot_file, (status, elapsed) in zip(gnuplot_files, results):
+            print(f"{gnuplot_file}: {status} ({elapsed:.2f} s)")
+
 
 if __name__ == "__main__":
-    run_gnuplot_scripts()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nproc", type=int, default=None, help="number of concurrent gnuplot processes")
+    parser.add_argument("--force", action="store_true", help="run all scripts even if outputs are up to date")
+    args = parser.parse_args()
+    run_gnuplot_scripts(nproc=args.nproc, force=args.force)
@@ -5,7 +5,17 @@ SCF計算、非SCF計算、バンド計算用の入力ファイルを作成し
 
 Parameters
 ----------
-なし
+--auto_nbnd : flag, optional
+    指定すると、前回のSCF計算の固有値から、Wannierのエネルギーウィンドウの上限に
+    余裕を加えたエネルギーまでを含む最小の nbnd を求めて nscf.in に書き込む
+--xml : str, optional
+    SCF計算の出力XMLファイル。デフォルトは "{prefix}.save/data-file-schema.xml"
+--window_max : float, optional
+    E_F基準のウィンドウの上限(eV)。デフォルトは 0.5
+--margin : float, optional
+    ウィンドウの上限に加えるエネルギーの余裕(eV)。デフォルトは 1.0
+--buffer : int, optional
+    収束のために加えるバンドの数。デフォルトは 8
 
 Returns
 -------
@@ -35,6 +45,10 @@ band.in : バンド計算用入力ファイル
 bands.in : バンド後処理用入力ファイル
     バンド構造の後処理用のパラメータが設定された入力ファイル
 
+nbnd_report.txt : --auto_nbnd の結果
+    求めた nbnd と、input.toml の nbnd に対する計算コストの見積もり
+    nbnd を変えた場合は derive_window.py で .win の exclude_bands も更新する
+
 See Also
 --------
 cif2cell : CIFファイルから各種第一原理計算コード用の入力ファイルを生成するツール
@@ -44,6 +58,11 @@ import subprocess
 import os
 import tomli
 import glob
+import argparse
+import xml.etree.ElementTree as ET
+
+import numpy as np
+from scipy import constants
     
 def modify_scf(ref_file_name, output_file_folder, info, cur_dir):
     """SCF計算用の入力ファイルを生成する
@@ -210,6 +229,79 @@ def write_bands(output_file_folder, info, cur_dir):
         fw.write("/")
     os.chdir(cur_dir)
     
+def band_minima(file_name):
+    """Quantum ESPRESSOの出力XMLファイルから各バンドの最小エネルギーとフェルミエネルギーを取得する
+
+    固有値はk点ごとに逐次読み込み、全k点の固有値は保持しない。
+
+    Parameters
+    ----------
+    file_name : str
+        data-file-schema.xmlファイルのパス
+
+    Returns
+    -------
+    band_min : ndarray
+        各バンドのエネルギーの最小値(eV)。shape=(nbnd,)
+    fermi_energy : float
+        フェルミエネルギー(eV)
+    """
+    hartree = constants.physical_constants["Hartree energy in eV"][0]
+    band_min = None
+    fermi_energy = None
+    for _, elem in ET.iterparse(file_name, events=("end",)):
+        tag = elem.tag.rsplit("}", 1)[-1]
+        if tag == "eigenvalues":
+            ene = np.array(elem.text.split(), dtype=float) * hartree
+            band_min = ene if band_min is None else np.minimum(band_min, ene)
+        elif tag in ("fermi_energy", "highestOccupiedLevel") and fermi_energy is None:
+            fermi_energy = float(elem.text) * hartree
+        elif tag == "ks_energies":
+            elem.clear()
+    return band_min, fermi_energy
+
+def estimate_nbnd(file_name, window_max=0.5, margin=1.0, buffer=8):
+    """ウィンドウの上限 + 余裕 までの全バンドを含む最小の nbnd を見積もる
+
+    SCF計算のバンドが目標のエネルギーに届かない場合は、上位のバンドの平均間隔から外挿する。
+
+    Parameters
+    ----------
+    file_name : str
+        SCF計算の data-file-schema.xml のパス
+    window_max : float
+        E_F基準のウィンドウの上限(eV)
+    margin : float
+        ウィンドウの上限に加えるエネルギーの余裕(eV)
+    buffer : int
+        収束のために加えるバンドの数
+
+    Returns
+    -------
+    nbnd : int
+        見積もった nbnd
+    extrapolated : bool
+        外挿した場合はTrue
+    """
+    band_min, fermi_energy = band_minima(file_name)
+    target = fermi_energy + window_max + margin
+    # k点ごとに昇順なので、最小値も昇順に並ぶ
+    count = int(np.searchsorted(band_min, target, side="left"))
+    extrapolated = count == len(band_min)
+    if extrapolated:
+        ntop = max(len(band_min) // 10, 2)
+        spacing = (band_min[-1] - band_min[-ntop]) / (ntop - 1)
+        count += int(np.ceil((target - band_min[-1]) / spacing))
+    return count + buffer, extrapolated
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--auto_nbnd", action="store_true", help="estimate the smallest nbnd for nscf")
+parser.add_argument("--xml", type=str, default=None, help="data-file-schema.xml of the previous scf")
+parser.add_argument("--window_max", type=float, default=0.5, help="upper energy window relative to E_F in eV")
+parser.add_argument("--margin", type=float, default=1.0, help="energy margin above the window in eV")
+parser.add_argument("--buffer", type=int, default=8, help="number of extra bands")
+args = parser.parse_args()
+
 path_to_input = "input.toml"
 with open(path_to_input, "rb") as f:
     tomli_dict = tomli.load(f)
@@ -224,6 +316,20 @@ for key in ["scf", "relax", "nscf", "band"]:
 
 current_directory = os.getcwd()
 output_file_folder = "./"
+if args.auto_nbnd:
+    prefix = tomli_dict["nscf"]["control"]["prefix"].replace("'", "")
+    file_xml = args.xml if args.xml is not None else os.path.join(output_file_folder, "{}.save".format(prefix), "data-file-schema.xml")
+    nbnd_old = tomli_dict["nscf"].get("system", {}).get("nbnd")
+    nbnd, extrapolated = estimate_nbnd(file_xml, args.window_max, args.margin, args.buffer)
+    tomli_dict["nscf"]["system"]["nbnd"] = nbnd
+    report = "nbnd = {}{}\n".format(nbnd, " (extrapolated from the scf bands)" if extrapolated else "")
+    if nbnd_old is not None:
+        # Davidson法の計算量は nbnd に比例する部分と nbnd^2 に比例する部分(直交化)がある
+        report += "input.toml nbnd = {}\n".format(nbnd_old)
+        report += "cost ratio: {:.3f} (~nbnd), {:.3f} (~nbnd^2)\n".format(nbnd / nbnd_old, (nbnd / nbnd_old) ** 2)
+    print(report, end="")
+    with open(os.path.join(output_file_folder, "nbnd_report.txt"), "w") as fw:
+        fw.write(report)
 modify_scf("scf.in.ref", output_file_folder, tomli_dict["scf"], current_directory)
 modify_nscf("scf.in.ref", output_file_folder, tomli_dict["nscf"], current_directory)
 modify_band("scf.in.ref", output_file_folder, tomli_dict["band"], current_directory)
@@ -0,0 +1,335 @@
+"""pw.xの出力ファイルを追跡し、収束状況を一覧表示する
+
+このスクリプトは、各圧力フォルダの scf.out / scf_relax.out を逐次読み込み(tail -f 相当)、
+SCF反復ごとの estimated scf accuracy、全エネルギー、力、BFGSステップ数を抽出して
+全圧力分を一つの表として表示します。
+SCFが停滞・発散した計算は、オプションで {prefix}.EXIT ファイルを作成して停止させます。
+
+Parameters
+----------
+dirs : str, optional
+    監視する計算フォルダ。省略時はカレントディレクトリ内の *GPa フォルダ
+--files : str, optional
+    監視する出力ファイル名。デフォルトは scf.out scf_relax.out
+--follow : flag, optional
+    指定すると全ての計算が終了するまで監視を続ける
+--interval : float, optional
+    監視間隔(秒)。デフォルトは 30
+--abort : flag, optional
+    指定すると停滞・発散した計算を停止させる
+--min-iter : int, optional
+    停滞・発散を判定し始めるSCF反復回数。デフォルトは 20
+--stagnation-window : int, optional
+    この反復回数の間に最小accuracyが更新されなければ停滞とみなす。デフォルトは 15
+--divergence-factor : float, optional
+    accuracyがこのSCFサイクルの最小値のこの倍数を超えたら発散とみなす。デフォルトは 1e3
+
+Returns
+-------
+なし
+
+Notes
+-----
+入力ファイル
+-----------
+{dir}/scf.out, {dir}/scf_relax.out : pw.xの標準出力
+    job_bulk.sh, job_bulk_relax.sh でリダイレクトされたもの
+
+{dir}/scf.in, {dir}/scf_relax.in : pw.xの入力ファイル
+    停止用ファイル名に使う prefix を取得する
+
+出力ファイル
+-----------
+{dir}/{prefix}.EXIT : pw.xの停止用ファイル (--abort 指定時のみ)
+    pw.xはこのファイルを検出すると現在の状態を保存して終了する
+
+See Also
+--------
+job_bulk.sh : scf/band/nscf計算のジョブスクリプト
+job_bulk_relax.sh : 構造最適化計算のジョブスクリプト
+"""
+
+import argparse
+import glob
+import os
+import re
+import time
+
+RE_ITERATION = re.compile(r"^\s*iteration #\s*(\d+)")
+RE_ACCURACY = re.compile(r"estimated scf accuracy\s*<\s*([-+0-9.EeDd]+)")
+RE_TOTAL_ENERGY = re.compile(r"^!\s*total energy\s*=\s*([-+0-9.EeDd]+)")
+RE_TOTAL_FORCE = re.compile(r"Total force\s*=\s*([-+0-9.EeDd]+)")
+RE_BFGS_STEP = re.compile(r"number of bfgs steps\s*=\s*(\d+)")
+RE_PREFIX = re.compile(r"prefix\s*=\s*['\"]([^'\"]+)['\"]")
+
+
+def to_float(text):
+    """Fortran形式(1.0d-8 など)を含む数値文字列をfloatに変換する"""
+    return float(text.replace("d", "e").replace("D", "e"))
+
+
+class PwOutputTail:
+    """pw.xの出力ファイルを差分読み込みして状態を保持する
+
+    Parameters
+    ----------
+    file_name : str
+        pw.xの出力ファイルのパス
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.offset = 0
+        self.buffer = ""
+        self.scf_cycle = 0
+        self.iteration = 0
+        self.accuracy = []
+        self.total_energy = None
+        self.total_force = None
+        self.bfgs_step = 0
+        self.status = "waiting"
+        self.problem = None
+        self.aborted = False
+
+    def update(self):
+        """前回読み込んだ位置以降を読み込み、状態を更新する
+
+        Returns
+        -------
+        bool
+            新しい行があれば True
+        """
+        if not os.path.isfile(self.file_name):
+            return False
+        size = os.path.getsize(self.file_name)
+        if size < self.offset:
+            # ファイルが作り直された(再投入された)場合は最初から読み直す
+            self.__init__(self.file_name)
+        if size == self.offset:
+            return False
+        with open(self.file_name, "r", errors="replace") as fr:
+            fr.seek(self.offset)
+            chunk = fr.read()
+            self.offset = fr.tell()
+        lines = (self.buffer + chunk).split("\n")
+        # 最後の行は書き込み途中の可能性があるので次回に回す
+        self.buffer = lines.pop()
+        for line in lines:
+            self.parse_line(line)
+        return True
+
+    def parse_line(self, line):
+        """1行を解析して状態を更新する"""
+        if self.status == "waiting":
+            self.status = "running"
+        m = RE_ITERATION.match(line)
+        if m:
+            iteration = int(m.group(1))
+            if iteration <= self.iteration or self.scf_cycle == 0:
+                # 新しいSCFサイクル(relaxの次のイオンステップ)の開始
+                self.scf_cycle += 1
+                self.accuracy = []
+            self.iteration = iteration
+            return
+        m = RE_ACCURACY.search(line)
+        if m:
+            self.accuracy.append(to_float(m.group(1)))
+            return
+        m = RE_TOTAL_ENERGY.match(line)
+        if m:
+            self.total_energy = to_float(m.group(1))
+            return
+        m = RE_TOTAL_FORCE.search(line)
+        if m:
+            self.total_force = to_float(m.group(1))
+            return
+        m = RE_BFGS_STEP.search(line)
+        if m:
+            self.bfgs_step = int(m.group(1))
+            return
+        if "convergence NOT achieved" in line:
+            self.status = "not converged"
+        elif "End of BFGS Geometry Optimization" in line:
+            self.status = "bfgs done"
+        elif "JOB DONE." in line:
+            if self.status == "running":
+                self.status = "done"
+        elif "Error" in line and "%%%%" not in line:
+            self.status = "error"
+
+    @property
+    def finished(self):
+        return self.status in ("done", "bfgs done", "not converged", "error", "aborted")
+
+    def check_scf(self, min_iter, stagnation_window, divergence_factor):
+        """現在のSCFサイクルが停滞・発散していないか判定する
+
+        Parameters
+        ----------
+        min_iter : int
+            判定を始めるSCF反復回数
+        stagnation_window : int
+            この反復回数の間に最小accuracyが更新されなければ停滞とみなす
+        divergence_factor : float
+            最小accuracyのこの倍数を超えたら発散とみなす
+
+        Returns
+        -------
+        str or None
+            "stagnant" または "diverged"。問題がなければNone
+        """
+        acc = self.accuracy
+        if self.finished or len(acc) < min_iter:
+            return None
+        best = min(acc)
+        if acc[-1] > best * divergence_factor:
+            return "diverged"
+        if acc.index(best) < len(acc) - stagnation_window:
+            return "stagnant"
+        return None
+
+
+def get_prefix(file_name):
+    """pw.xの入力ファイルからprefixを取得する
+
+    Parameters
+    ----------
+    file_name : str
+        pw.xの入力ファイルのパス
+
+    Returns
+    -------
+    str
+        prefix。見つからない場合はpw.xのデフォルト値 "pwscf"
+    """
+    if os.path.isfile(file_name):
+        with open(file_name, "r") as fr:
+            for line in fr:
+                m = RE_PREFIX.search(line)
+                if m:
+                    return m.group(1)
+    return "pwscf"
+
+
+def request_exit(tail):
+    """pw.xに停止用ファイル {prefix}.EXIT を作成して停止を要求する
+
+    Parameters
+    ----------
+    tail : PwOutputTail
+        停止させる計算の状態
+
+    Returns
+    -------
+    str
+        作成した停止用ファイルのパス
+    """
+    dir_name = os.path.dirname(tail.file_name)
+    in_file = os.path.splitext(tail.file_name)[0] + ".in"
+    exit_file = os.path.join(dir_name, get_prefix(in_file) + ".EXIT")
+    with open(exit_file, "w") as fw:
+        fw.write("")
+    tail.aborted = True
+    return exit_file
+
+
+def print_table(tails):
+    """全計算の状態を表形式で表示する
+
+    Parameters
+    ----------
+    tails : list of PwOutputTail
+        表示する計算の状態
+    """
+    print(time.strftime("%Y-%m-%d %H:%M:%S"))
+    header = "{:<24} {:<14} {:>5} {:>5} {:>5} {:>12} {:>18} {:>12}".format(
+        "file", "status", "bfgs", "cycle", "iter", "scf_acc[Ry]", "E_tot[Ry]", "F_tot[Ry/au]")
+    print(header)
+    print("-" * len(header))
+    for tail in tails:
+        acc = "{:.3e}".format(tail.accuracy[-1]) if tail.accuracy else "-"
+        ene = "{:.8f}".format(tail.total_energy) if tail.total_energy is not None else "-"
+        force = "{:.6f}".format(tail.total_force) if tail.total_force is not None else "-"
+        print("{:<24} {:<14} {:>5} {:>5} {:>5} {:>12} {:>18} {:>12}".format(
+            os.path.relpath(tail.file_name), tail.problem or tail.status, tail.bfgs_step, tail.scf_cycle,
+            tail.iteration, acc, ene, force))
+    print("", flush=True)
+
+
+def all_finished(tails):
+    """全てのフォルダの計算が終了したか判定する
+
+    1回の計算では scf.out と scf_relax.out のどちらか一方しか作られないため、
+    まだ存在しないファイルは、同じフォルダの他のファイルが全て終了していれば終了とみなす。
+    どのファイルも存在しないフォルダ(計算の開始待ち)は終了とみなさない。
+    """
+    folders = {}
+    for tail in tails:
+        folders.setdefault(os.path.dirname(tail.file_name), []).append(tail)
+    for group in folders.values():
+        existing = [tail for tail in group if os.path.isfile(tail.file_name)]
+        if not existing or not all(tail.finished for tail in existing):
+            return False
+    return True
+
+
+def monitor(dirs, files, follow=False, interval=30.0, abort=False,
+            min_iter=20, stagnation_window=15, divergence_factor=1e3):
+    """pw.xの出力ファイルを監視する
+
+    Parameters
+    ----------
+    dirs : list of str
+        監視する計算フォルダ
+    files : list of str
+        各フォルダで監視する出力ファイル名
+    follow : bool
+        Trueの場合、全ての計算が終了するまで監視を続ける
+    interval : float
+        監視間隔(秒)
+    abort : bool
+        Trueの場合、停滞・発散した計算を停止させる
+    min_iter, stagnation_window, divergence_factor
+        PwOutputTail.check_scf を参照
+
+    Returns
+    -------
+    list of PwOutputTail
+        最終的な各計算の状態
+    """
+    tails = [PwOutputTail(os.path.join(d, f)) for d in dirs for f in files
+             if os.path.isfile(os.path.join(d, f)) or follow]
+    while True:
+        for tail in tails:
+            tail.update()
+            tail.problem = tail.check_scf(min_iter, stagnation_window, divergence_factor)
+            if tail.problem is not None and abort and not tail.aborted:
+                exit_file = request_exit(tail)
+                print("SCF {} in {}: created {}".format(tail.problem, tail.file_name, exit_file))
+                tail.status = "aborted"
+        print_table(tails)
+        if not follow or all_finished(tails):
+            break
+        time.sleep(interval)
+    return tails
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dirs", type=str, nargs="*", help="calculation folders (default: ./*GPa)")
+    parser.add_argument("--files", type=str, nargs="+", default=["scf.out", "scf_relax.out"], help="pw.x output files")
+    parser.add_argument("--follow", action="store_true", help="keep monitoring until all runs finish")
+    parser.add_argument("--interval", type=float, default=30.0, help="polling interval in seconds")
+    parser.add_argument("--abort", action="store_true", help="stop stagnant or diverging runs via prefix.EXIT")
+    parser.add_argument("--min-iter", type=int, default=20, help="iterations before checking convergence")
+    parser.add_argument("--stagnation-window", type=int, default=15, help="iterations without improvement regarded as stagnant")
+    parser.add_argument("--divergence-factor", type=float, default=1e3, help="ratio to the best accuracy regarded as divergent")
+    args = parser.parse_args()
+
+    dirs = args.dirs if args.dirs else sorted(d for d in glob.glob("*GPa") if os.path.isdir(d))
+    try:
+        monitor(dirs, args.files, follow=args.follow, interval=args.interval, abort=args.abort,
+                min_iter=args.min_iter, stagnation_window=args.stagnation_window,
+                divergence_factor=args.divergence_factor)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,237 @@
+"""QEバンドとWannierバンドの一致度を全圧力について数値で検証する
+
+save_band_with_wan.py は {prefix}.band.gnu と dat.iband を重ねたgnuplotスクリプトを作るだけで、
+一致しているかどうかは目で確認する必要があります。このスクリプトは、両者をQEバンドの
+規格化したk軸に揃え、エネルギーウィンドウ内の各Wannierバンドの点について
+同じk点で最も近いQEバンドとの差を求め、バンドごとのRMSと最大値を表にします。
+最大値がしきい値を超える圧力は NG として表示するので、hwave/RPAの計算を始める前に
+Wannier化の失敗に気付けます。圧力ごとの処理はプロセスプールで並列に行います。
+
+Parameters
+----------
+--prefix : str, optional
+    QEのprefix。デフォルトは "aucl2"
+--pressures : str, optional
+    圧力値のリスト。省略時は pressure_cif.dat、なければ *GPa フォルダから取得
+--window : float float, optional
+    E_F基準のエネルギーウィンドウ(eV)。指定すると各フォルダのウィンドウの設定より優先する
+--threshold : float, optional
+    NGとする最大の差(eV)。デフォルトは 0.05
+--output : str, optional
+    出力ファイル。デフォルトは "band/wannier_band_check.dat"
+--nproc : int, optional
+    並列プロセス数。デフォルトはCPU数
+
+Returns
+-------
+なし
+
+Notes
+-----
+入力ファイル
+-----------
+pressure_cif.dat : 圧力値のリストを含むファイル(任意)
+    各行の2列目が圧力値(GPa)
+
+{pressure}GPa/{prefix}.band.gnu : QEのバンド計算結果
+{pressure}GPa/dir-wan/dat.iband : Wannierバンドの計算結果
+{pressure}GPa/{prefix}.save/data-file-schema.xml : フェルミエネルギーの取得に使用
+
+エネルギーウィンドウは次の順に探す(いずれも絶対値(eV))
+    {pressure}GPa/respack.in : Lower_energy_window, Upper_energy_window
+    {pressure}GPa/{prefix}.win : dis_win_min, dis_win_max
+どちらもなければ generate_respack_in.py と同じ E_F + [-0.55, 0.5] を使う
+
+出力ファイル
+-----------
+{output} : 圧力・バンドごとの一致度
+    各行に pressure band rms max npoint の形式で出力(エネルギーはeV)
+
+See Also
+--------
+save_band_with_wan.py : QEバンドとWannierバンドを重ねたgnuplotスクリプトを作成する
+generate_respack_in.py : RESPACKのエネルギーウィンドウを設定する
+"""
+
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+DEFAULT_WINDOW = [-0.55, 0.5]
+
+
+def get_fermi_energy(file_name):
+    """Quantum ESPRESSOの出力XMLファイルからフェルミエネルギーを取得する
+
+    Parameters
+    ----------
+    file_name : str
+        data-file-schema.xmlファイルのパス
+
+    Returns
+    -------
+    float
+        フェルミエネルギー(eV)
+    """
+    import xml.etree.ElementTree as ET
+    tree = ET.parse(file_name)
+    root = tree.getroot()
+    from scipy import constants
+    for name in root.iter('fermi_energy'):
+        fermi_energy = float(name.text) * constants.physical_constants["Hartree energy in eV"][0]
+    return fermi_energy
+
+
+def load_band_blocks(file_name):
+    """k E の2列が空行区切りでバンドごとに並んだファイルを読み込む
+
+    Returns
+    -------
+    k : ndarray
+        k軸の値。shape=(nk,)
+    ene : ndarray
+        エネルギー(eV)。shape=(nband, nk)
+    """
+    data = np.loadtxt(file_name, ndmin=2)
+    if data.shape[1] > 2:
+        return data[:, 0], data[:, 1:].T.copy()
+    k_all = data[:, 0]
+    # k が減少する位置(次のバンドの開始)でブロックに分割する
+    restart = np.flatnonzero(np.diff(k_all) < 0)
+    nk = restart[0] + 1 if restart.size > 0 else k_all.size
+    nband = k_all.size // nk
+    return k_all[:nk], data[:nband * nk, 1].reshape(nband, nk)
+
+
+def align_bands(k_src, ene_src, k_dst):
+    """全バンドを別のk軸上に線形補間する。shape=(nband, len(k_dst))"""
+    idx = np.clip(np.searchsorted(k_src, k_dst), 1, k_src.size - 1)
+    dk = k_src[idx] - k_src[idx - 1]
+    weight = np.divide(k_dst - k_src[idx - 1], dk, out=np.zeros_like(k_dst, dtype=float), where=dk > 0)
+    weight = np.clip(weight, 0.0, 1.0)
+    return ene_src[:, idx - 1] * (1.0 - weight) + ene_src[:, idx] * weight
+
+
+def read_window(folder, prefix):
+    """フォルダの respack.in または {prefix}.win からエネルギーウィンドウを読む
+
+    Returns
+    -------
+    tuple of float or None
+        (下限, 上限)(eV)。見つからなければNone
+    """
+    keys = [(os.path.join(folder, "respack.in"), "Lower_energy_window", "Upper_energy_window"),
+            (os.path.join(folder, "{}.win".format(prefix)), "dis_win_min", "dis_win_max")]
+    for file_name, key_min, key_max in keys:
+        if not os.path.isfile(file_name):
+            continue
+        values = {}
+        with open(file_name, "r") as fr:
+            for line in fr:
+                words = line.replace("=", " ").replace(",", " ").replace(":", " ").split()
+                if len(words) >= 2 and words[0] in (key_min, key_max):
+                    values[words[0]] = float(words[1])
+        if key_min in values and key_max in values:
+            return values[key_min], values[key_max]
+    return None
+
+
+def band_deviation(k_qe, ene_qe, k_wan, ene_wan, emin, emax):
+    """ウィンドウ内の各Wannierバンドの点について、最も近いQEバンドとの差を求める
+
+    Parameters
+    ----------
+    k_qe, k_wan : ndarray
+        規格化したk軸
+    ene_qe : ndarray
+        QEのエネルギー。shape=(nband_qe, nk_qe)
+    ene_wan : ndarray
+        Wannierのエネルギー。shape=(nband_wan, nk_wan)
+    emin, emax : float
+        エネルギーウィンドウ
+
+    Returns
+    -------
+    rms, max : ndarray
+        バンドごとの差のRMSと最大値。shape=(nband_wan,)。ウィンドウ内に点がなければNaN
+    npoint : ndarray
+        ウィンドウ内の点の数。shape=(nband_wan,)
+    """
+    wan = align_bands(k_wan, ene_wan, k_qe)
+    # ウィンドウの近くを通るQEバンドだけを比較に使う
+    margin = 0.5 * (emax - emin)
+    near = (ene_qe.max(axis=1) >= emin - margin) & (ene_qe.min(axis=1) <= emax + margin)
+    qe = ene_qe[near]
+    diff = np.abs(wan[:, :, None] - qe.T[None, :, :]).min(axis=2)
+    inside = (wan >= emin) & (wan <= emax)
+    npoint = inside.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rms = np.sqrt(np.where(inside, diff ** 2, 0.0).sum(axis=1) / npoint)
+    dmax = np.where(inside, diff, -np.inf).max(axis=1)
+    dmax[npoint == 0] = np.nan
+    return rms, dmax, npoint
+
+
+def check_pressure(pressure, prefix, window=None):
+    """1つの圧力フォルダのQEバンドとWannierバンドを比較する
+
+    Returns
+    -------
+    dict
+        pressure, window (絶対値), rms, max, npoint
+    """
+    folder = "{}GPa".format(pressure)
+    ene_f = get_fermi_energy(os.path.join(folder, "{}.save".format(prefix), "data-file-schema.xml"))
+    if window is not None:
+        emin, emax = ene_f + window[0], ene_f + window[1]
+    else:
+        found = read_window(folder, prefix)
+        emin, emax = found if found is not None else (ene_f + DEFAULT_WINDOW[0], ene_f + DEFAULT_WINDOW[1])
+    k_qe, ene_qe = load_band_blocks(os.path.join(folder, "{}.band.gnu".format(prefix)))
+    k_wan, ene_wan = load_band_blocks(os.path.join(folder, "dir-wan", "dat.iband"))
+    rms, dmax, npoint = band_deviation(k_qe / k_qe[-1], ene_qe, k_wan / k_wan[-1], ene_wan, emin, emax)
+    return {"pressure": pressure, "window": (emin - ene_f, emax - ene_f),
+            "rms": rms, "max": dmax, "npoint": npoint}
+
+
+def get_pressures():
+    """pressure_cif.dat または *GPa フォルダから圧力値のリストを取得する"""
+    if os.path.isfile("pressure_cif.dat"):
+        with open("pressure_cif.dat", "r") as fr:
+            return [line.split()[1] for line in fr if line.strip()]
+    folders = sorted(d for d in glob.glob("*GPa") if os.path.isdir(d))
+    return [d[:-len("GPa")] for d in folders]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prefix", type=str, default="aucl2", help="prefix of QE")
+    parser.add_argument("--pressures", type=str, nargs="+", default=None, help="pressure values in GPa")
+    parser.add_argument("--window", type=float, nargs=2, default=None, help="energy window relative to E_F in eV")
+    parser.add_argument("--threshold", type=float, default=0.05, help="maximum deviation allowed in eV")
+    parser.add_argument("--output", type=str, default=os.path.join("band", "wannier_band_check.dat"), help="output file")
+    parser.add_argument("--nproc", type=int, default=None, help="number of processes")
+    args = parser.parse_args()
+
+    pressures = args.pressures if args.pressures else get_pressures()
+    with ProcessPoolExecutor(max_workers=args.nproc) as executor:
+        results = list(executor.map(check_pressure, pressures, [args.prefix] * len(pressures),
+                                    [args.window] * len(pressures)))
+
+    rows = []
+    print("{:>10} {:>17} {:>10} {:>10} {:>6}".format("pressure", "window-E_F", "rms_max", "max", "status"))
+    for result in results:
+        for band, (rms, dmax, npoint) in enumerate(zip(result["rms"], result["max"], result["npoint"])):
+            rows.append([float(result["pressure"]), band, rms, dmax, npoint])
+        # ウィンドウ内に点がない場合もNGとする
+        has_point = result["npoint"] > 0
+        worst_rms = result["rms"][has_point].max() if has_point.any() else np.nan
+        worst = result["max"][has_point].max() if has_point.any() else np.nan
+        status = "OK" if worst <= args.threshold else "NG"
+        print("{:>10} [{:7.3f},{:7.3f}] {:10.4f} {:10.4f} {:>6}".format(
+            result["pressure"], *result["window"], worst_rms, worst, status))
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    np.savetxt(args.output, np.array(rows), header="pressure band rms max npoint")
@@ -0,0 +1,321 @@
+"""nscf計算の固有値からWannier90のエネルギーウィンドウと exclude_bands を決める
+
+aucl2.win の exclude_bands = 1-444,453-500 や dis_win_min/max、generate_respack_in.py の
+window_range は固定値なので、圧力が変わるとずれていきます。このスクリプトは、
+各圧力フォルダのnscf計算の data-file-schema.xml をk点ごとに逐次読み込んで
+(全k点 x 全バンドの固有値を保持せずに)各バンドのエネルギーの最小値・最大値を求め、
+E_F 基準のウィンドウに入るバンドの範囲を決めて、圧力ごとの .win と respack.in を書き出します。
+ウィンドウ内のバンドが num_wann より少ない場合は、ウィンドウに近いバンドから順に加えます。
+Wannier90の外側のウィンドウには全てのk点で num_wann 個以上の状態が必要なので、
+選んだバンドの固有値をもう一度k点ごとに読み込み、足りないk点があればウィンドウを
+(選んだバンドの範囲まで)広げます。
+圧力ごとの処理はプロセスプールで並列に行います。
+
+Parameters
+----------
+--prefix : str, optional
+    QEのprefix。デフォルトは "aucl2"
+--pressures : str, optional
+    圧力値のリスト。省略時は pressure_cif.dat、なければ *GPa フォルダから取得
+--window : float float, optional
+    E_F基準のエネルギーウィンドウ(eV)。デフォルトは -0.55 0.5
+--template : str, optional
+    .win のテンプレート。圧力フォルダに {prefix}.win がない場合に使う。デフォルトは "{prefix}.win"
+--respack_template : str, optional
+    respack.in のテンプレート。デフォルトは "respack.in.ref" (存在しない場合は書き出さない)
+--nproc : int, optional
+    並列プロセス数。デフォルトはCPU数
+
+Returns
+-------
+なし
+
+Notes
+-----
+入力ファイル
+-----------
+{pressure}GPa/{prefix}.save/data-file-schema.xml : nscf計算の出力XMLファイル
+    ks_energies/eigenvalues (Hartree) と fermi_energy (または highestOccupiedLevel) を使用
+
+出力ファイル
+-----------
+{pressure}GPa/{prefix}.win : num_bands, exclude_bands, dis_win_min, dis_win_max を書き換えたもの
+    dis_win_min/max はWannier90の規約どおり絶対値(eV)。必要なら --window より広げる
+{pressure}GPa/respack.in : Lower_energy_window, Upper_energy_window を dis_win_min/max と同じ値に書き換えたもの
+wannier_window.dat : 圧力ごとの E_F、バンドの範囲、ウィンドウ
+
+See Also
+--------
+../respack/generate_respack_in.py : 固定のウィンドウでrespack.inを作成する
+../respack/check_wannier_band.py : QEバンドとWannierバンドの一致度を確認する
+"""
+
+import argparse
+import glob
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import constants
+
+HARTREE_TO_EV = constants.physical_constants["Hartree energy in eV"][0]
+
+
+def band_extrema(file_name):
+    """data-file-schema.xml の固有値をk点ごとに読み、各バンドの最小値・最大値を求める
+
+    Parameters
+    ----------
+    file_name : str
+        data-file-schema.xmlファイルのパス
+
+    Returns
+    -------
+    band_min, band_max : ndarray
+        各バンドのエネルギーの最小値・最大値(eV)。shape=(nbnd,)
+    fermi_energy : float
+        フェルミエネルギー(eV)
+    nk : int
+        k点の数
+    """
+    band_min = band_max = None
+    fermi_energy = None
+    nk = 0
+    for _, elem in ET.iterparse(file_name, events=("end",)):
+        tag = elem.tag.rsplit("}", 1)[-1]
+        if tag == "eigenvalues":
+            ene = np.array(elem.text.split(), dtype=float) * HARTREE_TO_EV
+            if band_min is None:
+                band_min, band_max = ene.copy(), ene.copy()
+            else:
+                np.minimum(band_min, ene, out=band_min)
+                np.maximum(band_max, ene, out=band_max)
+            nk += 1
+        elif tag in ("fermi_energy", "highestOccupiedLevel") and fermi_energy is None:
+            fermi_energy = float(elem.text) * HARTREE_TO_EV
+        elif tag == "ks_energies":
+            elem.clear()
+    if band_min is None or fermi_energy is None:
+        raise ValueError("Eigenvalues or Fermi energy not found in {}".format(file_name))
+    return band_min, band_max, fermi_energy, nk
+
+
+def select_bands(band_min, band_max, emin, emax, num_wann):
+    """ウィンドウに入るバンドの範囲を決める
+
+    Parameters
+    ----------
+    band_min, band_max : ndarray
+        各バンドのエネルギーの最小値・最大値
+    emin, emax : float
+        エネルギーウィンドウ(絶対値)
+    num_wann : int
+        Wannier関数の数。範囲がこれより狭ければウィンドウに近いバンドを加える
+
+    Returns
+    -------
+    tuple of int
+        (最初のバンド, 最後のバンド)。0始まり
+    """
+    inside = np.flatnonzero((band_max >= emin) & (band_min <= emax))
+    if inside.size > 0:
+        lo, hi = inside[0], inside[-1]
+    else:
+        center = 0.5 * (emin + emax)
+        lo = hi = int(np.argmin(np.minimum(np.abs(band_min - center), np.abs(band_max - center))))
+    nbnd = len(band_min)
+    while hi - lo + 1 < num_wann:
+        # 下のバンドの上端と上のバンドの下端のうち、ウィンドウに近い方を加える
+        below = emin - band_max[lo - 1] if lo > 0 else np.inf
+        above = band_min[hi + 1] - emax if hi < nbnd - 1 else np.inf
+        if np.isinf(below) and np.isinf(above):
+            raise ValueError("Only {} bands are available for num_wann = {}".format(nbnd, num_wann))
+        if below <= above:
+            lo -= 1
+        else:
+            hi += 1
+    return int(lo), int(hi)
+
+
+def band_energies(file_name, lo, hi):
+    """data-file-schema.xml の固有値をk点ごとに読み、バンド lo..hi だけを保持する
+
+    Returns
+    -------
+    ndarray
+        固有値(eV)。shape=(nk, hi - lo + 1)
+    """
+    energies = []
+    for _, elem in ET.iterparse(file_name, events=("end",)):
+        tag = elem.tag.rsplit("}", 1)[-1]
+        if tag == "eigenvalues":
+            energies.append(np.array(elem.text.split()[lo:hi + 1], dtype=float) * HARTREE_TO_EV)
+        elif tag == "ks_energies":
+            elem.clear()
+    return np.array(energies)
+
+
+def widen_window(energy, emin, emax, num_wann, margin=1e-4):
+    """全てのk点でウィンドウ内の状態が num_wann 個以上になるまでウィンドウを広げる
+
+    足りないk点について、ウィンドウのすぐ外の状態のうち最も近いものまで広げることを繰り返す。
+    選んだバンドの外には広げない。
+
+    Parameters
+    ----------
+    energy : ndarray
+        選んだバンドの固有値。shape=(nk, num_bands)
+    emin, emax : float
+        エネルギーウィンドウ(絶対値)
+    num_wann : int
+        Wannier関数の数
+    margin : float
+        書き出すときの丸めで状態が外れないように、加えた状態からさらに広げる幅
+
+    Returns
+    -------
+    emin, emax : float
+        広げたウィンドウ
+    """
+    while True:
+        count = np.count_nonzero((energy >= emin) & (energy <= emax), axis=1)
+        short = count < num_wann
+        if not np.any(short):
+            return float(emin), float(emax)
+        e = energy[short]
+        below = np.where(e < emin, e, -np.inf).max(axis=1).max()
+        above = np.where(e > emax, e, np.inf).min(axis=1).min()
+        if np.isinf(below) and np.isinf(above):
+            raise ValueError("{} k points have fewer than num_wann = {} states even in the widest window".format(
+                int(short.sum()), num_wann))
+        if emin - below <= above - emax:
+            emin = below - margin
+        else:
+            emax = above + margin
+
+
+def exclude_bands_string(lo, hi, nbnd):
+    """exclude_bands の値を作る (1始まり)。除外するバンドがなければ空文字列"""
+    ranges = []
+    if lo > 0:
+        ranges.append("1-{}".format(lo) if lo > 1 else "1")
+    if hi < nbnd - 1:
+        ranges.append("{}-{}".format(hi + 2, nbnd) if hi + 2 < nbnd else "{}".format(nbnd))
+    return ",".join(ranges)
+
+
+def rewrite_win(lines, values):
+    """.win の各行のキーを書き換える。ないキーは先頭に加える
+
+    Parameters
+    ----------
+    lines : list of str
+        .win の各行
+    values : dict
+        キーと値。値がNoneのキーは削除する
+
+    Returns
+    -------
+    str
+        書き換えた .win
+    """
+    remaining = dict(values)
+    output = []
+    for line in lines:
+        key = line.replace("=", " ").replace(":", " ").split()[0].lower() if line.strip() else ""
+        if key in remaining:
+            value = remaining.pop(key)
+            if value is not None:
+                output.append("{} = {}\n".format(key, value))
+        else:
+            output.append(line)
+    header = ["{} = {}\n".format(key, value) for key, value in remaining.items() if value is not None]
+    return "".join(header + output)
+
+
+def read_num_wann(lines):
+    for line in lines:
+        words = line.replace("=", " ").replace(":", " ").split()
+        if len(words) >= 2 and words[0].lower() == "num_wann":
+            return int(words[1])
+    raise ValueError("num_wann is not found in the .win file")
+
+
+def derive_window(pressure, prefix, window, template, respack_template):
+    """1つの圧力フォルダの .win と respack.in を書き出す
+
+    Returns
+    -------
+    dict
+        pressure, fermi_energy, lo, hi (1始まり), num_bands, exclude_bands, nk, emin, emax (ウィンドウ)
+    """
+    folder = "{}GPa".format(pressure)
+    band_min, band_max, ene_f, nk = band_extrema(os.path.join(folder, "{}.save".format(prefix), "data-file-schema.xml"))
+    emin, emax = ene_f + window[0], ene_f + window[1]
+
+    file_win = os.path.join(folder, "{}.win".format(prefix))
+    with open(file_win if os.path.isfile(file_win) else template, "r") as fr:
+        lines = fr.readlines()
+    num_wann = read_num_wann(lines)
+    lo, hi = select_bands(band_min, band_max, emin, emax, num_wann)
+    energy = band_energies(os.path.join(folder, "{}.save".format(prefix), "data-file-schema.xml"), lo, hi)
+    emin, emax = widen_window(energy, emin, emax, num_wann)
+    if emin < ene_f + window[0] or emax > ene_f + window[1]:
+        print("{}: window is widened to [{:.4f}, {:.4f}] eV relative to E_F".format(folder, emin - ene_f, emax - ene_f))
+    exclude = exclude_bands_string(lo, hi, len(band_min))
+    values = {"num_bands": hi - lo + 1, "exclude_bands": exclude if exclude else None,
+              "dis_win_min": "{:.6f}".format(emin), "dis_win_max": "{:.6f}".format(emax)}
+    with open(file_win, "w") as fw:
+        fw.write(rewrite_win(lines, values))
+
+    if respack_template is not None and os.path.isfile(respack_template):
+        str_respack = ""
+        with open(respack_template, "r") as fr:
+            for line in fr:
+                if line.split("=")[0] == "Lower_energy_window":
+                    str_respack += "Lower_energy_window={:.6f},\n".format(emin)
+                elif line.split("=")[0] == "Upper_energy_window":
+                    str_respack += "Upper_energy_window={:.6f},\n".format(emax)
+                else:
+                    str_respack += line
+        with open(os.path.join(folder, "respack.in"), "w") as fw:
+            fw.write(str_respack)
+    return {"pressure": pressure, "fermi_energy": ene_f, "lo": lo + 1, "hi": hi + 1,
+            "num_bands": hi - lo + 1, "exclude_bands": exclude, "nk": nk, "emin": emin, "emax": emax}
+
+
+def get_pressures():
+    """pressure_cif.dat または *GPa フォルダから圧力値のリストを取得する"""
+    if os.path.isfile("pressure_cif.dat"):
+        with open("pressure_cif.dat", "r") as fr:
+            return [line.split()[1] for line in fr if line.strip()]
+    folders = sorted(d for d in glob.glob("*GPa") if os.path.isdir(d))
+    return [d[:-len("GPa")] for d in folders]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prefix", type=str, default="aucl2", help="prefix of QE")
+    parser.add_argument("--pressures", type=str, nargs="+", default=None, help="pressure values in GPa")
+    parser.add_argument("--window", type=float, nargs=2, default=[-0.55, 0.5], help="energy window relative to E_F in eV")
+    parser.add_argument("--template", type=str, default=None, help="template .win file")
+    parser.add_argument("--respack_template", type=str, default="respack.in.ref", help="template of respack.in")
+    parser.add_argument("--nproc", type=int, default=None, help="number of processes")
+    args = parser.parse_args()
+
+    pressures = args.pressures if args.pressures else get_pressures()
+    template = args.template if args.template is not None else "{}.win".format(args.prefix)
+    n = len(pressures)
+    with ProcessPoolExecutor(max_workers=args.nproc) as executor:
+        results = list(executor.map(derive_window, pressures, [args.prefix] * n, [args.window] * n,
+                                    [template] * n, [args.respack_template] * n))
+
+    with open("wannier_window.dat", "w") as fw:
+        fw.write("# pressure E_F first_band last_band num_bands exclude_bands dis_win_min dis_win_max\n")
+        for result in results:
+            line = "{} {:.6f} {} {} {} {} {:.6f} {:.6f}".format(
+                result["pressure"], result["fermi_energy"], result["lo"], result["hi"], result["num_bands"],
+                result["exclude_bands"] or "-", result["emin"], result["emax"])
+            fw.write(line + "\n")
+            print(line)
@@ -0,0 +1,261 @@
+"""Wannier90の _hr.dat からH-waveの dir-model (zvo_hr.dat, zvo_geom.dat) を作る
+
+hwave/calc_chi0.sh や calc_rpa.sh は RESPACK が出力した {pressure}GPa/dir-model を
+コピーして使うため、RESPACKを実行しないとWannier90の結果をH-waveに渡せません。
+このスクリプトは、各圧力フォルダの {prefix}_hr.dat を読み込み、H(-R) = H(R)† となるように
+エルミート化し、必要なら絶対値がしきい値より小さいホッピングを落として、
+H-waveが読み込める zvo_hr.dat と zvo_geom.dat を書き出します。
+圧力ごとの処理はプロセスプールで並列に行います。
+
+Parameters
+----------
+--prefix : str, optional
+    Wannier90のseedname。デフォルトは "aucl2"
+--pressures : str, optional
+    圧力値のリスト。省略時は pressure_cif.dat、なければ *GPa フォルダから取得
+--folders : str, optional
+    入力フォルダのリスト。指定すると --pressures より優先する (例: ../../soi/wannier90)
+--threshold : float, optional
+    これより絶対値が小さいホッピング H_mn(R)/ndegen(R) を0にする(eV)。デフォルトは 0 (落とさない)
+--output_dir : str, optional
+    出力フォルダ名(入力フォルダからの相対パス)。デフォルトは "dir-model"
+--overwrite : flag, optional
+    指定すると既存の zvo_hr.dat を上書きする(RESPACKの出力を置き換える場合)
+--nproc : int, optional
+    並列プロセス数。デフォルトはCPU数
+
+Returns
+-------
+なし
+
+Notes
+-----
+入力ファイル
+-----------
+{folder}/{prefix}_hr.dat : Wannier90のホッピング積分
+{folder}/{prefix}.win : unit_cell_cart と projections を使用
+{folder}/{prefix}_centres.xyz : Wannier中心(write_xyz = .true. の場合、任意)
+    ない場合は projections の中心を使う(spinors = .true. なら各中心を2回繰り返す)
+
+出力ファイル
+-----------
+{folder}/{output_dir}/zvo_hr.dat : Wannier90と同じ形式のホッピング積分
+    H-waveは ndegen を使わないため、H(R)/ndegen(R) を書き出し ndegen は全て1とする
+{folder}/{output_dir}/zvo_geom.dat : 格子ベクトル(Å)、軌道数、Wannier中心(分数座標)
+hr_to_hwave.dat : フォルダごとのエルミート性の誤差、落としたホッピングの数、固有値の最大の変化
+
+See Also
+--------
+wannier_hr.py : _hr.dat の読み込みと H(k) の計算
+../copy_datarepo.py : RESPACKの dir-model をコピーする
+"""
+
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from wannier_hr import WannierModel, read_hr, read_unit_cell
+
+
+def symmetrize(R, ndegen, hr):
+    """H(-R) = H(R)† となるようにエルミート化する
+
+    -R が含まれない R があれば、その R のブロックを追加する。
+
+    Parameters
+    ----------
+    R : ndarray
+        格子ベクトル(整数)。shape=(nrpts, 3)
+    ndegen : ndarray
+        各Rの縮重度。shape=(nrpts,)
+    hr : ndarray
+        ホッピング積分。shape=(nrpts, num_wann, num_wann)
+
+    Returns
+    -------
+    R, ndegen, hr : ndarray
+        エルミート化した模型
+    error : float
+        エルミート化前の |H(R)/ndegen - (H(-R)/ndegen)†| の最大値
+    """
+    index = {tuple(r): i for i, r in enumerate(R)}
+    missing = [i for i, r in enumerate(R) if tuple(-r) not in index]
+    if missing:
+        R = np.concatenate((R, -R[missing]))
+        ndegen = np.concatenate((ndegen, ndegen[missing]))
+        hr = np.concatenate((hr, np.zeros_like(hr[missing])))
+        index = {tuple(r): i for i, r in enumerate(R)}
+    minus = np.array([index[tuple(-r)] for r in R])
+    # ndegen(R) と ndegen(-R) が異なる場合も H(R)/ndegen(R) をエルミートにする
+    h = hr / ndegen[:, None, None]
+    h_dagger = h[minus].conj().transpose(0, 2, 1)
+    error = float(np.abs(h - h_dagger).max())
+    return R, ndegen, 0.5 * (h + h_dagger) * ndegen[:, None, None], error
+
+
+def prune(R, ndegen, hr, threshold):
+    """絶対値がしきい値より小さいホッピングを0にし、全て0になったRを取り除く
+
+    H-waveは各Rについて num_wann^2 行を読むため、要素は0にするだけでブロックは残す。
+    R と -R は同じ要素を落とすので、エルミート性は保たれる。
+
+    Returns
+    -------
+    R, ndegen, hr : ndarray
+        しきい値を適用した模型
+    npruned : int
+        0にした要素の数
+    """
+    small = np.abs(hr / ndegen[:, None, None]) < threshold
+    npruned = int((small & (hr != 0)).sum())
+    hr = np.where(small, 0.0, hr)
+    keep = np.any(hr != 0, axis=(1, 2)) | np.all(R == 0, axis=1)
+    return R[keep], ndegen[keep], hr[keep], npruned
+
+
+def write_hr(file_name, R, ndegen, hr, comment="converted from wannier90 _hr.dat"):
+    """Wannier90と同じ形式で書き出す (H-waveの Transfer として読める)
+
+    H-waveは ndegen の行を読み飛ばして H(R) をそのまま足し合わせるため、
+    H(R)/ndegen(R) を書き出し、ndegen は全て1とする。
+    """
+    nrpts, nw, _ = hr.shape
+    hr = hr / np.asarray(ndegen)[:, None, None]
+    with open(file_name, "w") as fw:
+        fw.write(comment + "\n")
+        fw.write("{:12d}\n{:12d}\n".format(nw, nrpts))
+        for start in range(0, nrpts, 15):
+            fw.write("".join("{:5d}".format(1) for _ in range(start, min(start + 15, nrpts))) + "\n")
+        # Wannier90と同じく m が最も速く変わる順
+        n, m = np.meshgrid(np.arange(nw), np.arange(nw), indexing="ij")
+        m, n = m.ravel(), n.ravel()
+        for r, h in zip(R, hr):
+            values = h[m, n]
+            fw.write("".join("{:5d}{:5d}{:5d}{:5d}{:5d}{:16.10f}{:16.10f}\n".format(
+                r[0], r[1], r[2], mm + 1, nn + 1, v.real, v.imag) for mm, nn, v in zip(m, n, values)))
+
+
+def read_centres(folder, prefix, cell, num_wann):
+    """Wannier中心を分数座標で返す
+
+    {prefix}_centres.xyz があればそれを、なければ .win の projections の f= の座標を使う。
+    どちらからも num_wann 個の中心が得られなければ原点とする。
+    """
+    file_xyz = os.path.join(folder, "{}_centres.xyz".format(prefix))
+    if os.path.isfile(file_xyz):
+        with open(file_xyz, "r") as fr:
+            lines = fr.readlines()[2:]
+        cart = np.array([line.split()[1:4] for line in lines if line.split() and line.split()[0] == "X"], dtype=float)
+        if len(cart) == num_wann:
+            return cart @ np.linalg.inv(cell)
+    centres = []
+    spinors = False
+    in_block = False
+    with open(os.path.join(folder, "{}.win".format(prefix)), "r") as fr:
+        for line in fr:
+            words = line.replace("=", " ").replace(":", " ").split()
+            if not words:
+                continue
+            key = words[0].lower()
+            if key == "spinors" and len(words) > 1:
+                spinors = words[1].lower().strip(".").startswith("t")
+            elif key == "begin" and len(words) > 1 and words[1].lower() == "projections":
+                in_block = True
+            elif key == "end" and in_block:
+                in_block = False
+            elif in_block and line.strip().lower().startswith("f="):
+                centres.append([float(x) for x in line.split("=", 1)[1].split(":")[0].split(",")])
+    centres = np.array(centres).reshape(-1, 3)
+    if spinors:
+        centres = np.repeat(centres, 2, axis=0)
+    if len(centres) != num_wann:
+        print("Wannier centres are not found in {}; the origin is used".format(folder))
+        return np.zeros((num_wann, 3))
+    return centres
+
+
+def write_geom(file_name, cell, centres):
+    """zvo_geom.dat を書き出す"""
+    with open(file_name, "w") as fw:
+        for vec in cell:
+            fw.write("{:15.10f}{:15.10f}{:15.10f}\n".format(*vec))
+        fw.write("{:d}\n".format(len(centres)))
+        for pos in centres:
+            fw.write("{:15.10f}{:15.10f}{:15.10f}\n".format(*pos))
+
+
+def max_band_change(model_ref, model, nk=8):
+    """nk^3 の格子上での固有値の変化の最大値"""
+    grid = np.arange(nk) / nk
+    k = np.stack(np.meshgrid(grid, grid, grid, indexing="ij"), axis=-1).reshape(-1, 3)
+    return float(np.abs(model_ref.eigvalsh(k) - model.eigvalsh(k)).max())
+
+
+def convert(folder, prefix, threshold=0.0, output_dir="dir-model", overwrite=False):
+    """1つのフォルダの _hr.dat を dir-model に変換する
+
+    Returns
+    -------
+    dict
+        folder, nrpts, hermite_error, npruned, band_change。書き出さなかった場合は skipped=True
+    """
+    output = os.path.join(folder, output_dir)
+    file_hr = os.path.join(output, "zvo_hr.dat")
+    if os.path.isfile(file_hr) and not overwrite:
+        print("{} exists; use --overwrite to replace it".format(file_hr))
+        return {"folder": folder, "skipped": True}
+    R, ndegen, hr = read_hr(os.path.join(folder, "{}_hr.dat".format(prefix)))
+    original = WannierModel(R, ndegen, hr)
+    R, ndegen, hr, error = symmetrize(R, ndegen, hr)
+    npruned = 0
+    if threshold > 0:
+        R, ndegen, hr, npruned = prune(R, ndegen, hr, threshold)
+    cell = read_unit_cell(os.path.join(folder, "{}.win".format(prefix)))
+    os.makedirs(output, exist_ok=True)
+    write_hr(file_hr, R, ndegen, hr)
+    write_geom(os.path.join(output, "zvo_geom.dat"), cell, read_centres(folder, prefix, cell, hr.shape[1]))
+    return {"folder": folder, "skipped": False, "nrpts": len(R), "hermite_error": error, "npruned": npruned,
+            "band_change": max_band_change(original, WannierModel(R, ndegen, hr))}
+
+
+def get_pressures():
+    """pressure_cif.dat または *GPa フォルダから圧力値のリストを取得する"""
+    if os.path.isfile("pressure_cif.dat"):
+        with open("pressure_cif.dat", "r") as fr:
+            return [line.split()[1] for line in fr if line.strip()]
+    folders = sorted(d for d in glob.glob("*GPa") if os.path.isdir(d))
+    return [d[:-len("GPa")] for d in folders]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prefix", type=str, default="aucl2", help="seedname of wannier90")
+    parser.add_argument("--pressures", type=str, nargs="+", default=None, help="pressure values in GPa")
+    parser.add_argument("--folders", type=str, nargs="+", default=None, help="input folders")
+    parser.add_argument("--threshold", type=float, default=0.0, help="drop hoppings smaller than this value in eV")
+    parser.add_argument("--output_dir", type=str, default="dir-model", help="output folder name")
+    parser.add_argument("--overwrite", action="store_true", help="overwrite existing zvo_hr.dat")
+    parser.add_argument("--nproc", type=int, default=None, help="number of processes")
+    args = parser.parse_args()
+
+    if args.folders:
+        folders = args.folders
+    else:
+        folders = ["{}GPa".format(p) for p in (args.pressures if args.pressures else get_pressures())]
+    n = len(folders)
+    with ProcessPoolExecutor(max_workers=args.nproc) as executor:
+        results = list(executor.map(convert, folders, [args.prefix] * n, [args.threshold] * n,
+                                    [args.output_dir] * n, [args.overwrite] * n))
+
+    with open("hr_to_hwave.dat", "w") as fw:
+        fw.write("# folder nrpts hermite_error npruned max_band_change\n")
+        for result in results:
+            if result["skipped"]:
+                continue
+            line = "{} {} {:.3e} {} {:.3e}".format(result["folder"], result["nrpts"], result["hermite_error"],
+                                                 result["npruned"], result["band_change"])
+            fw.write(line + "\n")
+            print(line)
@@ -0,0 +1,237 @@
+"""結晶の対称性を使ってk点格子を既約な点に減らし、元の格子に展開する
+
+このモジュールは、{seedname}.win の unit_cell_cart と atoms_frac から結晶構造を読み込み、
+点群の対称操作(spglibがあればspglib、なければ格子の計量を保つ整数行列の全探索)を求めて、
+H-waveの CellShape と同じ並び (ix, iy, iz の順、x が最も遅い) の一様k点格子を
+既約な点のリストと展開用の添字に分けます。固有値を計算するプログラムは
+既約な点だけを計算し、unfold で元の格子に戻すことで、計算量を対称操作の数だけ減らせます。
+unfold は値をそのままコピーするだけなので、バンドエネルギー(とその関数である占有数や
+状態密度の重み)のように対称操作で変わらない量にだけ使えます。固有ベクトルやχ0の軌道行列は
+対称操作で軌道・サイトが入れ替わり(反転で2つのAuサイトが入れ替わるなど)、スピノルも回転するので、
+展開には各操作の軌道の表現行列が必要であり、このモジュールでは扱いません。
+
+Parameters
+----------
+--win : str, optional
+    .win ファイルのパス。デフォルトは "aucl2.win"
+--mesh : int int int, optional
+    k点格子の大きさ。デフォルトは 128 128 8 (H-waveの CellShape と同じ)
+--symprec : float, optional
+    対称操作の判定の許容誤差(Å)。デフォルトは 1e-3
+--no_time_reversal : flag, optional
+    指定すると時間反転対称性 (k -> -k) を使わない
+--hr : str, optional
+    _hr.dat のパス。指定すると既約な点だけで固有値を計算して展開し、全点の計算と比較する
+
+Returns
+-------
+なし
+
+Notes
+-----
+出力ファイル
+-----------
+kgrid_irreducible.npz : 既約なk点と展開用の添字
+    mesh : k点格子の大きさ
+    kpoints : 既約なk点の分数座標。shape=(nir, 3)
+    ir_index : 既約なk点の、格子全体での平坦化した添字。shape=(nir,)
+    mapping : 格子の各点に対応する既約なk点の番号。shape=(Lx*Ly*Lz,)
+    weight : 既約なk点の重み(等価な点の数)。shape=(nir,)
+
+Examples
+--------
+>>> rotations = get_k_rotations(*read_structure("aucl2.win"))
+>>> kgrid = irreducible_kgrid((128, 128, 8), rotations)
+>>> eig_ir = model.eigvalsh(kgrid["kpoints"])
+>>> eigenvalues = unfold(eig_ir, kgrid)   # shape=(128, 128, 8, num_wann)
+
+See Also
+--------
+wannier_hr.py : _hr.dat の読み込みと H(k) の計算
+../qe/band/get_kpath.py : seekpath による対称点の経路
+"""
+
+import argparse
+import itertools
+
+import numpy as np
+
+from wannier_hr import read_unit_cell
+
+try:
+    import spglib
+except ImportError:
+    spglib = None
+
+
+def read_structure(file_name):
+    """{seedname}.win から結晶構造を読み込む
+
+    Parameters
+    ----------
+    file_name : str
+        .win ファイルのパス
+
+    Returns
+    -------
+    lattice : ndarray
+        格子ベクトル(Å)。各行が a1, a2, a3。shape=(3, 3)
+    positions : ndarray
+        原子の分数座標。shape=(natom, 3)
+    numbers : ndarray
+        原子の種類の番号。shape=(natom,)
+    """
+    lattice = read_unit_cell(file_name)
+    with open(file_name, "r") as fr:
+        lines = [line.strip() for line in fr]
+    start = next(idx for idx, line in enumerate(lines) if line.lower().startswith("begin atoms_frac"))
+    species = []
+    positions = []
+    for line in lines[start + 1:]:
+        if line.lower().startswith("end atoms_frac"):
+            break
+        words = line.split()
+        species.append(words[0])
+        positions.append([float(x) for x in words[1:4]])
+    names = sorted(set(species))
+    numbers = np.array([names.index(s) + 1 for s in species])
+    return lattice, np.array(positions), numbers
+
+
+def _search_rotations(lattice, positions, numbers, symprec):
+    """格子の計量を保ち、原子配置を保つ整数行列を全探索する(spglibがない場合)"""
+    metric = lattice @ lattice.T
+    candidates = np.array(list(itertools.product((-1, 0, 1), repeat=9))).reshape(-1, 3, 3)
+    candidates = candidates[np.abs(np.abs(np.linalg.det(candidates)) - 1.0) < 0.5]
+    rotated_metric = np.einsum("nji,jk,nkl->nil", candidates, metric, candidates)
+    tol = symprec * np.sqrt(np.abs(metric).max())
+    candidates = candidates[np.all(np.abs(rotated_metric - metric) < tol, axis=(1, 2))]
+    rotations = []
+    for W in candidates:
+        moved = positions @ W.T
+        ref = moved[0]
+        for j in np.nonzero(numbers == numbers[0])[0]:
+            t = positions[j] - ref
+            diff = (moved + t)[:, None, :] - positions[None, :, :]
+            diff -= np.round(diff)
+            dist = np.linalg.norm(diff @ lattice, axis=2)
+            match = (dist < symprec) & (numbers[:, None] == numbers[None, :])
+            if np.all(match.any(axis=1)):
+                rotations.append(W)
+                break
+    return np.array(rotations)
+
+
+def get_k_rotations(lattice, positions, numbers, symprec=1e-3, time_reversal=True):
+    """k空間(分数座標)での点群の回転を求める
+
+    実空間の回転 W (r' = W r) に対して k の回転は (W^-1)^T。群全体としては W^T の集合と同じ。
+
+    Parameters
+    ----------
+    lattice : ndarray
+        格子ベクトル(Å)。shape=(3, 3)
+    positions : ndarray
+        原子の分数座標。shape=(natom, 3)
+    numbers : ndarray
+        原子の種類の番号。shape=(natom,)
+    symprec : float
+        許容誤差(Å)
+    time_reversal : bool
+        Trueの場合、k -> -k を加える
+
+    Returns
+    -------
+    ndarray
+        重複のない回転行列(整数)。shape=(nsym, 3, 3)
+    """
+    if spglib is not None:
+        symmetry = spglib.get_symmetry((lattice, positions, numbers), symprec=symprec)
+        rotations = symmetry["rotations"]
+    else:
+        rotations = _search_rotations(lattice, positions, numbers, symprec)
+    k_rotations = np.transpose(rotations, (0, 2, 1))
+    if time_reversal:
+        k_rotations = np.concatenate((k_rotations, -k_rotations))
+    return np.unique(k_rotations.astype(int), axis=0)
+
+
+def irreducible_kgrid(mesh, k_rotations):
+    """一様k点格子を既約な点に分ける
+
+    格子と整合しない回転(格子点を格子点に移さないもの)は使わない。
+
+    Parameters
+    ----------
+    mesh : tuple of int
+        k点格子の大きさ (Lx, Ly, Lz)
+    k_rotations : ndarray
+        k空間の回転行列。shape=(nsym, 3, 3)
+
+    Returns
+    -------
+    dict
+        mesh, kpoints, ir_index, mapping, weight, rotations (使用した回転)
+    """
+    mesh = np.array(mesh)
+    # k' = R k を格子の整数座標で書くと i' = diag(mesh) R diag(1/mesh) i
+    scaled = k_rotations * mesh[None, :, None] / mesh[None, None, :]
+    compatible = np.all(np.abs(scaled - np.round(scaled)) < 1e-8, axis=(1, 2))
+    scaled = np.round(scaled[compatible]).astype(int)
+    grid = np.stack(np.meshgrid(*[np.arange(n) for n in mesh], indexing="ij"), axis=-1).reshape(-1, 3)
+    images = np.einsum("sab,kb->ska", scaled, grid) % mesh
+    flat = (images[..., 0] * mesh[1] + images[..., 1]) * mesh[2] + images[..., 2]
+    # 等価な点のうち添字が最小のものを代表とする
+    representative = flat.min(axis=0)
+    ir_index, mapping, weight = np.unique(representative, return_inverse=True, return_counts=True)
+    return {"mesh": mesh, "kpoints": grid[ir_index] / mesh, "ir_index": ir_index,
+            "mapping": mapping.ravel(), "weight": weight, "rotations": k_rotations[compatible]}
+
+
+def unfold(values, kgrid):
+    """既約なk点での値を元の格子に展開する
+
+    等価なk点に同じ値をコピーするので、固有値のように対称操作で変わらない量にだけ使える。
+    固有ベクトルやχ0の軌道行列には使えない。
+
+    Parameters
+    ----------
+    values : ndarray
+        既約なk点での対称操作で不変な値(固有値など)。shape=(nir, ...)
+    kgrid : dict
+        irreducible_kgrid の戻り値
+
+    Returns
+    -------
+    ndarray
+        shape=(Lx, Ly, Lz, ...)
+    """
+    return values[kgrid["mapping"]].reshape(tuple(kgrid["mesh"]) + values.shape[1:])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--win", type=str, default="aucl2.win", help=".win file of wannier90")
+    parser.add_argument("--mesh", type=int, nargs=3, default=[128, 128, 8], help="k-point mesh")
+    parser.add_argument("--symprec", type=float, default=1e-3, help="symmetry tolerance in angstrom")
+    parser.add_argument("--no_time_reversal", action="store_true", help="do not use k -> -k")
+    parser.add_argument("--hr", type=str, default=None, help="_hr.dat to check the unfolded eigenvalues")
+    args = parser.parse_args()
+
+    k_rotations = get_k_rotations(*read_structure(args.win), symprec=args.symprec,
+                                  time_reversal=not args.no_time_reversal)
+    kgrid = irreducible_kgrid(args.mesh, k_rotations)
+    nk = np.prod(args.mesh)
+    print("Symmetry search: {}".format("spglib" if spglib is not None else "built-in"))
+    print("Operations in k space: {} (compatible with mesh: {})".format(len(k_rotations), len(kgrid["rotations"])))
+    print("k points: {} -> {} (reduction {:.2f})".format(nk, len(kgrid["ir_index"]), nk / len(kgrid["ir_index"])))
+    np.savez("kgrid_irreducible.npz", **{key: kgrid[key] for key in
+                                        ("mesh", "kpoints", "ir_index", "mapping", "weight")})
+
+    if args.hr is not None:
+        from wannier_hr import WannierModel
+        model = WannierModel.from_file(args.hr)
+        eig = unfold(model.eigvalsh(kgrid["kpoints"]), kgrid)
+        grid = np.stack(np.meshgrid(*[np.arange(n) / n for n in args.mesh], indexing="ij"), axis=-1)
+        eig_full = model.eigvalsh(grid.reshape(-1, 3)).reshape(eig.shape)
+        print("max |E_unfold - E_full| = {:.3e}".format(np.abs(eig - eig_full).max()))
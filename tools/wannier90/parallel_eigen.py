@@ -0,0 +1,193 @@
+"""共有メモリを使った複数プロセスでのk点格子の対角化
+
+8x8 程度の小さな行列の対角化はBLASのスレッドではほとんど速くならないため、
+このスクリプトはk点格子を区間(スラブ)に分けて複数のプロセスで対角化します。
+H(R) と各軸の位相の表 exp(i 2π i_a R_a / L_a)、出力の固有値の配列は
+multiprocessing.shared_memory に置き、ワーカーは名前で接続して直接読み書きするため、
+配列のpickleは発生しません。threadpoolctl があれば各ワーカーのBLASを1スレッドに制限します。
+
+Parameters
+----------
+--hr : str, optional
+    _hr.dat のパス。デフォルトは "aucl2_hr.dat"
+--mesh : int int int, optional
+    k点格子の大きさ。デフォルトは 128 128 8
+--nproc : int, optional
+    ワーカーの数。デフォルトはCPUコア数
+--chunk : int, optional
+    ワーカーが一度に対角化するk点の数。デフォルトは 2048
+--output : str, optional
+    固有値を保存する .npy ファイル。デフォルトは "eigenvalues.npy"
+--benchmark : int ..., optional
+    指定したワーカー数ごとに実行時間を測り scaling.dat に書き出す (例: 1 2 4 8 16 32 64)
+
+Returns
+-------
+なし
+
+Notes
+-----
+出力ファイル
+-----------
+{output} : 固有値。shape=(Lx*Ly*Lz, num_wann)、k点の並びはH-waveと同じ (x が最も遅い)
+scaling.dat : --benchmark の結果
+    各行に nproc time speedup efficiency の形式で出力
+
+See Also
+--------
+wannier_hr.py : _hr.dat の読み込みと H(k) の計算
+stream_eigen.py : 1プロセスでチャンクごとに対角化し、メモリマップに書き出す
+"""
+
+import argparse
+import os
+import time
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from wannier_hr import WannierModel
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+# ワーカーが接続した共有配列
+_shared = {}
+
+
+def create_shared(shape, dtype):
+    """共有メモリ上に配列を作る
+
+    Returns
+    -------
+    shm : SharedMemory
+        共有メモリ(使い終わったら close と unlink を呼ぶ)
+    array : ndarray
+        共有メモリ上の配列
+    """
+    dtype = np.dtype(dtype)
+    shm = SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _init_worker(specs):
+    """ワーカーの初期化。共有配列に名前で接続し、BLASのスレッド数を1にする"""
+    for key, (name, shape, dtype) in specs.items():
+        shm = SharedMemory(name=name)
+        _shared[key] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+    if threadpool_limits is not None:
+        _shared["limits"] = threadpool_limits(limits=1)
+
+
+def _diagonalize_slab(task):
+    """k点の区間 [start, stop) を対角化して共有配列に書き込む"""
+    start, stop, chunk = task
+    hr_flat = _shared["hr_flat"][1]
+    tables = [_shared["table{}".format(a)][1] for a in range(3)]
+    output = _shared["output"][1]
+    mesh = tuple(len(table) for table in tables)
+    nw = output.shape[1]
+    for begin in range(start, stop, chunk):
+        index = np.arange(begin, min(begin + chunk, stop))
+        ix, iy, iz = np.unravel_index(index, mesh)
+        phase = tables[0][ix] * tables[1][iy] * tables[2][iz]
+        output[index] = np.linalg.eigvalsh((phase @ hr_flat).reshape(-1, nw, nw))
+    return stop - start
+
+
+def parallel_eigenvalues(model, mesh, nproc=None, chunk=2048):
+    """k点格子の固有値を複数プロセスで計算する
+
+    Parameters
+    ----------
+    model : WannierModel
+        Wannier模型
+    mesh : tuple of int
+        k点格子の大きさ (Lx, Ly, Lz)
+    nproc : int, optional
+        ワーカーの数。省略時はCPUコア数
+    chunk : int
+        ワーカーが一度に対角化するk点の数
+
+    Returns
+    -------
+    ndarray
+        固有値。shape=(Lx*Ly*Lz, num_wann)
+    """
+    nproc = nproc or os.cpu_count()
+    mesh = tuple(int(n) for n in mesh)
+    nk = int(np.prod(mesh))
+    arrays = {"hr_flat": model.hr_flat}
+    for a in range(3):
+        # 位相は各軸の位相の積 exp(i 2π i_a R_a / L_a) で書ける
+        arrays["table{}".format(a)] = np.exp(2j * np.pi * np.outer(np.arange(mesh[a]) / mesh[a], model.R[:, a]))
+    shms = {}
+    specs = {}
+    try:
+        for key, array in arrays.items():
+            shm, shared = create_shared(array.shape, array.dtype)
+            shared[...] = array
+            shms[key] = (shm, shared)
+            specs[key] = (shm.name, array.shape, array.dtype)
+        # 出力は親プロセスで確保せず、共有メモリ上に直接作る
+        shape = (nk, model.num_wann)
+        shm, shared = create_shared(shape, np.float64)
+        shms["output"] = (shm, shared)
+        specs["output"] = (shm.name, shape, np.dtype(np.float64))
+        # ワーカーあたり数個のスラブに分けて負荷の偏りを抑える
+        nslab = min(nk, 4 * nproc)
+        bounds = np.linspace(0, nk, nslab + 1).astype(int)
+        tasks = [(int(lo), int(hi), chunk) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+        with Pool(nproc, initializer=_init_worker, initargs=(specs,)) as pool:
+            done = sum(pool.imap_unordered(_diagonalize_slab, tasks))
+        if done != nk:
+            raise RuntimeError("Only {} of {} k points were diagonalized".format(done, nk))
+        return shms["output"][1].copy()
+    finally:
+        for shm, _ in shms.values():
+            shm.close()
+            shm.unlink()
+
+
+def benchmark(model, mesh, nprocs, chunk=2048):
+    """ワーカー数ごとの実行時間を測る
+
+    Returns
+    -------
+    ndarray
+        各行が nproc time speedup efficiency。shape=(len(nprocs), 4)
+    """
+    rows = []
+    for nproc in nprocs:
+        start = time.perf_counter()
+        parallel_eigenvalues(model, mesh, nproc, chunk)
+        elapsed = time.perf_counter() - start
+        rows.append([nproc, elapsed])
+        print("nproc = {:3d}: {:.3f} s".format(nproc, elapsed))
+    rows = np.array(rows)
+    speedup = rows[0, 1] / rows[:, 1] * rows[0, 0]
+    return np.column_stack((rows, speedup, speedup / rows[:, 0]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hr", type=str, default="aucl2_hr.dat", help="_hr.dat of wannier90")
+    parser.add_argument("--mesh", type=int, nargs=3, default=[128, 128, 8], help="k-point mesh")
+    parser.add_argument("--nproc", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--chunk", type=int, default=2048, help="number of k points per eigh call")
+    parser.add_argument("--output", type=str, default="eigenvalues.npy", help="output .npy file")
+    parser.add_argument("--benchmark", type=int, nargs="+", default=None, help="worker counts to benchmark")
+    args = parser.parse_args()
+
+    model = WannierModel.from_file(args.hr)
+    if args.benchmark is not None:
+        nprocs = [n for n in args.benchmark if n <= os.cpu_count()]
+        if len(nprocs) < len(args.benchmark):
+            print("Skipping worker counts larger than {} cores".format(os.cpu_count()))
+        result = benchmark(model, args.mesh, nprocs, args.chunk)
+        np.savetxt("scaling.dat", result, header="nproc time speedup efficiency")
+    else:
+        np.save(args.output, parallel_eigenvalues(model, args.mesh, args.nproc, args.chunk))
@@ -0,0 +1,188 @@
+"""Wannier模型を使ってフェルミ面の点をNewton法で磨き、フェルミ速度を求める
+
+補間した格子から作ったフェルミ面の精度は補間の精度で決まります。
+このスクリプトは、粗い格子上の交点(または adaptive_fs.py の出力 fermi_points_adaptive.dat)を
+初期値とし、{seedname}_hr.dat の H(k) から E_n(k) と Hellmann-Feynman の速度
+∂E_n/∂k = <n|∂H/∂k|n> をバッチで計算して、勾配方向のNewton法
+k <- k - (E_n(k) - E_F) ∇E_n / |∇E_n|^2 で E_n(k) = E_F となるまで点を動かします。
+
+Parameters
+----------
+--hr : str, optional
+    _hr.dat のパス。デフォルトは "aucl2_hr.dat"
+--win : str, optional
+    .win のパス。指定するとフェルミ速度をデカルト座標(eV・Å)で出力する
+--points : str, optional
+    初期値のファイル(kx ky band の列)。省略時は --grid の粗い格子上の交点を使う
+--grid : int int, optional
+    初期値を求める粗い格子の大きさ。デフォルトは 64 64
+--kz : float, optional
+    面の kz (逆格子ベクトル単位)。デフォルトは 0.0
+--ef : float, optional
+    フェルミエネルギー(eV)。省略時は --filling と --mesh から求める
+--filling : float, optional
+    全バンドに対する電子の占有率。デフォルトは 0.75
+--mesh : int int int, optional
+    E_F を求めるための3次元格子。デフォルトは 32 32 8
+--tol : float, optional
+    |E_n(k) - E_F| の収束判定(eV)。デフォルトは 1e-12
+--max_iter : int, optional
+    Newton法の最大反復回数。デフォルトは 20
+
+Returns
+-------
+なし
+
+Notes
+-----
+出力ファイル
+-----------
+fermi_contour_refined.dat : フェルミ面上の点
+    各行に kx ky band v1 v2 v3 |v| residual の形式で出力
+    kx, ky は [-π, π) の範囲 (calc_fs_2d.py と同じ)
+    v は ∂E/∂κ_a (κ_a = 2π k_a, 単位 eV)、--win 指定時は ħv (eV・Å)
+
+See Also
+--------
+wannier_hr.py : _hr.dat の読み込みと H(k) の計算
+../hwave/adaptive_fs.py : 補間による適応メッシュのフェルミ面
+"""
+
+import argparse
+
+import numpy as np
+
+from wannier_hr import WannierModel, read_unit_cell
+
+
+def fermi_energy_from_mesh(model, mesh, filling):
+    """一様格子の固有値からフェルミエネルギーを求める(H-waveと同じ定義)"""
+    axes = [np.arange(n) / n for n in mesh]
+    k = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+    eig = model.eigvalsh(k).ravel()
+    idx = int(len(eig) * filling)
+    return np.partition(eig, idx)[idx]
+
+
+def grid_crossings(model, grid, kz, ene_f):
+    """粗い格子の辺上でフェルミ面との交点を線形補間で求める
+
+    Returns
+    -------
+    k : ndarray
+        交点の分数座標。shape=(npoint, 3)
+    bands : ndarray
+        交点のバンドの添字。shape=(npoint,)
+    """
+    Nx, Ny = grid
+    ix, iy = np.meshgrid(np.arange(Nx), np.arange(Ny), indexing="ij")
+    k = np.column_stack((ix.ravel() / Nx, iy.ravel() / Ny, np.full(Nx * Ny, kz)))
+    energy = model.eigvalsh(k).reshape(Nx, Ny, -1) - ene_f
+    points = []
+    bands = []
+    for axis, step in ((0, (1.0 / Nx, 0.0)), (1, (0.0, 1.0 / Ny))):
+        e0 = energy
+        e1 = np.roll(energy, -1, axis=axis)
+        jx, jy, iband = np.nonzero(e0 * e1 < 0.0)
+        t = e0[jx, jy, iband] / (e0[jx, jy, iband] - e1[jx, jy, iband])
+        points.append(np.column_stack((jx / Nx + t * step[0], jy / Ny + t * step[1],
+                                       np.full(len(t), kz))))
+        bands.append(iband)
+    return np.concatenate(points), np.concatenate(bands)
+
+
+def newton_refine(model, k, bands, ene_f, tol=1e-12, max_iter=20, plane=(0, 1)):
+    """勾配方向のNewton法で E_n(k) = E_F となる点に動かす
+
+    各点はバンドの添字(エネルギーの昇順)で追跡し、まだ収束していない点だけを
+    まとめて再計算する。
+
+    Parameters
+    ----------
+    model : WannierModel
+        Wannier模型
+    k : ndarray
+        初期値の分数座標。shape=(npoint, 3)
+    bands : ndarray
+        各点のバンドの添字。shape=(npoint,)
+    ene_f : float
+        フェルミエネルギー
+    tol : float
+        収束判定
+    max_iter : int
+        最大反復回数
+    plane : tuple of int
+        点を動かす方向(分数座標の軸)
+
+    Returns
+    -------
+    k : ndarray
+        収束した点の分数座標。shape=(npoint, 3)
+    velocity : ndarray
+        ∂E_n/∂κ_a。shape=(npoint, 3)
+    residual : ndarray
+        E_n(k) - E_F。shape=(npoint,)
+    """
+    k = np.array(k, dtype=float)
+    npoint = len(k)
+    velocity = np.zeros((npoint, 3))
+    residual = np.full(npoint, np.inf)
+    active = np.arange(npoint)
+    plane = list(plane)
+    for _ in range(max_iter + 1):
+        w, dw = model.velocity(k[active])
+        sel = np.arange(len(active))
+        residual[active] = w[sel, bands[active]] - ene_f
+        velocity[active] = dw[sel, bands[active]]
+        active = active[np.abs(residual[active]) > tol]
+        if active.size == 0:
+            break
+        # ∂E/∂k_a = 2π ∂E/∂κ_a
+        grad = 2 * np.pi * velocity[active][:, plane]
+        norm2 = np.sum(grad ** 2, axis=1)
+        step = residual[active] / np.where(norm2 > 0.0, norm2, np.inf)
+        k[np.ix_(active, plane)] -= step[:, None] * grad
+    return k, velocity, residual
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hr", type=str, default="aucl2_hr.dat", help="_hr.dat of wannier90")
+    parser.add_argument("--win", type=str, default=None, help=".win file for Cartesian velocities")
+    parser.add_argument("--points", type=str, default=None, help="initial points (kx ky band)")
+    parser.add_argument("--grid", type=int, nargs=2, default=[64, 64], help="coarse grid for initial points")
+    parser.add_argument("--kz", type=float, default=0.0, help="kz of the plane in reciprocal lattice units")
+    parser.add_argument("--ef", type=float, default=None, help="Fermi energy in eV")
+    parser.add_argument("--filling", type=float, default=0.75, help="filling used when --ef is not given")
+    parser.add_argument("--mesh", type=int, nargs=3, default=[32, 32, 8], help="mesh used to determine E_F")
+    parser.add_argument("--tol", type=float, default=1e-12, help="tolerance of |E-E_F| in eV")
+    parser.add_argument("--max_iter", type=int, default=20, help="maximum number of Newton steps")
+    args = parser.parse_args()
+
+    model = WannierModel.from_file(args.hr)
+    ene_f = args.ef if args.ef is not None else fermi_energy_from_mesh(model, args.mesh, args.filling)
+    print("E_F = {}".format(ene_f))
+
+    if args.points is not None:
+        data = np.loadtxt(args.points, ndmin=2)
+        k = np.column_stack((data[:, :2] / (2 * np.pi), np.full(len(data), args.kz)))
+        bands = data[:, 2].astype(int)
+    else:
+        k, bands = grid_crossings(model, args.grid, args.kz, ene_f)
+    print("Initial points: {}".format(len(k)))
+
+    k, velocity, residual = newton_refine(model, k, bands, ene_f, args.tol, args.max_iter)
+    converged = np.abs(residual) <= args.tol
+    print("Converged: {} / {} (max |E-E_F| = {:.3e})".format(
+        converged.sum(), len(k), np.abs(residual).max()))
+
+    header = "kx ky band v1 v2 v3 |v| residual"
+    if args.win is not None:
+        # κ_a = k_cart・a_a より ∂E/∂k_cart = Σ_a a_a ∂E/∂κ_a
+        velocity = velocity @ read_unit_cell(args.win)
+        header = "kx ky band hv_x hv_y hv_z |hv| residual"
+    kx = ((k[:, 0] + 0.5) % 1.0 - 0.5) * 2 * np.pi
+    ky = ((k[:, 1] + 0.5) % 1.0 - 0.5) * 2 * np.pi
+    np.savetxt("fermi_contour_refined.dat",
+               np.column_stack((kx, ky, bands, velocity, np.linalg.norm(velocity, axis=1), residual)),
+               header=header)
@@ -0,0 +1,210 @@
+"""大きなk点格子の固有値をチャンクごとに計算し、メモリマップに書き出す
+
+512x512x64 のような格子では、全k点の H(k) を一度に作るとメモリに収まりません。
+このスクリプトは、k点格子を一定の大きさのチャンクに分けて順に生成し、
+各チャンクの H(k) を {seedname}_hr.dat から作って対角化します。固有値は
+メモリマップした .npy ファイルに直接書き込み、同時にエネルギーのヒストグラム
+(状態密度とフェルミエネルギーの決定に使う)を更新します。
+必要なメモリはチャンクの大きさで決まり、格子の大きさによりません。
+
+Parameters
+----------
+--hr : str, optional
+    _hr.dat のパス。デフォルトは "aucl2_hr.dat"
+--mesh : int int int, optional
+    k点格子の大きさ。デフォルトは 128 128 8
+--chunk : int, optional
+    一度に対角化するk点の数。デフォルトは 4096
+--filling : float, optional
+    フィリング(H-waveと同じ定義)。デフォルトは 0.75
+--nbins : int, optional
+    ヒストグラムのビンの数。デフォルトは 4000
+--output : str, optional
+    固有値を書き出す .npy ファイル。デフォルトは "eigenvalues.npy"
+
+Returns
+-------
+なし
+
+Notes
+-----
+出力ファイル
+-----------
+{output} : 固有値。shape=(Lx*Ly*Lz, num_wann)、k点の並びはH-waveと同じ (x が最も遅い)
+    np.load(output, mmap_mode="r") で読み込める
+dos_stream.dat : ヒストグラムから求めた状態密度
+    各行に E-E_F DOS の形式で出力 (単位胞・1eVあたり、全バンドの和)
+
+See Also
+--------
+wannier_hr.py : _hr.dat の読み込みと H(k) の計算
+../hwave/tetra_dos.py : 四面体法による状態密度
+"""
+
+import argparse
+
+import numpy as np
+
+from wannier_hr import WannierModel
+
+
+def iter_kgrid(mesh, chunk):
+    """一様k点格子をチャンクごとに生成する
+
+    Parameters
+    ----------
+    mesh : tuple of int
+        k点格子の大きさ (Lx, Ly, Lz)
+    chunk : int
+        1チャンクあたりのk点の数
+
+    Yields
+    ------
+    start : int
+        チャンクの先頭の平坦化した添字
+    k : ndarray
+        分数座標。shape=(<=chunk, 3)
+    """
+    mesh = np.asarray(mesh)
+    nk = int(np.prod(mesh))
+    for start in range(0, nk, chunk):
+        index = np.arange(start, min(start + chunk, nk))
+        ijk = np.column_stack(np.unravel_index(index, tuple(mesh)))
+        yield start, ijk / mesh
+
+
+def iter_eigenvalues(model, mesh, chunk):
+    """チャンクごとに固有値を計算する
+
+    Yields
+    ------
+    start : int
+        チャンクの先頭の平坦化した添字
+    w : ndarray
+        固有値。shape=(<=chunk, num_wann)
+    """
+    for start, k in iter_kgrid(mesh, chunk):
+        yield start, model.eigvalsh(k)
+
+
+def energy_bounds(model):
+    """Gershgorinの定理による固有値の上限・下限"""
+    radius = np.abs(model.hr_flat).sum(axis=0).reshape(model.num_wann, model.num_wann).sum(axis=1)
+    return -radius.max(), radius.max()
+
+
+class RunningHistogram:
+    """固有値のヒストグラムを逐次更新する
+
+    Parameters
+    ----------
+    emin, emax : float
+        エネルギーの範囲
+    nbins : int
+        ビンの数
+    """
+
+    def __init__(self, emin, emax, nbins):
+        self.edges = np.linspace(emin, emax, nbins + 1)
+        self.counts = np.zeros(nbins, dtype=np.int64)
+        self.total = 0
+
+    def add(self, values):
+        counts, _ = np.histogram(values, bins=self.edges)
+        self.counts += counts
+        self.total += values.size
+
+    def fermi_bin(self, filling):
+        """int(N*filling) 番目の固有値を含むビンと、それより下のビンの状態数"""
+        n_fermi = int(self.total * filling)
+        cumulative = np.cumsum(self.counts)
+        ibin = int(np.searchsorted(cumulative, n_fermi, side="right"))
+        below = int(cumulative[ibin - 1]) if ibin > 0 else 0
+        return ibin, n_fermi - below
+
+    def dos(self, nk):
+        """状態密度 (単位胞・1eVあたり)。shape=(nbins,)"""
+        return self.counts / (nk * np.diff(self.edges))
+
+
+def fermi_energy_stream(eigenvalues, histogram, filling, chunk):
+    """ヒストグラムで E_F を含むビンを決め、そのビンの固有値だけを集めて E_F を求める
+
+    H-waveと同じく全固有値の int(N*filling) 番目の値になる。
+
+    Parameters
+    ----------
+    eigenvalues : ndarray
+        メモリマップした固有値。shape=(nk, num_wann)
+    histogram : RunningHistogram
+        全固有値のヒストグラム
+    filling : float
+        フィリング
+    chunk : int
+        一度に読み込むk点の数
+
+    Returns
+    -------
+    float
+        フェルミエネルギー
+    """
+    ibin, rank = histogram.fermi_bin(filling)
+    lo, hi = histogram.edges[ibin], histogram.edges[ibin + 1]
+    selected = []
+    for start in range(0, len(eigenvalues), chunk):
+        w = eigenvalues[start:start + chunk]
+        selected.append(w[(w >= lo) & ((w < hi) | (ibin == len(histogram.counts) - 1) & (w <= hi))])
+    selected = np.concatenate(selected)
+    return np.partition(selected, rank)[rank]
+
+
+def stream_diagonalize(model, mesh, output, chunk=4096, nbins=4000):
+    """k点格子の固有値をチャンクごとに計算してメモリマップに書き込む
+
+    Parameters
+    ----------
+    model : WannierModel
+        Wannier模型
+    mesh : tuple of int
+        k点格子の大きさ
+    output : str
+        .npy ファイルのパス
+    chunk : int
+        一度に対角化するk点の数
+    nbins : int
+        ヒストグラムのビンの数
+
+    Returns
+    -------
+    eigenvalues : numpy.memmap
+        固有値。shape=(nk, num_wann)
+    histogram : RunningHistogram
+        固有値のヒストグラム
+    """
+    nk = int(np.prod(mesh))
+    eigenvalues = np.lib.format.open_memmap(output, mode="w+", dtype=np.float64, shape=(nk, model.num_wann))
+    histogram = RunningHistogram(*energy_bounds(model), nbins)
+    for start, w in iter_eigenvalues(model, mesh, chunk):
+        eigenvalues[start:start + len(w)] = w
+        histogram.add(w)
+    eigenvalues.flush()
+    return eigenvalues, histogram
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hr", type=str, default="aucl2_hr.dat", help="_hr.dat of wannier90")
+    parser.add_argument("--mesh", type=int, nargs=3, default=[128, 128, 8], help="k-point mesh")
+    parser.add_argument("--chunk", type=int, default=4096, help="number of k points per chunk")
+    parser.add_argument("--filling", type=float, default=0.75, help="filling")
+    parser.add_argument("--nbins", type=int, default=4000, help="number of histogram bins")
+    parser.add_argument("--output", type=str, default="eigenvalues.npy", help="memory-mapped output")
+    args = parser.parse_args()
+
+    model = WannierModel.from_file(args.hr, batch=args.chunk)
+    eigenvalues, histogram = stream_diagonalize(model, args.mesh, args.output, args.chunk, args.nbins)
+    ene_f = fermi_energy_stream(eigenvalues, histogram, args.filling, args.chunk)
+    print("E_F = {}".format(ene_f))
+    centers = 0.5 * (histogram.edges[1:] + histogram.edges[:-1])
+    np.savetxt("dos_stream.dat", np.column_stack((centers - ene_f, histogram.dos(len(eigenvalues)))),
+               header="E-E_F DOS")
@@ -0,0 +1,219 @@
+"""Wannier90の _hr.dat からタイトバインディング模型を作る
+
+このモジュールは、Wannier90が出力する {seedname}_hr.dat (write_hr = .true.) を
+読み込み、H(k) = Σ_R H(R) exp(i 2π k・R) / ndegen(R) とその波数微分を
+多数のk点について行列積でまとめて計算するための関数をまとめたものです。
+tools/wannier90 内の各スクリプトから読み込んで使用します。
+
+Notes
+-----
+入力ファイル
+-----------
+{seedname}_hr.dat : Wannier90のホッピング積分
+    1行目: コメント
+    2行目: num_wann
+    3行目: nrpts
+    4行目以降: ndegen (1行に15個)
+    以降: R1 R2 R3 m n Re[H_mn(R)] Im[H_mn(R)]
+
+{seedname}.win : Wannier90の入力ファイル
+    unit_cell_cart ブロックから格子ベクトルを取得する
+
+See Also
+--------
+soi/wannier90/aucl2_hr.dat : SOIありの8軌道模型
+"""
+
+import numpy as np
+
+BOHR_TO_ANGSTROM = 0.529177210903
+
+
+def read_hr(file_name):
+    """{seedname}_hr.dat を読み込む
+
+    Parameters
+    ----------
+    file_name : str
+        _hr.dat のパス
+
+    Returns
+    -------
+    R : ndarray
+        格子ベクトル(整数)。shape=(nrpts, 3)
+    ndegen : ndarray
+        各Rの縮重度。shape=(nrpts,)
+    hr : ndarray
+        ホッピング積分 H_mn(R)。shape=(nrpts, num_wann, num_wann)
+    """
+    with open(file_name, "r") as fr:
+        fr.readline()
+        num_wann = int(fr.readline())
+        nrpts = int(fr.readline())
+        nline_degen = -(-nrpts // 15)
+        ndegen = np.array(" ".join(fr.readline() for _ in range(nline_degen)).split(), dtype=int)
+        # 残りは全て数値なので一度に読み込む
+        data = np.array(fr.read().split(), dtype=float)
+    if len(ndegen) != nrpts or data.size != nrpts * num_wann ** 2 * 7:
+        raise ValueError("Unexpected number of lines in {}".format(file_name))
+    # 各Rについて num_wann^2 行が続く
+    data = data.reshape(nrpts, num_wann ** 2, 7)
+    R = data[:, 0, :3].astype(int)
+    m = data[0, :, 3].astype(int) - 1
+    n = data[0, :, 4].astype(int) - 1
+    hr = np.zeros((nrpts, num_wann, num_wann), dtype=complex)
+    hr[:, m, n] = data[:, :, 5] + 1j * data[:, :, 6]
+    return R, ndegen, hr
+
+
+def read_unit_cell(file_name):
+    """{seedname}.win から格子ベクトルを読み込む
+
+    Parameters
+    ----------
+    file_name : str
+        .win ファイルのパス
+
+    Returns
+    -------
+    ndarray
+        格子ベクトル(Å)。各行が a1, a2, a3。shape=(3, 3)
+    """
+    with open(file_name, "r") as fr:
+        lines = fr.readlines()
+    for idx, line in enumerate(lines):
+        if line.strip().lower().startswith("begin unit_cell_cart"):
+            break
+    else:
+        raise ValueError("unit_cell_cart is not found in {}".format(file_name))
+    block = lines[idx + 1:idx + 5]
+    factor = 1.0
+    if block[0].strip().lower() in ("bohr", "ang"):
+        factor = BOHR_TO_ANGSTROM if block[0].strip().lower() == "bohr" else 1.0
+        block = block[1:]
+    else:
+        block = block[:3]
+    return np.array([line.split()[:3] for line in block], dtype=float) * factor
+
+
+class WannierModel:
+    """H(R) から任意のk点のハミルトニアン・固有値・速度を計算する
+
+    波数はWannier90と同じく逆格子ベクトルを単位とする分数座標で与える。
+
+    Parameters
+    ----------
+    R : ndarray
+        格子ベクトル(整数)。shape=(nrpts, 3)
+    ndegen : ndarray
+        各Rの縮重度。shape=(nrpts,)
+    hr : ndarray
+        ホッピング積分。shape=(nrpts, num_wann, num_wann)
+    batch : int
+        一度に計算するk点の数の上限
+    """
+
+    def __init__(self, R, ndegen, hr, batch=4096):
+        self.R = np.asarray(R)
+        self.num_wann = hr.shape[1]
+        # ndegen で割った H(R) を (nrpts, num_wann^2) の行列として保持する
+        self.hr_flat = (hr / np.asarray(ndegen)[:, None, None]).reshape(len(R), -1)
+        self.batch = batch
+
+    @classmethod
+    def from_file(cls, file_name, batch=4096):
+        return cls(*read_hr(file_name), batch=batch)
+
+    def phase(self, k):
+        """exp(i 2π k・R)。shape=(nk, nrpts)"""
+        return np.exp(2j * np.pi * (np.asarray(k) @ self.R.T))
+
+    def hk(self, k):
+        """H(k) を計算する
+
+        Parameters
+        ----------
+        k : ndarray
+            分数座標のk点。shape=(nk, 3)
+
+        Returns
+        -------
+        ndarray
+            shape=(nk, num_wann, num_wann)
+        """
+        return (self.phase(k) @ self.hr_flat).reshape(-1, self.num_wann, self.num_wann)
+
+    def dhk(self, k):
+        """∂H/∂κ_a (κ_a = 2π k_a) を計算する
+
+        Parameters
+        ----------
+        k : ndarray
+            分数座標のk点。shape=(nk, 3)
+
+        Returns
+        -------
+        ndarray
+            shape=(nk, 3, num_wann, num_wann)
+        """
+        phase = self.phase(k)
+        nw = self.num_wann
+        return np.stack([((1j * self.R[:, a]) * phase) @ self.hr_flat for a in range(3)],
+                        axis=1).reshape(-1, 3, nw, nw)
+
+    def eigh(self, k):
+        """固有値と固有ベクトルをバッチごとに計算する
+
+        Parameters
+        ----------
+        k : ndarray
+            分数座標のk点。shape=(nk, 3)
+
+        Returns
+        -------
+        w : ndarray
+            固有値(昇順)。shape=(nk, num_wann)
+        v : ndarray
+            固有ベクトル。v[:, :, n] がバンドnの固有ベクトル。shape=(nk, num_wann, num_wann)
+        """
+        k = np.atleast_2d(k)
+        w = np.empty((len(k), self.num_wann))
+        v = np.empty((len(k), self.num_wann, self.num_wann), dtype=complex)
+        for start in range(0, len(k), self.batch):
+            sl = slice(start, start + self.batch)
+            w[sl], v[sl] = np.linalg.eigh(self.hk(k[sl]))
+        return w, v
+
+    def eigvalsh(self, k):
+        """固有値のみをバッチごとに計算する。shape=(nk, num_wann)"""
+        k = np.atleast_2d(k)
+        w = np.empty((len(k), self.num_wann))
+        for start in range(0, len(k), self.batch):
+            sl = slice(start, start + self.batch)
+            w[sl] = np.linalg.eigvalsh(self.hk(k[sl]))
+        return w
+
+    def velocity(self, k):
+        """Hellmann-Feynmanの定理で ∂E_n/∂κ_a = <n|∂H/∂κ_a|n> を計算する
+
+        Parameters
+        ----------
+        k : ndarray
+            分数座標のk点。shape=(nk, 3)
+
+        Returns
+        -------
+        w : ndarray
+            固有値。shape=(nk, num_wann)
+        dw : ndarray
+            ∂E_n/∂κ_a。shape=(nk, num_wann, 3)
+        """
+        k = np.atleast_2d(k)
+        w = np.empty((len(k), self.num_wann))
+        dw = np.empty((len(k), self.num_wann, 3))
+        for start in range(0, len(k), self.batch):
+            sl = slice(start, start + self.batch)
+            w[sl], v = np.linalg.eigh(self.hk(k[sl]))
+            dh = self.dhk(k[sl])
+            dw[sl] = np.einsum("kmn,kamp,kpn->kna", v.conj(), dh, v).real
+        return w, dw